@@ -0,0 +1,308 @@
+"""
+Benchmark de bout en bout du système NLQ, sans accès réseau
+
+Le LLM est remplacé par FakeGenerativeModel (réponses enregistrées, latence
+configurable) et la base par un catalogue synthétique. Deux mesures sont faites:
+
+- un profil par étape (LLM, SQL, sérialisation...) en exécutant le service dans le processus;
+- une charge HTTP sur /query, /stats et /suggestions contre un serveur uvicorn
+  lancé dans un processus séparé, à concurrence configurable.
+
+Exemple:
+    python benchmarks/run_benchmark.py --products 200000 --order-items 1000000 \\
+        --concurrency 16 --requests 500 --llm-latency-ms 400
+"""
+import sys
+import os
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+import argparse
+import json
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_RESPONSES = os.path.join(ROOT_DIR, "benchmarks", "fake_responses.json")
+
+# Requêtes rejouées: traduites par les règles locales ou par les réponses enregistrées
+QUERIES = [
+    "Montre-moi tous les t-shirts pour homme en coton",
+    "Quels sont les produits en promotion?",
+    "Trouve des robes d'été de moins de 50 euros",
+    "Affiche les produits Nike disponibles",
+    "Trouve des chaussures pour femme en cuir",
+    "Quels sont les nouveaux produits?",
+    "Trouve des vêtements d'hiver pour enfant",
+    "Montre-moi les produits les moins chers",
+    "Quelles sont les meilleures ventes?",
+    "Trouve des accessoires pour homme",
+    "Quel est le chiffre d'affaires par catégorie?",
+    "Quels sont les produits en rupture de stock?",
+]
+
+PERCENTILES = (50, 95, 99)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Calculer les percentiles (en ms) d'une série de durées en secondes"""
+    if not values:
+        return {"count": 0}
+    values_ms = np.asarray(values) * 1000
+    summary = {"count": len(values), "mean_ms": float(values_ms.mean())}
+    for percentile, value in zip(PERCENTILES, np.percentile(values_ms, PERCENTILES)):
+        summary[f"p{percentile}_ms"] = float(value)
+    summary["max_ms"] = float(values_ms.max())
+    return summary
+
+
+def benchmark_environment(args: argparse.Namespace, cache_dir: str) -> Dict[str, str]:
+    """Variables d'environnement du service mesuré (base synthétique, LLM simulé)"""
+    return {
+        "DATABASE_PATH": os.path.abspath(args.db),
+        "CACHE_DATABASE_PATH": os.path.join(cache_dir, "cache.db"),
+        "LLM_BACKEND": "fake",
+        "FAKE_LLM_RESPONSES": os.path.abspath(args.responses),
+        "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "FAKE_LLM_JITTER_MS": str(args.llm_jitter_ms),
+        "TRANSLATION_CACHE_ENABLED": "True" if args.translation_cache else "False",
+        "RULE_BASED_ENABLED": "False" if args.no_rules else "True",
+        "DEBUG": "False",
+        "WORKERS": str(args.workers),
+    }
+
+
+def prepare_database(args: argparse.Namespace):
+    """Générer la base synthétique si elle n'existe pas encore"""
+    if os.path.exists(args.db) and not args.regenerate:
+        print(f"Base existante réutilisée: {args.db}")
+        return
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+
+    from data.generate_synthetic_data import generate_synthetic_data
+
+    print(f"Génération de la base synthétique ({args.products} produits, {args.order_items} articles)...")
+    start = time.perf_counter()
+    generate_synthetic_data(args.db, products=args.products, order_items=args.order_items, seed=args.seed).close()
+    print(f"Base générée en {time.perf_counter() - start:.1f} s")
+
+
+def collect_stages(stages: Dict[str, List[float]], timings: Dict[str, float]):
+    """Ajouter les durées par étape (ms) d'une réponse aux séries mesurées (s)"""
+    for name, milliseconds in timings.items():
+        stages.setdefault(name, []).append(milliseconds / 1000)
+
+
+def profile_stages(queries: List[str], iterations: int, summary_mode: str) -> Dict[str, Any]:
+    """
+    Mesurer le temps passé dans chaque étape du traitement d'une requête
+
+    Les requêtes sont exécutées séquentiellement dans le processus, de sorte que
+    les durées ne sont pas faussées par la concurrence. Les étapes sont celles
+    renvoyées par le service (include_timings), la sérialisation de la réponse
+    est mesurée en plus.
+    """
+    from main import query_response_content
+    from src.serialization import dumps
+    from src.nlq_service import NLQService
+
+    service = NLQService()
+    stages: Dict[str, List[float]] = {}
+    errors = 0
+    for _ in range(iterations):
+        for query in queries:
+            result = service.process_query(query, summary_mode, include_timings=True)
+            errors += not result.get("success")
+
+            start = time.perf_counter()
+            dumps(query_response_content(result))
+            collect_stages(stages, {**result["timings"], "serialization": (time.perf_counter() - start) * 1000})
+
+    service.db_manager.close()
+    return {"errors": errors, "stages": {name: summarize(values) for name, values in sorted(stages.items())}}
+
+
+def free_port() -> int:
+    """Réserver un port TCP libre sur l'interface locale"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(env: Dict[str, str], port: int, workers: int = 1, timeout: float = 30.0) -> subprocess.Popen:
+    """Démarrer l'API dans un processus uvicorn séparé et attendre qu'elle soit prête"""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT_DIR, env={**os.environ, **env}
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Le serveur s'est arrêté (code {server.returncode})")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health/ready", timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("Le serveur n'a pas démarré à temps")
+
+
+def send_request(base_url: str, endpoint: str, query: Optional[str],
+                 summary_mode: str) -> Tuple[float, Dict[str, float]]:
+    """Envoyer une requête HTTP, renvoyer sa durée et les étapes mesurées par le serveur"""
+    if endpoint == "query":
+        body = json.dumps({"query": query, "summary_mode": summary_mode, "include_timings": True}).encode("utf-8")
+        request = urllib.request.Request(f"{base_url}/query", data=body,
+                                         headers={"Content-Type": "application/json"})
+    else:
+        request = urllib.request.Request(f"{base_url}/{endpoint}")
+
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=60) as response:
+        payload = response.read()
+    elapsed = time.perf_counter() - start
+    if endpoint != "query":
+        return elapsed, {}
+    result = json.loads(payload)
+    if not result.get("success"):
+        raise ValueError("Requête en échec")
+    return elapsed, result.get("timings") or {}
+
+
+def run_load(base_url: str, endpoint: str, queries: List[str], requests_count: int,
+             concurrency: int, summary_mode: str) -> Dict[str, Any]:
+    """Exécuter une charge HTTP sur un endpoint à concurrence fixe"""
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(index: int):
+        nonlocal errors
+        query = queries[index % len(queries)] if endpoint == "query" else None
+        try:
+            elapsed, timings = send_request(base_url, endpoint, query, summary_mode)
+        except (OSError, ValueError):
+            with lock:
+                errors += 1
+            return
+        with lock:
+            latencies.append(elapsed)
+            collect_stages(stages, timings)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(requests_count)))
+    duration = time.perf_counter() - start
+
+    return {
+        "requests": requests_count,
+        "errors": errors,
+        "duration_s": duration,
+        "rps": len(latencies) / duration if duration else 0.0,
+        "latency": summarize(latencies),
+        "stages": {name: summarize(values) for name, values in sorted(stages.items())},
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    """Afficher le rapport sous forme de tableaux"""
+    columns = ["count"] + [f"p{p}_ms" for p in PERCENTILES] + ["max_ms"]
+
+    def row(label: str, summary: Dict[str, float], extra: str = "") -> str:
+        cells = [f"{summary.get(column, 0):>9.1f}" if column != "count" else f"{summary.get(column, 0):>6}"
+                 for column in columns]
+        return f"{label:<22}" + "".join(cells) + extra
+
+    header = f"{'':<22}{'count':>6}" + "".join(f"{column:>9}" for column in columns[1:])
+    if "stages" in report:
+        print("\nProfil par étape (séquentiel, dans le processus)")
+        print(header)
+        for stage, summary in report["stages"]["stages"].items():
+            print(row(stage, summary))
+    if "load" in report:
+        print(f"\nCharge HTTP (concurrence {report['config']['concurrency']})")
+        print(header + f"{'rps':>9}{'errors':>8}")
+        for endpoint, result in report["load"].items():
+            print(row(f"/{endpoint}", result["latency"], f"{result['rps']:>9.1f}{result['errors']:>8}"))
+        for endpoint, result in report["load"].items():
+            if result["stages"]:
+                print(f"\nÉtapes mesurées par le serveur sous charge (/{endpoint})")
+                print(header)
+                for stage, summary in result["stages"].items():
+                    print(row(stage, summary))
+
+
+def main():
+    """Point d'entrée en ligne de commande"""
+    parser = argparse.ArgumentParser(description="Benchmark de bout en bout du système NLQ")
+    parser.add_argument("--db", default="./database/benchmark.db", help="Base synthétique utilisée")
+    parser.add_argument("--products", type=int, default=100_000, help="Produits générés")
+    parser.add_argument("--order-items", type=int, default=500_000, help="Articles de commande générés")
+    parser.add_argument("--seed", type=int, default=42, help="Graine aléatoire")
+    parser.add_argument("--regenerate", action="store_true", help="Regénérer la base même si elle existe")
+    parser.add_argument("--responses", default=DEFAULT_RESPONSES, help="Réponses LLM enregistrées (JSON)")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Latence simulée du LLM")
+    parser.add_argument("--llm-jitter-ms", type=float, default=50.0, help="Gigue de la latence simulée")
+    parser.add_argument("--endpoints", default="query,stats,suggestions", help="Endpoints mesurés")
+    parser.add_argument("--workers", type=int, default=1, help="Processus workers uvicorn")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requêtes HTTP simultanées")
+    parser.add_argument("--requests", type=int, default=200, help="Requêtes HTTP par endpoint")
+    parser.add_argument("--iterations", type=int, default=3, help="Passes du profil par étape")
+    parser.add_argument("--summary-mode", default="llm", choices=["llm", "template", "deferred"])
+    parser.add_argument("--translation-cache", action="store_true", help="Activer le cache de traduction")
+    parser.add_argument("--no-rules", action="store_true", help="Désactiver la traduction par règles")
+    parser.add_argument("--skip-stages", action="store_true", help="Ne pas mesurer le profil par étape")
+    parser.add_argument("--skip-load", action="store_true", help="Ne pas lancer la charge HTTP")
+    parser.add_argument("--output", help="Fichier JSON où écrire le rapport")
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix="nlq-benchmark-")
+    env = benchmark_environment(args, cache_dir)
+    # La configuration est lue à l'import: l'environnement doit être prêt avant
+    # le premier import des modules du projet
+    os.environ.update(env)
+    prepare_database(args)
+
+    report: Dict[str, Any] = {"config": {key: value for key, value in vars(args).items()}}
+    try:
+        if not args.skip_stages:
+            report["stages"] = profile_stages(QUERIES, args.iterations, args.summary_mode)
+
+        if not args.skip_load:
+            port = free_port()
+            server = start_server(env, port, args.workers)
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                report["load"] = {
+                    endpoint: run_load(base_url, endpoint, QUERIES, args.requests,
+                                       args.concurrency, args.summary_mode)
+                    for endpoint in args.endpoints.split(",")
+                }
+            finally:
+                server.terminate()
+                server.wait(timeout=10)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2, ensure_ascii=False)
+        print(f"\nRapport écrit dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
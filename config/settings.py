@@ -13,22 +13,123 @@ class Config:
     # API Configuration
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     
+    # Mise en cache des instructions de traduction côté Gemini (contexte d'au moins
+    # quelques milliers de tokens exigé par l'API, sinon les instructions restent dans le prompt)
+    GEMINI_CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE_ENABLED", "False").lower() == "true"
+    GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", 3600))
+    GEMINI_CACHED_MODEL = os.getenv("GEMINI_CACHED_MODEL", "models/gemini-2.0-flash-001")
+    
+    # LLM backend: "gemini" (API réelle) ou "fake" (réponses simulées, sans réseau)
+    LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+    FAKE_LLM_RESPONSES = os.getenv("FAKE_LLM_RESPONSES")
+    FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", 0))
+    FAKE_LLM_JITTER_MS = float(os.getenv("FAKE_LLM_JITTER_MS", 0))
+    
+    # Ordonnancement des appels au LLM (limites par worker): débit du quota, appels
+    # simultanés, reprises des erreurs transitoires (429, 5xx) et disjoncteur
+    LLM_SCHEDULER_ENABLED = os.getenv("LLM_SCHEDULER_ENABLED", "True").lower() == "true"
+    LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", 1000))
+    LLM_BURST = int(os.getenv("LLM_BURST", 20))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+    LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 10.0))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+    LLM_BACKOFF_BASE_MS = float(os.getenv("LLM_BACKOFF_BASE_MS", 200))
+    LLM_BACKOFF_MAX_MS = float(os.getenv("LLM_BACKOFF_MAX_MS", 5000))
+    LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", 5))
+    LLM_CIRCUIT_RESET = float(os.getenv("LLM_CIRCUIT_RESET", 30.0))
+    # Échéances des appels au LLM (ms, 0 = aucune): au-delà, traduction de repli ou résumé générique
+    LLM_TRANSLATION_TIMEOUT_MS = float(os.getenv("LLM_TRANSLATION_TIMEOUT_MS", 10000))
+    LLM_SUMMARY_TIMEOUT_MS = float(os.getenv("LLM_SUMMARY_TIMEOUT_MS", 5000))
+    # Traduction doublée si la réponse tarde au-delà du percentile observé (service asynchrone)
+    LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "False").lower() == "true"
+    LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+    LLM_HEDGE_MIN_DELAY_MS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", 100))
+    # LLM indisponible: similarité minimale pour réutiliser le SQL d'une question proche
+    LLM_FALLBACK_SIMILARITY = float(os.getenv("LLM_FALLBACK_SIMILARITY", 0.6))
+    
     # Database Configuration
     DATABASE_PATH = os.getenv("DATABASE_PATH", "./database/ecommerce.db")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5.0))
+    # Inactivité (s) au-delà de laquelle une connexion est vérifiée avant d'être réutilisée
+    DB_POOL_HEALTH_CHECK_IDLE = float(os.getenv("DB_POOL_HEALTH_CHECK_IDLE", 30.0))
+    DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", 5.0))
+    DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", 65536))
+    DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", 268435456))
+    DB_BULK_CACHE_SIZE_KB = int(os.getenv("DB_BULK_CACHE_SIZE_KB", 524288))
+    BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", 10000))
     
     # Application Configuration
     DEBUG = os.getenv("DEBUG", "False").lower() == "true"
     HOST = os.getenv("HOST", "localhost")
     PORT = int(os.getenv("PORT", 8000))
     
+    # Concurrency Configuration
+    # Processus workers uvicorn (python main.py); chacun a son propre service et ses caches mémoire
+    WORKERS = int(os.getenv("WORKERS", 1))
+    DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", 8))
+    
+    # Démarrage: service construit et préchauffé par chaque worker avant la première requête,
+    # éventuellement avec une requête minimale au LLM (connexion établie à l'avance)
+    EAGER_STARTUP = os.getenv("EAGER_STARTUP", "True").lower() == "true"
+    LLM_WARMUP_ENABLED = os.getenv("LLM_WARMUP_ENABLED", "False").lower() == "true"
+    
     # NLQ Configuration
     MAX_QUERY_LENGTH = 500
     DEFAULT_LIMIT = 10
+    MAX_RESULT_LIMIT = int(os.getenv("MAX_RESULT_LIMIT", 50))
+    STREAM_MAX_ROWS = int(os.getenv("STREAM_MAX_ROWS", 100000))
+    
+    # Réponses compressées (gzip, brotli si installé) au-delà de cette taille, en octets
+    COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+    
+    # Budget d'exécution des requêtes générées
+    QUERY_TIMEOUT_MS = float(os.getenv("QUERY_TIMEOUT_MS", 5000))
+    QUERY_PROGRESS_STEPS = int(os.getenv("QUERY_PROGRESS_STEPS", 10000))
+    QUERY_PLAN_CHECK_ENABLED = os.getenv("QUERY_PLAN_CHECK_ENABLED", "True").lower() == "true"
+    LARGE_TABLE_ROWS = int(os.getenv("LARGE_TABLE_ROWS", 100000))
+    QUERY_MAX_FULL_SCANS = int(os.getenv("QUERY_MAX_FULL_SCANS", 1))
+    RULE_BASED_ENABLED = os.getenv("RULE_BASED_ENABLED", "True").lower() == "true"
+    # Délai minimal (s) entre deux rechargements des vocabulaires après modification du catalogue
+    VOCABULARY_REFRESH_INTERVAL = float(os.getenv("VOCABULARY_REFRESH_INTERVAL", 5.0))
+    STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", 500))
+    MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 100))
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 16))
+    
+    # Requêtes identiques simultanées traitées une seule fois
+    SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "True").lower() == "true"
+    
+    # Cache Configuration
+    CACHE_DATABASE_PATH = os.getenv("CACHE_DATABASE_PATH", "./database/cache.db")
+    TRANSLATION_CACHE_ENABLED = os.getenv("TRANSLATION_CACHE_ENABLED", "True").lower() == "true"
+    TRANSLATION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", 5000))
+    TRANSLATION_CACHE_TTL = int(os.getenv("TRANSLATION_CACHE_TTL", 86400))
+    RESULT_STORE_TTL = int(os.getenv("RESULT_STORE_TTL", 3600))
+    
+    # Réutilisation du SQL d'une question proche déjà traduite (index vectoriel local)
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "True").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.85))
+    SEMANTIC_INDEX_PATH = os.getenv("SEMANTIC_INDEX_PATH", "./database/semantic_index.f32")
+    SEMANTIC_INDEX_MAX_ENTRIES = int(os.getenv("SEMANTIC_INDEX_MAX_ENTRIES", 5000))
+    
+    # Pages suivantes d'un résultat (GET /query/{result_id}) relues sans nouvelle traduction
+    PAGINATION_ENABLED = os.getenv("PAGINATION_ENABLED", "True").lower() == "true"
+    
+    # Cache mémoire des résultats SQL (par processus), vidé à chaque modification des données
+    RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "True").lower() == "true"
+    RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 67108864))
+    # Second niveau partagé entre workers (base des caches), actif par défaut avec plusieurs workers
+    SHARED_RESULT_CACHE_ENABLED = os.getenv("SHARED_RESULT_CACHE_ENABLED", str(WORKERS > 1)).lower() == "true"
+    SHARED_RESULT_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_RESULT_CACHE_MAX_ENTRIES", 10000))
+    
+    # Statistiques (/stats): délai minimal entre deux recalculs en cas d'écritures continues
+    STATS_REFRESH_INTERVAL = float(os.getenv("STATS_REFRESH_INTERVAL", 1.0))
     
     @classmethod
     def validate(cls):
         """Valider la configuration"""
-        if not cls.GEMINI_API_KEY:
+        if not cls.GEMINI_API_KEY and cls.LLM_BACKEND != "fake":
             raise ValueError("GEMINI_API_KEY n'est pas définie dans les variables d'environnement")
         
         if not os.path.exists(os.path.dirname(cls.DATABASE_PATH)):
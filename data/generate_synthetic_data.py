@@ -0,0 +1,213 @@
+"""
+Script pour générer un catalogue synthétique à l'échelle de la production (benchmarks)
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+import numpy as np
+from typing import Dict, List, Tuple
+
+from src.database_manager import DatabaseManager
+from data.populate_db import populate_database
+
+COLORS = ["noir", "blanc", "bleu", "gris", "rouge", "vert", "beige", "marron", "rose", "jaune", "multicolore"]
+COLOR_WEIGHTS = [0.2, 0.16, 0.14, 0.1, 0.07, 0.06, 0.07, 0.06, 0.05, 0.03, 0.06]
+MATERIALS = ["coton", "polyester", "denim", "cuir", "laine", "lin", "synthétique", "soie", "viscose"]
+MATERIAL_WEIGHTS = [0.34, 0.2, 0.1, 0.08, 0.08, 0.06, 0.07, 0.03, 0.04]
+SIZES = ["XS", "S", "M", "L", "XL", "XXL", "unique"]
+CITIES = ["Paris", "Lyon", "Marseille", "Toulouse", "Nice", "Nantes", "Strasbourg", "Bordeaux", "Lille", "Rennes"]
+
+# Répartitions observées pour les valeurs énumérées (les valeurs absentes reçoivent un poids faible)
+GENDER_WEIGHTS = {"homme": 0.35, "femme": 0.4, "enfant": 0.1, "unisexe": 0.15}
+SEASON_WEIGHTS = {"toute_saison": 0.5, "printemps": 0.12, "été": 0.14, "automne": 0.11, "hiver": 0.13}
+STATUS_WEIGHTS = {"livré": 0.55, "expédié": 0.15, "confirmé": 0.12, "en_attente": 0.1, "annulé": 0.08}
+
+PRODUCT_COLUMNS = ["id", "name", "description", "price", "original_price", "category_id", "brand_id", "sku",
+                   "stock_quantity", "color", "size", "material", "gender", "season", "is_active"]
+ORDER_COLUMNS = ["id", "customer_email", "total_amount", "status", "order_date", "shipping_address"]
+ORDER_ITEM_COLUMNS = ["order_id", "product_id", "quantity", "unit_price", "total_price"]
+
+
+def _weights(values: List[str], preferred: Dict[str, float]) -> np.ndarray:
+    """Normaliser les poids d'une liste de valeurs"""
+    weights = np.array([preferred.get(value, 0.02) for value in values])
+    return weights / weights.sum()
+
+
+def _zipf_weights(count: int, rng: np.random.Generator, exponent: float = 1.1) -> np.ndarray:
+    """Popularité en loi de Zipf, répartie aléatoirement entre les éléments"""
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    return rng.permutation(weights / weights.sum())
+
+
+def _next_id(db: DatabaseManager, table: str) -> int:
+    """Premier identifiant libre d'une table"""
+    return db.execute_query(f"SELECT COALESCE(MAX(id), 0) + 1 AS next_id FROM {table}")[0]['next_id']
+
+
+def generate_products(db: DatabaseManager, count: int, rng: np.random.Generator,
+                      chunk_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Générer des produits sur les marques, catégories feuilles, genres et saisons existants
+
+    Returns:
+        (identifiants, prix) des produits générés
+    """
+    categories = db.execute_query(
+        """SELECT id, name FROM categories
+           WHERE id NOT IN (SELECT parent_id FROM categories WHERE parent_id IS NOT NULL)"""
+    )
+    brands = db.execute_query("SELECT id, name FROM brands")
+    enums = db.get_column_enums('products')
+    genders, seasons = enums['gender'], enums['season']
+
+    first_id = _next_id(db, "products")
+    product_ids = np.arange(first_id, first_id + count)
+    # Prix log-normaux (médiane ~37 €), 35 % des produits en promotion
+    prices = np.round(np.clip(rng.lognormal(3.6, 0.6, count), 3, 500), 2)
+    brand_weights = _zipf_weights(len(brands), rng)
+
+    def rows():
+        for start in range(0, count, chunk_size):
+            n = min(chunk_size, count - start)
+            ids = product_ids[start:start + n]
+            price = prices[start:start + n]
+            on_sale = rng.random(n) < 0.35
+            original_price = np.where(on_sale, np.round(price * rng.uniform(1.1, 1.6, n), 2), price)
+            category = rng.integers(0, len(categories), n)
+            brand = rng.choice(len(brands), n, p=brand_weights)
+            stock = np.where(rng.random(n) < 0.1, 0, rng.geometric(0.03, n))
+            color = rng.choice(COLORS, n, p=COLOR_WEIGHTS)
+            material = rng.choice(MATERIALS, n, p=MATERIAL_WEIGHTS)
+            size = rng.choice(SIZES, n)
+            gender = rng.choice(genders, n, p=_weights(genders, GENDER_WEIGHTS))
+            season = rng.choice(seasons, n, p=_weights(seasons, SEASON_WEIGHTS))
+            active = (rng.random(n) < 0.95).astype(int)
+
+            for (product_id, product_price, product_original_price, category_index, brand_index,
+                 product_stock, product_color, product_material, product_size, product_gender,
+                 product_season, is_active) in zip(
+                    ids.tolist(), price.tolist(), original_price.tolist(), category.tolist(),
+                    brand.tolist(), stock.tolist(), color.tolist(), material.tolist(), size.tolist(),
+                    gender.tolist(), season.tolist(), active.tolist()):
+                category_row, brand_row = categories[category_index], brands[brand_index]
+                yield (
+                    product_id,
+                    f"{category_row['name']} {brand_row['name']} {product_color} #{product_id}",
+                    f"{category_row['name']} en {product_material} {product_color} ({product_gender})",
+                    product_price, product_original_price, category_row['id'], brand_row['id'],
+                    f"SYN{product_id:08d}", product_stock, product_color, product_size,
+                    product_material, product_gender, product_season, is_active
+                )
+
+    db.bulk_insert("products", PRODUCT_COLUMNS, rows())
+    return product_ids, prices
+
+
+def generate_orders(db: DatabaseManager, order_count: int, item_count: int, product_ids: np.ndarray,
+                    prices: np.ndarray, rng: np.random.Generator, chunk_size: int):
+    """Générer des commandes et leurs articles (produits choisis selon une popularité de Zipf)"""
+    statuses = db.get_column_enums('orders')['status']
+    status_weights = _weights(statuses, STATUS_WEIGHTS)
+    popularity = _zipf_weights(len(product_ids), rng, exponent=0.9)
+    customer_count = max(1, order_count // 3)
+    customer_weights = _zipf_weights(customer_count, rng, exponent=0.7)
+
+    # Chaque commande contient au moins un article
+    items_per_order = 1 + rng.multinomial(item_count - order_count, np.full(order_count, 1.0 / order_count))
+    first_order_id = _next_id(db, "orders")
+    now = np.datetime64('now', 's')
+
+    with db.bulk_load(defer_indexes=True):
+        for start in range(0, order_count, chunk_size):
+            n = min(chunk_size, order_count - start)
+            order_ids = np.arange(first_order_id + start, first_order_id + start + n)
+            counts = items_per_order[start:start + n]
+
+            product_index = rng.choice(len(product_ids), int(counts.sum()), p=popularity)
+            quantity = rng.geometric(0.7, len(product_index))
+            unit_price = prices[product_index]
+            total_price = np.round(quantity * unit_price, 2)
+            order_totals = np.round(np.add.reduceat(total_price, np.concatenate(([0], np.cumsum(counts)[:-1]))), 2)
+
+            customers = rng.choice(customer_count, n, p=customer_weights)
+            status = rng.choice(statuses, n, p=status_weights)
+            order_date = np.char.replace(
+                (now - rng.integers(0, 365 * 86400, n).astype('timedelta64[s]')).astype(str), 'T', ' '
+            )
+            street_numbers = rng.integers(1, 200, n)
+            cities = rng.choice(CITIES, n)
+
+            db.bulk_insert("orders", ORDER_COLUMNS, (
+                (order_id, f"client{customer}@example.com", total, order_status, date,
+                 f"{number} Rue de la République, {city}")
+                for order_id, customer, total, order_status, date, number, city in zip(
+                    order_ids.tolist(), customers.tolist(), order_totals.tolist(), status.tolist(),
+                    order_date.tolist(), street_numbers.tolist(), cities.tolist())
+            ))
+            db.bulk_insert("order_items", ORDER_ITEM_COLUMNS, zip(
+                np.repeat(order_ids, counts).tolist(), product_ids[product_index].tolist(),
+                quantity.tolist(), unit_price.tolist(), total_price.tolist()
+            ))
+
+
+def generate_synthetic_data(db_path: str = None, products: int = 1_000_000, orders: int = None,
+                            order_items: int = 10_000_000, seed: int = 42,
+                            chunk_size: int = 100_000) -> DatabaseManager:
+    """
+    Générer un jeu de données synthétique
+
+    Args:
+        db_path: Chemin de la base (par défaut Config.DATABASE_PATH)
+        products: Nombre de produits à générer
+        orders: Nombre de commandes (par défaut order_items / 5)
+        order_items: Nombre d'articles de commande
+        seed: Graine du générateur aléatoire
+        chunk_size: Nombre de lignes générées par lot
+
+    Returns:
+        Le gestionnaire de la base générée
+    """
+    orders = orders or max(1, order_items // 5)
+    if order_items < orders:
+        raise ValueError("Le nombre d'articles doit être au moins égal au nombre de commandes")
+
+    db = DatabaseManager(db_path)
+    if not db.execute_query("SELECT 1 FROM brands LIMIT 1"):
+        # Le catalogue de base (marques, catégories) est nécessaire à la génération
+        populate_database(db.db_path)
+
+    rng = np.random.default_rng(seed)
+    with db.bulk_load(defer_indexes=True):
+        product_ids, prices = generate_products(db, products, rng, chunk_size)
+    if orders:
+        generate_orders(db, orders, order_items, product_ids, prices, rng, chunk_size)
+    return db
+
+
+def main():
+    """Point d'entrée en ligne de commande"""
+    parser = argparse.ArgumentParser(description="Générer un catalogue e-commerce synthétique")
+    parser.add_argument("--db", default=None, help="Chemin de la base SQLite (défaut: DATABASE_PATH)")
+    parser.add_argument("--products", type=int, default=1_000_000, help="Nombre de produits")
+    parser.add_argument("--orders", type=int, default=None, help="Nombre de commandes (défaut: articles / 5)")
+    parser.add_argument("--order-items", type=int, default=10_000_000, help="Nombre d'articles de commande")
+    parser.add_argument("--seed", type=int, default=42, help="Graine aléatoire")
+    args = parser.parse_args()
+
+    print("Génération des données synthétiques...")
+    start = time.perf_counter()
+    db = generate_synthetic_data(args.db, args.products, args.orders, args.order_items, args.seed)
+    elapsed = time.perf_counter() - start
+
+    for table in ["products", "orders", "order_items"]:
+        count = db.execute_query(f"SELECT COUNT(*) AS count FROM {table}")[0]['count']
+        print(f"{table}: {count}")
+    print(f"Terminé en {elapsed:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,10 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.database_manager import DatabaseManager
-import random
 
-def populate_database():
+def populate_database(db_path: str = None):
     """Peupler la base de données avec des données d'exemple"""
-    db = DatabaseManager()
+    db = DatabaseManager(db_path)
     
     print("Peuplement de la base de données...")
     
@@ -31,11 +30,7 @@ def populate_database():
         ("Chaussures de ville", "Chaussures élégantes", 4),
     ]
     
-    for name, description, parent_id in categories_data:
-        db.execute_update(
-            "INSERT OR IGNORE INTO categories (name, description, parent_id) VALUES (?, ?, ?)",
-            (name, description, parent_id)
-        )
+    db.bulk_insert("categories", ["name", "description", "parent_id"], categories_data, or_ignore=True)
     
     # Insertion des marques
     brands_data = [
@@ -49,11 +44,7 @@ def populate_database():
         ("Gap", "Mode américaine décontractée", "États-Unis"),
     ]
     
-    for name, description, country in brands_data:
-        db.execute_update(
-            "INSERT OR IGNORE INTO brands (name, description, country) VALUES (?, ?, ?)",
-            (name, description, country)
-        )
+    db.bulk_insert("brands", ["name", "description", "country"], brands_data, or_ignore=True)
     
     # Insertion des produits
     products_data = [
@@ -83,16 +74,13 @@ def populate_database():
         ("Ceinture en cuir", "Ceinture classique en cuir véritable", 29.99, 39.99, 5, 8, "ACC002", 20, "marron", "85cm", "cuir", "homme", "toute_saison"),
     ]
     
-    for (name, description, price, original_price, category_id, brand_id, sku, 
-         stock, color, size, material, gender, season) in products_data:
-        db.execute_update(
-            """INSERT OR IGNORE INTO products 
-               (name, description, price, original_price, category_id, brand_id, sku, 
-                stock_quantity, color, size, material, gender, season, is_active) 
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)""",
-            (name, description, price, original_price, category_id, brand_id, sku,
-             stock, color, size, material, gender, season)
-        )
+    db.bulk_insert(
+        "products",
+        ["name", "description", "price", "original_price", "category_id", "brand_id", "sku",
+         "stock_quantity", "color", "size", "material", "gender", "season", "is_active"],
+        (product + (1,) for product in products_data),
+        or_ignore=True
+    )
     
     # Insertion de quelques commandes d'exemple
     orders_data = [
@@ -101,11 +89,7 @@ def populate_database():
         ("client3@email.com", 159.97, "livré", "789 Boulevard Central, Marseille"),
     ]
     
-    for email, total, status, address in orders_data:
-        db.execute_update(
-            "INSERT INTO orders (customer_email, total_amount, status, shipping_address) VALUES (?, ?, ?, ?)",
-            (email, total, status, address)
-        )
+    db.bulk_insert("orders", ["customer_email", "total_amount", "status", "shipping_address"], orders_data)
     
     # Insertion des articles de commandes
     order_items_data = [
@@ -116,11 +100,9 @@ def populate_database():
         (3, 8, 1, 35.99, 35.99),   # 1 Robe d'été
     ]
     
-    for order_id, product_id, quantity, unit_price, total_price in order_items_data:
-        db.execute_update(
-            "INSERT INTO order_items (order_id, product_id, quantity, unit_price, total_price) VALUES (?, ?, ?, ?, ?)",
-            (order_id, product_id, quantity, unit_price, total_price)
-        )
+    db.bulk_insert(
+        "order_items", ["order_id", "product_id", "quantity", "unit_price", "total_price"], order_items_data
+    )
     
     print("Base de données peuplée avec succès!")
     
@@ -1,23 +1,61 @@
 """
 API FastAPI pour le système NLQ E-commerce
 """
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
+from pydantic import BaseModel, Field
+from typing import Dict, Any, List, Literal, Optional, Union
 import uvicorn
 
-from src.nlq_service import NLQService
+from src.metrics import REGISTRY
+from src.pagination import InvalidCursorError
+from src.serialization import dumps, json_response
+from src.nlq_service import AsyncNLQService
 from config.settings import Config
 
+# Service NLQ, construit au démarrage de chaque worker (ou à la demande si EAGER_STARTUP=False)
+nlq_service = None
+# État du démarrage: préchauffage terminé, durées des étapes, erreur éventuelle
+startup_state: Dict[str, Any] = {"ready": False, "warm_up": None, "error": None}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Construire et préchauffer le service avant d'accepter des requêtes, le libérer à l'arrêt
+    
+    Un échec au démarrage (clé API absente...) n'empêche pas l'API de démarrer:
+    /health/ready le signale et le service est reconstruit à la demande.
+    """
+    global nlq_service
+    if Config.EAGER_STARTUP:
+        try:
+            # Construction bloquante (configuration Gemini, connexions SQLite) hors de la boucle
+            nlq_service = await asyncio.to_thread(AsyncNLQService)
+            startup_state["warm_up"] = await nlq_service.warm_up_async(llm=Config.LLM_WARMUP_ENABLED)
+            startup_state["ready"] = True
+        except Exception as e:
+            startup_state["error"] = str(e)
+    else:
+        # Service construit par la première requête: le worker accepte le trafic dès maintenant
+        startup_state["ready"] = True
+    yield
+    if nlq_service is not None:
+        nlq_service.close()
+        nlq_service.db_manager.close()
+        nlq_service = None
+    startup_state["ready"] = False
+
 # Initialisation de l'application FastAPI
 app = FastAPI(
     title="NLQ E-commerce API",
     description="API pour les requêtes en langage naturel sur une base de données e-commerce",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configuration des fichiers statiques et templates
@@ -33,16 +71,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialisation du service NLQ (sera fait à la demande)
-nlq_service = None
-
 def get_nlq_service():
     """Obtenir une instance du service NLQ avec gestion d'erreur"""
     global nlq_service
     if nlq_service is None:
         try:
-            nlq_service = NLQService()
+            nlq_service = AsyncNLQService()
+            startup_state.update(ready=True, error=None)
         except Exception as e:
+            startup_state.update(ready=False, error=str(e))
             raise HTTPException(
                 status_code=503, 
                 detail=f"Service NLQ non disponible: {str(e)}. Vérifiez la configuration (clé API Gemini, etc.)"
@@ -52,38 +89,169 @@ def get_nlq_service():
 # Modèles Pydantic
 class QueryRequest(BaseModel):
     query: str
-    limit: Optional[int] = 10
+    limit: Optional[int] = Field(10, ge=1)
+    summary_mode: Literal["llm", "template", "deferred"] = "llm"
+    include_timings: bool = False
+    format: Literal["rows", "columnar"] = "rows"
+    # Conserver la requête pour lire les pages suivantes (result_id, next_cursor)
+    paginate: bool = False
 
 class QueryResponse(BaseModel):
     success: bool
-    data: List[Dict[str, Any]]
+    # rows: une liste de lignes; columnar: {colonne: valeurs}, noms de colonnes dans columns
+    data: Union[List[Dict[str, Any]], Dict[str, List[Any]]]
+    format: Literal["rows", "columnar"] = "rows"
+    columns: Optional[List[str]] = None
     sql_query: Optional[str] = None
     explanation: Optional[str] = None
     filters_applied: Optional[List[str]] = None
     confidence: Optional[float] = None
     natural_response: str
+    # Réponses d'échec: aucun résultat
+    count: int = 0
+    error: Optional[str] = None
+    result_id: Optional[str] = None
+    next_cursor: Optional[str] = None
+    timings: Optional[Dict[str, float]] = None
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=Config.MAX_BATCH_SIZE)
+    limit: Optional[int] = Field(10, ge=1)
+    summary_mode: Literal["llm", "template", "deferred"] = "llm"
+    include_timings: bool = False
+
+class BatchItemResponse(QueryResponse):
+    query: str
+
+class BatchQueryResponse(BaseModel):
+    success: bool
     count: int
+    unique_queries: int
+    failed: int
+    results: List[BatchItemResponse]
     error: Optional[str] = None
+    timings: Optional[Dict[str, float]] = None
+
+class PageResponse(BaseModel):
+    success: bool
+    result_id: Optional[str] = None
+    data: Union[List[Dict[str, Any]], Dict[str, List[Any]]]
+    format: Literal["rows", "columnar"] = "rows"
+    columns: Optional[List[str]] = None
+    count: int = 0
+    next_cursor: Optional[str] = None
+    error: Optional[str] = None
+    natural_response: Optional[str] = None
+
+class SummaryResponse(BaseModel):
+    result_id: str
+    count: int
+    natural_response: str
 
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     """Page d'accueil avec interface moderne séparée"""
     return templates.TemplateResponse("index.html", {"request": request})
 
+def query_response_content(result: Dict[str, Any], model: type = QueryResponse) -> Dict[str, Any]:
+    """
+    Contenu d'une réponse /query (ou d'une page, avec model=PageResponse), prêt à sérialiser
+    
+    Seule l'enveloppe (succès, métadonnées, compteurs) est validée par le
+    modèle; les lignes de data sont reprises telles quelles, sans validation
+    ni copie ligne par ligne.
+    """
+    content = model(**{**result, "data": []}).model_dump()
+    content["data"] = result.get("data", [])
+    return content
+
+def batch_response_content(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Contenu d'une réponse /query/batch (enveloppes validées, lignes reprises telles quelles)"""
+    items = result.get("results", [])
+    content = BatchQueryResponse(**{**result, "results": [{**item, "data": []} for item in items]}).model_dump()
+    for item, source in zip(content["results"], items):
+        item["data"] = source.get("data", [])
+    return content
+
 @app.post("/query", response_model=QueryResponse)
-async def process_query(request: QueryRequest):
+async def process_query(request: QueryRequest, http_request: Request):
     """
     Traiter une requête en langage naturel
     """
     try:
         service = get_nlq_service()
-        result = service.process_query(request.query)
-        return QueryResponse(**result)
+        result = await service.process_query_async(
+            request.query, request.summary_mode, request.include_timings, request.limit, request.format,
+            request.paginate
+        )
+        return json_response(query_response_content(result), http_request.headers.get("accept-encoding"))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur lors du traitement: {str(e)}")
 
+@app.post("/query/stream")
+async def stream_query(request: QueryRequest):
+    """
+    Traiter une requête en langage naturel en diffusant les résultats en NDJSON
+    
+    Une ligne JSON par événement: metadata, puis rows (par blocs), puis summary.
+    """
+    service = get_nlq_service()
+    # Sans limite explicite, le flux n'est borné que par STREAM_MAX_ROWS
+    limit = request.limit if "limit" in request.model_fields_set else None
+    
+    async def ndjson_events():
+        async for event in service.stream_query_async(request.query, limit):
+            yield dumps(event) + b"\n"
+    
+    return StreamingResponse(ndjson_events(), media_type="application/x-ndjson")
+
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def process_batch(request: BatchQueryRequest, http_request: Request):
+    """
+    Traiter un lot de requêtes en langage naturel en parallèle
+    
+    Les requêtes identiques sont dédupliquées; chaque élément porte son propre
+    résultat ou sa propre erreur.
+    """
+    try:
+        service = get_nlq_service()
+        result = await service.process_batch_async(
+            request.queries, request.summary_mode, request.include_timings, request.limit
+        )
+        return json_response(batch_response_content(result), http_request.headers.get("accept-encoding"))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur lors du traitement: {str(e)}")
+
+@app.get("/query/{result_id}", response_model=PageResponse)
+async def get_query_page(result_id: str, http_request: Request, cursor: Optional[str] = None,
+                         limit: Optional[int] = Query(None, ge=1)):
+    """
+    Obtenir la page suivante d'un résultat (curseur next_cursor), sans nouvel appel au LLM
+    """
+    service = get_nlq_service()
+    try:
+        page = await service.get_page_async(result_id, cursor, limit)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if page is None:
+        raise HTTPException(status_code=404, detail="Résultat inconnu, expiré ou sans page suivante")
+    return json_response(query_response_content(page, PageResponse), http_request.headers.get("accept-encoding"))
+
+@app.get("/query/{result_id}/summary", response_model=SummaryResponse)
+async def get_query_summary(result_id: str):
+    """
+    Obtenir le résumé Gemini d'une requête traitée en mode "deferred"
+    """
+    service = get_nlq_service()
+    summary = await service.get_summary_async(result_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Résultat inconnu ou expiré")
+    return SummaryResponse(**summary)
+
 @app.get("/suggestions")
 async def get_suggestions():
     """Obtenir des suggestions de requêtes"""
@@ -104,16 +272,35 @@ async def get_database_stats():
     """Obtenir des statistiques sur la base de données"""
     try:
         service = get_nlq_service()
-        return service.get_database_stats()
+        return await service.get_database_stats_async()
     except HTTPException:
         raise
     except Exception as e:
         return {"error": f"Impossible d'obtenir les statistiques: {str(e)}"}
 
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Obtenir les compteurs des caches (traductions et résultats SQL)"""
+    service = get_nlq_service()
+    return await service.get_cache_stats_async()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Exposer les métriques de performance au format texte Prometheus"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/health")
 async def health_check():
-    """Vérification de santé de l'API"""
-    return {"status": "OK", "message": "NLQ E-commerce API is running"}
+    """Vérification de santé de l'API (processus en vie, même si le service n'est pas prêt)"""
+    return {"status": "OK", "message": "NLQ E-commerce API is running", "ready": startup_state["ready"]}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Vérifier que le service est construit et préchauffé (503 sinon)"""
+    if not startup_state["ready"]:
+        detail = startup_state["error"] or "Service NLQ en cours de démarrage"
+        raise HTTPException(status_code=503, detail=f"Service NLQ non prêt: {detail}")
+    return {"status": "ready", "warm_up": startup_state["warm_up"]}
 
 if __name__ == "__main__":
     # Valider la configuration avant de démarrer
@@ -125,9 +312,11 @@ if __name__ == "__main__":
         exit(1)
     
     # Démarrer le serveur
+    # Chaque worker construit son propre service (lifespan); le rechargement impose un seul processus
     uvicorn.run(
         "main:app",
         host=Config.HOST,
         port=Config.PORT,
-        reload=Config.DEBUG
+        reload=Config.DEBUG,
+        workers=1 if Config.DEBUG else Config.WORKERS
     )
@@ -0,0 +1,56 @@
+"""
+Module des résultats au format colonnes (noms une seule fois, une liste de valeurs par colonne)
+"""
+from typing import Dict, Any, List, Optional, Sequence, Union
+import numpy as np
+
+Column = Union[np.ndarray, List[Any]]
+
+
+class ColumnarResult:
+    """
+    Résultat de requête stocké par colonne
+
+    Les colonnes numériques sans valeur nulle sont des tableaux NumPy (8 octets
+    par valeur au lieu d'un objet Python par cellule); les autres restent des
+    listes. Les noms de colonnes ne sont présents qu'une fois, quelle que soit
+    la taille du résultat.
+    """
+
+    def __init__(self, columns: Sequence[str], data: Dict[str, Column]):
+        self.columns = list(columns)
+        self.data = data
+
+    @classmethod
+    def from_rows(cls, columns: Sequence[str], rows: List[tuple]) -> "ColumnarResult":
+        """Construire le résultat à partir des lignes (tuples) lues sur le curseur"""
+        values = list(zip(*rows)) if rows else [() for _ in columns]
+        return cls(columns, {column: cls._to_column(column_values)
+                             for column, column_values in zip(columns, values)})
+
+    def __len__(self) -> int:
+        return len(next(iter(self.data.values()))) if self.data else 0
+
+    def rows(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Lignes sous forme de dictionnaires (résumés, compatibilité)"""
+        columns = [self._to_list(self.data[column][:limit]) for column in self.columns]
+        return [dict(zip(self.columns, values)) for values in zip(*columns)]
+
+    def to_json(self) -> Dict[str, List[Any]]:
+        """Colonnes sous forme de listes Python sérialisables en JSON"""
+        return {column: self._to_list(values) for column, values in self.data.items()}
+
+    @staticmethod
+    def _to_column(values: Sequence[Any]) -> Column:
+        """Tableau NumPy pour une colonne entièrement numérique, liste sinon"""
+        types = {type(value) for value in values}
+        if types == {int}:
+            return np.array(values, dtype=np.int64)
+        if types and types <= {int, float}:
+            return np.array(values, dtype=np.float64)
+        return list(values)
+
+    @staticmethod
+    def _to_list(values: Column) -> List[Any]:
+        """Valeurs Python natives d'une colonne (tolist convertit les scalaires NumPy)"""
+        return values.tolist() if isinstance(values, np.ndarray) else list(values)
@@ -2,31 +2,321 @@
 Module de gestion de la base de données SQLite pour l'e-commerce
 """
 import sqlite3
+import itertools
 import os
-from typing import List, Dict, Any, Optional
+import queue
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Callable, Iterable, Iterator, Tuple
 from config.settings import Config
+from src.columnar import ColumnarResult
+from src.metrics import RESULT_ROWS, stage
+from src.result_cache import ResultCache, SharedResultCache
+
+class QueryTooExpensiveError(Exception):
+    """Requête refusée ou interrompue car elle dépasse son budget d'exécution"""
+
+class ConnectionPool:
+    """
+    Pool de connexions SQLite réutilisables avec vérification de santé
+    
+    La vérification (SELECT 1) n'est pas faite à chaque emprunt: seulement pour
+    une connexion restée inactive plus de health_check_idle secondes, ou après
+    une erreur sqlite3 pendant son utilisation (la connexion est alors écartée
+    si elle n'est plus utilisable).
+    """
+    
+    def __init__(self, connect: Callable[[], sqlite3.Connection], size: int, timeout: float = None,
+                 health_check_idle: float = None):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout if timeout is not None else Config.DB_POOL_TIMEOUT
+        self.health_check_idle = (health_check_idle if health_check_idle is not None
+                                  else Config.DB_POOL_HEALTH_CHECK_IDLE)
+        # (connexion, instant de sa restitution)
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Emprunter une connexion du pool le temps d'un bloc with"""
+        conn = self._acquire()
+        healthy = True
+        try:
+            yield conn
+        except sqlite3.Error:
+            # Erreur pendant l'utilisation: la connexion n'est rendue que si elle répond encore
+            healthy = self._is_healthy(conn)
+            raise
+        finally:
+            if healthy:
+                self._release(conn)
+            else:
+                self._discard(conn)
+    
+    def warm_up(self):
+        """Ouvrir à l'avance toutes les connexions du pool"""
+        connections = [self._acquire() for _ in range(self.size)]
+        for conn in connections:
+            self._release(conn)
+    
+    def close_all(self):
+        """Fermer toutes les connexions inactives du pool"""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+    
+    def _acquire(self) -> sqlite3.Connection:
+        """Obtenir une connexion saine, en ouvrant une nouvelle si le pool n'est pas plein"""
+        try:
+            conn, released_at = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open_if_allowed()
+            if conn is not None:
+                return conn
+            try:
+                conn, released_at = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError("Aucune connexion disponible dans le pool SQLite")
+        
+        # Connexion utilisée récemment: pas d'aller-retour de vérification
+        if time.monotonic() - released_at > self.health_check_idle and not self._is_healthy(conn):
+            conn.close()
+            conn = self._connect()
+        return conn
+    
+    def _open_if_allowed(self) -> Optional[sqlite3.Connection]:
+        """Ouvrir une nouvelle connexion si la taille maximale n'est pas atteinte"""
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            self._created += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+    
+    def _release(self, conn: sqlite3.Connection):
+        """Rendre une connexion au pool, ou l'écarter si elle est inutilisable"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put_nowait((conn, time.monotonic()))
+    
+    def _discard(self, conn: sqlite3.Connection):
+        """Fermer une connexion et libérer sa place dans le pool"""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+    
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
+        """Vérifier qu'une connexion est toujours utilisable"""
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
 
 class DatabaseManager:
     """Gestionnaire de base de données pour le système e-commerce"""
     
-    def __init__(self, db_path: str = None):
+    # Index secondaires créés à l'initialisation du schéma: {nom: "table (colonnes)"}
+    INDEXES = {
+        "idx_products_category": "products (category_id, is_active, price)",
+        "idx_products_brand": "products (brand_id, is_active, price)",
+        "idx_products_gender_season": "products (gender, season, is_active, price)",
+        "idx_products_season": "products (season, is_active, price)",
+        "idx_products_active_price": "products (is_active, price)",
+        "idx_order_items_order": "order_items (order_id, product_id)",
+        "idx_order_items_product": "order_items (product_id, quantity)",
+        "idx_orders_status_date": "orders (status, order_date)",
+    }
+    
+    # Compteurs de génération: {nom: {table: colonnes suivies}}. Les triggers
+    # incrémentent le compteur à chaque insertion ou suppression dans ces tables,
+    # et à chaque mise à jour modifiant une des colonnes suivies. Le compteur
+    # "writes" est incrémenté par l'écrivain, dans la transaction de chaque écriture.
+    GENERATIONS = {
+        "writes": {},
+        "vocabulary": {
+            "categories": ("name", "parent_id"),
+            "brands": ("name",),
+            "products": ("color", "material"),
+        },
+    }
+    
+    # Tables de service, absentes du schéma interrogeable (get_schema)
+    INTERNAL_TABLES = {"data_generations", "product_stats", "order_stats"}
+    
+    # Version du schéma créé par init_tables (PRAGMA user_version): à incrémenter
+    # à chaque modification des tables, index ou triggers ci-dessous
+    SCHEMA_VERSION = 4
+    
+    def __init__(self, db_path: str = None, pool_size: int = None):
         self.db_path = db_path or Config.DATABASE_PATH
+        self.in_memory = self.db_path == ":memory:"
+        # Une base en mémoire partagée permet au lecteur et à l'écrivain de voir les mêmes données
+        self._database = f"file:nlq-memory-{id(self)}?mode=memory&cache=shared" if self.in_memory else self.db_path
         self.ensure_database_exists()
+        
+        # Connexion d'écriture unique, protégée par un verrou
+        self._write_lock = threading.RLock()
+        self._writer = self._open_connection(read_only=False)
+        self._bulk_depth = 0
+        
+        # Détection des modifications: compteur des écritures de ce processus et
+        # connexion dédiée à PRAGMA data_version (écritures des autres connexions)
+        self._write_generation = 0
+        self._version_lock = threading.Lock()
+        self._version_conn: Optional[sqlite3.Connection] = None
+        
+        # Résultats des requêtes, invalidés à chaque changement de data_version()
+        self.result_cache = ResultCache(Config.RESULT_CACHE_MAX_BYTES) if Config.RESULT_CACHE_ENABLED else None
+        # Second niveau partagé entre processus workers (base des caches)
+        self.shared_result_cache = (
+            SharedResultCache(self.db_path)
+            if self.result_cache is not None and Config.SHARED_RESULT_CACHE_ENABLED and not self.in_memory
+            else None
+        )
+        
+        # Connexions de lecture réutilisées pour le chemin NLQ
+        self._read_pool = ConnectionPool(
+            lambda: self._open_connection(read_only=True),
+            pool_size or Config.DB_POOL_SIZE
+        )
         self.init_tables()
     
     def ensure_database_exists(self):
         """S'assurer que le répertoire de la base de données existe"""
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        directory = os.path.dirname(self.db_path)
+        if not self.in_memory and directory:
+            os.makedirs(directory, exist_ok=True)
     
     def get_connection(self) -> sqlite3.Connection:
-        """Obtenir une connexion à la base de données"""
-        conn = sqlite3.connect(self.db_path)
+        """Obtenir une nouvelle connexion (hors pool) à la base de données"""
+        conn = sqlite3.connect(self._database, uri=self.in_memory)
         conn.row_factory = sqlite3.Row  # Pour avoir des résultats sous forme de dictionnaire
         return conn
     
+    def _open_connection(self, read_only: bool) -> sqlite3.Connection:
+        """Ouvrir une connexion longue durée configurée pour la lecture ou l'écriture"""
+        conn = sqlite3.connect(
+            self._database,
+            uri=self.in_memory,
+            timeout=Config.DB_BUSY_TIMEOUT,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        
+        if read_only:
+            conn.execute(f"PRAGMA cache_size = -{Config.DB_CACHE_SIZE_KB}")
+            conn.execute(f"PRAGMA mmap_size = {Config.DB_MMAP_SIZE}")
+            conn.execute("PRAGMA query_only = 1")
+        else:
+            if not self.in_memory:
+                # WAL permet aux lecteurs de ne pas être bloqués par l'écrivain
+                conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+    
+    @contextmanager
+    def read_connection(self) -> Iterator[sqlite3.Connection]:
+        """Emprunter une connexion de lecture du pool"""
+        with self._read_pool.connection() as conn:
+            yield conn
+    
+    @contextmanager
+    def write_connection(self) -> Iterator[sqlite3.Connection]:
+        """Utiliser la connexion d'écriture; commit en fin de bloc, rollback en cas d'erreur"""
+        with self._write_lock:
+            changes = self._writer.total_changes
+            try:
+                yield self._writer
+                self._count_write(changes)
+                self._writer.commit()
+            except Exception:
+                self._writer.rollback()
+                raise
+            finally:
+                self._write_generation += 1
+    
+    def _count_write(self, changes_before: int):
+        """
+        Incrémenter le compteur "writes" dans la transaction en cours, si des lignes ont été modifiées
+        
+        Le compteur est validé avec les données: un lecteur qui voit les
+        nouvelles données voit aussi la nouvelle génération.
+        """
+        if self._writer.total_changes != changes_before:
+            self._writer.execute("UPDATE data_generations SET generation = generation + 1 WHERE name = 'writes'")
+    
+    def data_version(self) -> Tuple[int, int]:
+        """
+        Obtenir un marqueur de version des données, en temps constant
+        
+        Le marqueur change après toute écriture faite par ce gestionnaire ou
+        par une autre connexion (autre processus, outil externe): il permet
+        d'invalider les caches dérivés des données sans relire les tables.
+        
+        Returns:
+            (compteur des écritures locales, PRAGMA data_version)
+        """
+        with self._version_lock:
+            if self._version_conn is None:
+                self._version_conn = self._open_connection(read_only=True)
+            pragma_version = self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+        return self._write_generation, pragma_version
+    
+    def schema_version(self) -> int:
+        """Obtenir le compteur de modifications du schéma (PRAGMA schema_version)"""
+        with self._version_lock:
+            if self._version_conn is None:
+                self._version_conn = self._open_connection(read_only=True)
+            return self._version_conn.execute("PRAGMA schema_version").fetchone()[0]
+    
+    def warm_up(self):
+        """Ouvrir à l'avance les connexions de lecture du pool"""
+        self._read_pool.warm_up()
+    
+    def close(self):
+        """Fermer toutes les connexions gérées"""
+        self._read_pool.close_all()
+        with self._write_lock:
+            self._writer.close()
+        with self._version_lock:
+            if self._version_conn is not None:
+                self._version_conn.close()
+                self._version_conn = None
+    
     def init_tables(self):
-        """Initialiser les tables de la base de données"""
-        with self.get_connection() as conn:
+        """
+        Initialiser les tables de la base de données
+        
+        Une base déjà initialisée à la version SCHEMA_VERSION n'est pas
+        modifiée: l'ouverture ne coûte alors qu'une lecture de PRAGMA user_version.
+        """
+        with self.write_connection() as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] == self.SCHEMA_VERSION:
+                self.fts_enabled = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+                ).fetchone() is not None
+                return
+            
             # Table des catégories
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS categories (
@@ -102,26 +392,474 @@ class DatabaseManager:
                 )
             """)
             
-            conn.commit()
+            # Index des colonnes de filtre les plus fréquentes (is_active et price
+            # en fin d'index pour couvrir les filtres et tris usuels sans relire la table)
+            self._create_indexes(conn)
+            
+            self.fts_enabled = self._init_full_text_search(conn)
+            self._init_generations(conn)
+            self._init_summaries(conn)
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
     
-    def execute_query(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
-        """Exécuter une requête SELECT et retourner les résultats"""
-        with self.get_connection() as conn:
-            cursor = conn.execute(query, params)
-            return [dict(row) for row in cursor.fetchall()]
+    def _create_indexes(self, conn: sqlite3.Connection):
+        """Créer les index secondaires manquants"""
+        for name, definition in self.INDEXES.items():
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+    
+    def _init_full_text_search(self, conn: sqlite3.Connection) -> bool:
+        """
+        Créer l'index plein texte FTS5 des produits et ses triggers de synchronisation
+        
+        Returns:
+            True si FTS5 est disponible, False sinon (la recherche retombe sur LIKE)
+        """
+        already_exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        ).fetchone() is not None
+        
+        try:
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                    name, description, material, color,
+                    content='products', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            """)
+        except sqlite3.OperationalError:
+            return False
+        
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+                INSERT INTO products_fts (rowid, name, description, material, color)
+                VALUES (new.id, new.name, new.description, new.material, new.color);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+                INSERT INTO products_fts (products_fts, rowid, name, description, material, color)
+                VALUES ('delete', old.id, old.name, old.description, old.material, old.color);
+            END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS products_fts_update
+            AFTER UPDATE OF name, description, material, color ON products BEGIN
+                INSERT INTO products_fts (products_fts, rowid, name, description, material, color)
+                VALUES ('delete', old.id, old.name, old.description, old.material, old.color);
+                INSERT INTO products_fts (rowid, name, description, material, color)
+                VALUES (new.id, new.name, new.description, new.material, new.color);
+            END
+        """)
+        
+        # Base existante: indexer les produits déjà présents
+        if not already_exists:
+            conn.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+        return True
+    
+    def _init_generations(self, conn: sqlite3.Connection):
+        """Créer la table des compteurs de génération et les triggers qui les incrémentent"""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS data_generations (
+                name TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        for name, tables in self.GENERATIONS.items():
+            conn.execute("INSERT OR IGNORE INTO data_generations (name) VALUES (?)", (name,))
+            bump = f"UPDATE data_generations SET generation = generation + 1 WHERE name = '{name}';"
+            for table, columns in tables.items():
+                changed = " OR ".join(f"old.{column} IS NOT new.{column}" for column in columns)
+                for suffix, event in (("insert", "INSERT"), ("delete", "DELETE"),
+                                      ("update", f"UPDATE OF {', '.join(columns)}")):
+                    condition = f" WHEN {changed}" if suffix == "update" else ""
+                    conn.execute(f"""
+                        CREATE TRIGGER IF NOT EXISTS {table}_{name}_{suffix}
+                        AFTER {event} ON {table}{condition} BEGIN {bump} END
+                    """)
+    
+    def _init_summaries(self, conn: sqlite3.Connection):
+        """
+        Créer les tables de synthèse des statistiques et les triggers qui les tiennent à jour
+        
+        product_stats contient les agrégats des produits par couple (catégorie,
+        marque), la marque 0 désignant les produits sans marque; order_stats le
+        nombre de commandes par statut. Chaque écriture sur products ou orders
+        y ajoute la contribution de la nouvelle ligne et retire celle de l'ancienne.
+        """
+        already_exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_stats'"
+        ).fetchone() is not None
+        
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS product_stats (
+                category_id INTEGER NOT NULL,
+                brand_id INTEGER NOT NULL,
+                products INTEGER NOT NULL DEFAULT 0,
+                active_products INTEGER NOT NULL DEFAULT 0,
+                stock_units INTEGER NOT NULL DEFAULT 0,
+                out_of_stock INTEGER NOT NULL DEFAULT 0,
+                stock_value REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (category_id, brand_id)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS order_stats (
+                status TEXT NOT NULL PRIMARY KEY,
+                orders INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        
+        def product_delta(row: str, sign: str) -> str:
+            return f"""
+                INSERT INTO product_stats (category_id, brand_id, products, active_products,
+                                           stock_units, out_of_stock, stock_value)
+                VALUES ({row}.category_id, IFNULL({row}.brand_id, 0), {sign}1,
+                        {sign}IFNULL({row}.is_active = 1, 0),
+                        {sign}IFNULL(CASE WHEN {row}.is_active = 1 THEN {row}.stock_quantity END, 0),
+                        {sign}IFNULL({row}.is_active = 1 AND {row}.stock_quantity <= 0, 0),
+                        {sign}IFNULL(CASE WHEN {row}.is_active = 1 THEN {row}.price * {row}.stock_quantity END, 0))
+                ON CONFLICT (category_id, brand_id) DO UPDATE SET
+                    products = products + excluded.products,
+                    active_products = active_products + excluded.active_products,
+                    stock_units = stock_units + excluded.stock_units,
+                    out_of_stock = out_of_stock + excluded.out_of_stock,
+                    stock_value = stock_value + excluded.stock_value;
+            """
+        
+        def order_delta(row: str, sign: str) -> str:
+            return f"""
+                INSERT INTO order_stats (status, orders) VALUES (IFNULL({row}.status, ''), {sign}1)
+                ON CONFLICT (status) DO UPDATE SET orders = orders + excluded.orders;
+            """
+        
+        triggers = {
+            "product_stats_insert": ("AFTER INSERT ON products", product_delta("new", "+")),
+            "product_stats_delete": ("AFTER DELETE ON products", product_delta("old", "-")),
+            "product_stats_update": (
+                "AFTER UPDATE OF category_id, brand_id, is_active, stock_quantity, price ON products",
+                product_delta("old", "-") + product_delta("new", "+")
+            ),
+            "order_stats_insert": ("AFTER INSERT ON orders", order_delta("new", "+")),
+            "order_stats_delete": ("AFTER DELETE ON orders", order_delta("old", "-")),
+            "order_stats_update": ("AFTER UPDATE OF status ON orders",
+                                   order_delta("old", "-") + order_delta("new", "+")),
+        }
+        for name, (event, body) in triggers.items():
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+        
+        # Base existante: synthèse initiale des lignes déjà présentes
+        if not already_exists:
+            conn.execute("""
+                INSERT INTO product_stats (category_id, brand_id, products, active_products,
+                                           stock_units, out_of_stock, stock_value)
+                SELECT category_id, IFNULL(brand_id, 0), COUNT(*),
+                       IFNULL(SUM(is_active = 1), 0),
+                       IFNULL(SUM(CASE WHEN is_active = 1 THEN stock_quantity END), 0),
+                       IFNULL(SUM(is_active = 1 AND stock_quantity <= 0), 0),
+                       IFNULL(SUM(CASE WHEN is_active = 1 THEN price * stock_quantity END), 0)
+                FROM products
+                GROUP BY category_id, IFNULL(brand_id, 0)
+            """)
+            conn.execute("""
+                INSERT INTO order_stats (status, orders)
+                SELECT IFNULL(status, ''), COUNT(*) FROM orders GROUP BY IFNULL(status, '')
+            """)
+    
+    def generation(self, name: str) -> int:
+        """
+        Lire un compteur de génération (GENERATIONS), mis à jour par triggers ou par l'écrivain
+        
+        Contrairement à data_version(), il est commun à tous les processus et
+        ne change qu'après une modification des tables et colonnes suivies (quelle
+        que soit la connexion), ou après une écriture de l'écrivain pour "writes".
+        """
+        rows = self.execute_query("SELECT generation FROM data_generations WHERE name = ?",
+                                  (name,), use_cache=False)
+        return rows[0]['generation'] if rows else 0
+    
+    @contextmanager
+    def _execution_budget(self, conn: sqlite3.Connection, timeout_ms: Optional[float]) -> Iterator[None]:
+        """
+        Interrompre l'exécution SQLite au-delà du délai imparti
+        
+        Le gestionnaire de progression est appelé toutes les QUERY_PROGRESS_STEPS
+        instructions de la machine virtuelle SQLite; dès que le délai est dépassé,
+        il interrompt la requête (SQLITE_INTERRUPT) et la connexion est libérée.
+        """
+        if not timeout_ms:
+            yield
+            return
+        deadline = time.monotonic() + timeout_ms / 1000
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, Config.QUERY_PROGRESS_STEPS)
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if time.monotonic() > deadline:
+                raise QueryTooExpensiveError(f"exécution interrompue après {timeout_ms:g} ms") from e
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+    
+    def explain_query_plan(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        """Obtenir le plan d'exécution d'une requête (EXPLAIN QUERY PLAN) sans l'exécuter"""
+        with self.read_connection() as conn:
+            return [dict(row) for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()]
+    
+    def execute_query(self, query: str, params: tuple = (), timeout_ms: Optional[float] = None,
+                      use_cache: bool = True,
+                      before_execute: Optional[Callable[[], None]] = None) -> List[Dict[str, Any]]:
+        """
+        Exécuter une requête SELECT et retourner les résultats
+        
+        Tant que les données ne changent pas, une requête déjà exécutée (même
+        SQL aux espaces près, mêmes paramètres) est servie par le cache de
+        résultats sans accéder à SQLite.
+        
+        Args:
+            query: Requête SQL
+            params: Paramètres de la requête
+            timeout_ms: Budget d'exécution; au-delà la requête est interrompue
+            use_cache: Consulter et alimenter le cache de résultats
+            before_execute: Vérification appelée seulement si la requête doit
+                être exécutée (absente des caches), par exemple le contrôle du plan
+            
+        Raises:
+            QueryTooExpensiveError: Si le budget d'exécution est dépassé
+        """
+        columns, rows = self._fetch_rows(query, params, timeout_ms, use_cache, before_execute)
+        with stage("row_conversion"):
+            return [dict(zip(columns, row)) for row in rows]
+    
+    def execute_query_columnar(self, query: str, params: tuple = (), timeout_ms: Optional[float] = None,
+                               use_cache: bool = True,
+                               before_execute: Optional[Callable[[], None]] = None) -> ColumnarResult:
+        """
+        Variante de execute_query renvoyant le résultat par colonne
+        
+        Aucun dictionnaire n'est créé par ligne: les tuples lus sur le curseur
+        sont transposés en colonnes (tableaux NumPy pour les colonnes numériques).
+        """
+        columns, rows = self._fetch_rows(query, params, timeout_ms, use_cache, before_execute)
+        with stage("row_conversion"):
+            return ColumnarResult.from_rows(columns, rows)
+    
+    def _fetch_rows(self, query: str, params: tuple, timeout_ms: Optional[float], use_cache: bool,
+                    before_execute: Optional[Callable[[], None]] = None) -> Tuple[Tuple[str, ...], List[tuple]]:
+        """Lire les lignes (tuples) et les noms de colonnes d'une requête, via le cache de résultats"""
+        cache_key = version = generation = None
+        if use_cache and self.result_cache is not None and ResultCache.cacheable(query):
+            with stage("result_cache"):
+                version = self.data_version()
+                cache_key = ResultCache.key(query, params)
+                cached = self.result_cache.get(cache_key, version)
+                if cached is None and self.shared_result_cache is not None:
+                    # Génération lue avant l'exécution: un résultat périmé n'est jamais enregistré comme courant
+                    generation = self.generation("writes")
+                    cached = self.shared_result_cache.get(cache_key, generation)
+                    if cached is not None:
+                        self.result_cache.set(cache_key, version, *cached)
+            if cached is not None:
+                RESULT_ROWS.observe(len(cached[1]))
+                return cached
+        
+        if before_execute is not None:
+            before_execute()
+        with self.read_connection() as conn:
+            with stage("sql_execute"), self._execution_budget(conn, timeout_ms):
+                cursor = conn.cursor()
+                # Tuples bruts: la conversion dépend du format demandé par l'appelant
+                cursor.row_factory = None
+                rows = cursor.execute(query, params).fetchall()
+                columns = tuple(description[0] for description in cursor.description or ())
+        RESULT_ROWS.observe(len(rows))
+        if cache_key is not None:
+            self.result_cache.set(cache_key, version, columns, rows)
+            if generation is not None:
+                self.shared_result_cache.set(cache_key, generation, columns, rows)
+        return columns, rows
+    
+    def iter_query(self, query: str, params: tuple = (), chunk_size: int = None,
+                   timeout_ms: Optional[float] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Exécuter une requête SELECT et produire les résultats par blocs
+        
+        Le curseur est parcouru avec fetchmany: seul un bloc de lignes est en
+        mémoire à la fois, quelle que soit la taille du résultat. La connexion
+        reste empruntée au pool jusqu'à épuisement ou fermeture du générateur.
+        Le budget d'exécution (timeout_ms) s'applique à la lecture de chaque bloc,
+        le temps passé par le client entre deux blocs n'est pas décompté.
+        """
+        chunk_size = chunk_size or Config.STREAM_CHUNK_SIZE
+        count = 0
+        with self.read_connection() as conn:
+            with self._execution_budget(conn, timeout_ms):
+                cursor = conn.execute(query, params)
+            try:
+                while True:
+                    with stage("sql_execute"), self._execution_budget(conn, timeout_ms):
+                        rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    count += len(rows)
+                    with stage("row_conversion"):
+                        chunk = [dict(row) for row in rows]
+                    yield chunk
+            finally:
+                cursor.close()
+                RESULT_ROWS.observe(count)
     
     def execute_update(self, query: str, params: tuple = ()) -> int:
         """Exécuter une requête UPDATE/INSERT/DELETE et retourner le nombre de lignes affectées"""
-        with self.get_connection() as conn:
+        with self.write_connection() as conn:
             cursor = conn.execute(query, params)
-            conn.commit()
             return cursor.rowcount
     
+    @contextmanager
+    def bulk_load(self, defer_indexes: bool = False) -> Iterator[sqlite3.Connection]:
+        """
+        Régler SQLite pour un chargement massif le temps du bloc
+        
+        La connexion d'écriture reste réservée pendant tout le bloc, avec
+        synchronous=OFF, temp_store=MEMORY et un cache de pages élargi, puis ces
+        réglages reprennent leurs valeurs précédentes. Les statistiques du
+        planificateur sont recalculées (ANALYZE échantillonné) à la fin. Si le
+        bloc échoue, la transaction en cours est annulée, les index supprimés
+        sont recréés et ANALYZE n'est pas lancé.
+        
+        Args:
+            defer_indexes: Supprimer les index secondaires pendant le chargement
+                et les recréer à la fin (plus rapide pour des millions de lignes)
+        """
+        with self._write_lock:
+            conn = self._writer
+            # Blocs imbriqués (bulk_insert dans bulk_load): seul le bloc externe règle SQLite
+            if self._bulk_depth:
+                self._bulk_depth += 1
+                try:
+                    yield conn
+                finally:
+                    self._bulk_depth -= 1
+                return
+            
+            self._bulk_depth = 1
+            changes = conn.total_changes
+            # Réglages de la connexion, rétablis à l'identique en fin de bloc
+            saved_pragmas = {pragma: conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+                             for pragma in ("synchronous", "temp_store", "cache_size")}
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("PRAGMA temp_store = MEMORY")
+            conn.execute(f"PRAGMA cache_size = -{Config.DB_BULK_CACHE_SIZE_KB}")
+            if defer_indexes:
+                for name in self.INDEXES:
+                    conn.execute(f"DROP INDEX IF EXISTS {name}")
+            succeeded = False
+            try:
+                yield conn
+                succeeded = True
+            finally:
+                self._bulk_depth = 0
+                try:
+                    if succeeded:
+                        self._count_write(changes)
+                        conn.commit()
+                    else:
+                        # Lot en cours annulé (les lots de bulk_insert déjà validés restent)
+                        conn.rollback()
+                    self._write_generation += 1
+                    if defer_indexes:
+                        with self.write_connection():
+                            self._create_indexes(conn)
+                    if succeeded:
+                        conn.execute("PRAGMA analysis_limit = 1000")
+                        conn.execute("ANALYZE")
+                finally:
+                    for pragma, value in saved_pragmas.items():
+                        conn.execute(f"PRAGMA {pragma} = {value}")
+    
+    def bulk_insert(self, table: str, columns: List[str], rows: Iterable[tuple],
+                    batch_size: int = None, or_ignore: bool = False) -> int:
+        """
+        Insérer un grand nombre de lignes avec executemany, par transactions groupées
+        
+        Args:
+            table: Nom de la table
+            columns: Colonnes renseignées, dans l'ordre des tuples
+            rows: Lignes à insérer (un itérable, consommé par lots)
+            batch_size: Nombre de lignes par transaction
+            or_ignore: Ignorer les lignes en conflit (INSERT OR IGNORE)
+            
+        Returns:
+            Nombre de lignes insérées
+        """
+        batch_size = batch_size or Config.BULK_BATCH_SIZE
+        query = (
+            f"INSERT {'OR IGNORE ' if or_ignore else ''}INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})"
+        )
+        
+        inserted = 0
+        rows = iter(rows)
+        with self.bulk_load():
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                with self.write_connection() as conn:
+                    inserted += conn.executemany(query, batch).rowcount
+        return inserted
+    
     def get_table_schema(self, table_name: str) -> List[Dict[str, Any]]:
         """Obtenir le schéma d'une table"""
         query = f"PRAGMA table_info({table_name})"
         return self.execute_query(query)
     
+    def get_foreign_keys(self, table_name: str) -> Dict[str, str]:
+        """
+        Obtenir les clés étrangères d'une table
+
+        Returns:
+            Dictionnaire {colonne: "table.colonne" référencée}
+        """
+        return {row['from']: f"{row['table']}.{row['to']}"
+                for row in self.execute_query(f"PRAGMA foreign_key_list({table_name})")}
+
+    def get_column_enums(self, table_name: str) -> Dict[str, List[str]]:
+        """
+        Obtenir les valeurs autorisées par les contraintes CHECK (colonne IN (...)) d'une table
+        
+        Returns:
+            Dictionnaire {colonne: [valeurs autorisées]}
+        """
+        result = self.execute_query(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)
+        )
+        if not result or not result[0]['sql']:
+            return {}
+        
+        enums = {}
+        for column, values in re.findall(r"CHECK\s*\(\s*(\w+)\s+IN\s*\(([^)]*)\)", result[0]['sql'], re.IGNORECASE):
+            enums[column] = re.findall(r"'([^']*)'", values)
+        return enums
+    
+    def get_schema(self) -> Dict[str, List[str]]:
+        """
+        Obtenir les colonnes de chaque table interrogeable
+        
+        Les tables internes de SQLite, les tables de service (INTERNAL_TABLES)
+        et les tables de stockage des index plein texte (products_fts_data...)
+        sont exclues.
+        """
+        tables = self.execute_query(
+            "SELECT name, sql FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'"
+        )
+        virtual_tables = [row['name'] for row in tables
+                          if (row['sql'] or '').upper().startswith('CREATE VIRTUAL TABLE')]
+        return {
+            row['name']: [column['name'] for column in self.get_table_schema(row['name'])]
+            for row in tables
+            if row['name'] not in self.INTERNAL_TABLES
+            and not any(row['name'].startswith(f"{virtual}_") for virtual in virtual_tables)
+        }
+    
     def get_all_tables(self) -> List[str]:
         """Obtenir la liste de toutes les tables"""
         query = "SELECT name FROM sqlite_master WHERE type='table'"
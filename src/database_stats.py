@@ -0,0 +1,124 @@
+"""
+Module des statistiques de la base de données, lues dans les tables de synthèse
+"""
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from config.settings import Config
+from src.database_manager import DatabaseManager
+
+
+class DatabaseStats:
+    """
+    Statistiques agrégées du catalogue, mises en cache par version des données
+
+    Chaque appel à get() ne coûte qu'un PRAGMA data_version; après une
+    écriture, les agrégats (compteurs, stock, répartition par catégorie et par
+    marque) sont relus dans les tables de synthèse product_stats et order_stats,
+    tenues à jour par triggers (une ligne par couple catégorie/marque et par
+    statut, sans parcours des produits ni des commandes). Pendant qu'un thread
+    les relit, les autres reçoivent les statistiques précédentes.
+    """
+
+    # Agrégats calculés par couple (catégorie, marque) puis repliés
+    FIELDS = ("products", "active_products", "stock_units", "out_of_stock", "stock_value")
+
+    def __init__(self, db_manager: DatabaseManager, refresh_interval: float = None):
+        self.db_manager = db_manager
+        # Délai minimal entre deux recalculs quand les écritures sont continues
+        self.refresh_interval = refresh_interval if refresh_interval is not None else Config.STATS_REFRESH_INTERVAL
+        self.refreshes = 0
+        self._stats: Optional[Dict[str, Any]] = None
+        self._version: Optional[Tuple[int, int]] = None
+        self._computed_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Dict[str, Any]:
+        """Obtenir les statistiques, recalculées si les données ont changé"""
+        version = self.db_manager.data_version()
+        if self._is_fresh(version):
+            return self._stats
+
+        # Recalcul déjà en cours dans un autre thread: l'instantané précédent est servi
+        if not self._lock.acquire(blocking=self._stats is None):
+            return self._stats
+        try:
+            # Un autre thread a pu recalculer pendant l'attente du verrou
+            if self._is_fresh(version):
+                return self._stats
+            stats = self._compute()
+            self._stats, self._version, self._computed_at = stats, version, time.monotonic()
+            self.refreshes += 1
+            return stats
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        """Forcer le recalcul au prochain appel"""
+        with self._lock:
+            self._version = None
+
+    def _is_fresh(self, version: Tuple[int, int]) -> bool:
+        """Vérifier si les statistiques en cache sont utilisables"""
+        if self._stats is None or self._version is None:
+            return False
+        if version == self._version:
+            return True
+        return time.monotonic() - self._computed_at < self.refresh_interval
+
+    def _compute(self) -> Dict[str, Any]:
+        """Calculer l'ensemble des agrégats"""
+        db = self.db_manager
+        categories = {row['id']: row['name'] for row in db.execute_query("SELECT id, name FROM categories")}
+        brands = {row['id']: row['name'] for row in db.execute_query("SELECT id, name FROM brands")}
+
+        # Agrégats par couple (catégorie, marque), repliés ensuite par catégorie et par marque
+        groups = db.execute_query("""
+            SELECT category_id, NULLIF(brand_id, 0) AS brand_id, products, active_products,
+                   stock_units, out_of_stock, stock_value
+            FROM product_stats
+            WHERE products > 0
+        """, use_cache=False)
+        by_category = self._fold(groups, 'category_id', categories)
+        by_brand = self._fold(groups, 'brand_id', brands)
+        totals = self._totals(groups)
+
+        orders_by_status = {
+            row['status'] or None: row['orders']
+            for row in db.execute_query("SELECT status, orders FROM order_stats WHERE orders > 0",
+                                        use_cache=False)
+        }
+
+        return {
+            "active_products": totals["active_products"],
+            "categories": len(categories),
+            "brands": len(brands),
+            "orders": sum(orders_by_status.values()),
+            "products": totals["products"],
+            "stock": {
+                "units": totals["stock_units"],
+                "out_of_stock": totals["out_of_stock"],
+                "value": round(totals["stock_value"], 2)
+            },
+            "orders_by_status": orders_by_status,
+            "by_category": by_category,
+            "by_brand": by_brand
+        }
+
+    @classmethod
+    def _totals(cls, groups: List[Dict[str, Any]]) -> Dict[str, float]:
+        """Sommer les agrégats de tous les groupes"""
+        return {field: sum(row[field] or 0 for row in groups) for field in cls.FIELDS}
+
+    @classmethod
+    def _fold(cls, groups: List[Dict[str, Any]], key: str, names: Dict[int, str]) -> List[Dict[str, Any]]:
+        """Replier les groupes (catégorie, marque) selon une seule des deux clés"""
+        folded: Dict[Any, Dict[str, Any]] = {}
+        for row in groups:
+            entry = folded.setdefault(row[key], {"id": row[key], "name": names.get(row[key]),
+                                                 **{field: 0 for field in cls.FIELDS}})
+            for field in cls.FIELDS:
+                entry[field] += row[field] or 0
+        for entry in folded.values():
+            entry["stock_value"] = round(entry["stock_value"], 2)
+        return sorted(folded.values(), key=lambda entry: entry["active_products"], reverse=True)
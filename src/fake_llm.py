@@ -0,0 +1,109 @@
+"""
+Module de simulation locale de l'API Gemini (benchmarks et tests hors réseau)
+"""
+import asyncio
+import json
+import random
+import time
+from typing import Dict, Any, List, Optional
+from config.settings import Config
+from src.query_cache import normalize_query
+
+
+class FakeUsageMetadata:
+    """Comptage approximatif des tokens, au format de la réponse Gemini"""
+
+    def __init__(self, prompt: str, text: str):
+        self.prompt_token_count = len(prompt) // 4
+        self.candidates_token_count = len(text) // 4
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class FakeResponse:
+    """Réponse simulée exposant les mêmes attributs que celle de Gemini"""
+
+    def __init__(self, prompt: str, text: str):
+        self.text = text
+        self.usage_metadata = FakeUsageMetadata(prompt, text)
+
+
+class FakeGenerativeModel:
+    """
+    Remplaçant de genai.GenerativeModel qui rejoue des réponses enregistrées
+
+    Les prompts de traduction sont associés à une réponse enregistrée dont la
+    requête (normalisée) apparaît dans le prompt; à défaut une requête SQL
+    générique est renvoyée. Les prompts de résumé reçoivent un texte fixe. Une
+    latence configurable (avec gigue) simule le temps de réponse du LLM.
+    """
+
+    DEFAULT_TRANSLATION = {
+        "sql_query": "SELECT p.id, p.name, p.price, p.color, p.material FROM products p "
+                     "WHERE p.is_active = 1 ORDER BY p.id LIMIT 50",
+        "explanation": "Produits actifs",
+        "filters_applied": [],
+        "confidence": 0.5
+    }
+
+    DEFAULT_SUMMARY = "Voici une sélection de produits correspondant à votre recherche."
+
+    def __init__(self, responses: Optional[List[Dict[str, Any]]] = None, latency_ms: float = 0.0,
+                 jitter_ms: float = 0.0, seed: Optional[int] = None):
+        self.responses = [
+            (normalize_query(entry["query"]), entry["response"]) for entry in (responses or [])
+        ]
+        # Les requêtes les plus longues sont testées en premier (correspondance la plus précise)
+        self.responses.sort(key=lambda entry: len(entry[0]), reverse=True)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_config(cls) -> "FakeGenerativeModel":
+        """Construire le modèle simulé à partir de la configuration"""
+        responses = []
+        if Config.FAKE_LLM_RESPONSES:
+            with open(Config.FAKE_LLM_RESPONSES, encoding="utf-8") as responses_file:
+                responses = json.load(responses_file)
+        return cls(responses, Config.FAKE_LLM_LATENCY_MS, Config.FAKE_LLM_JITTER_MS)
+
+    def generate_content(self, prompt: str, **kwargs) -> FakeResponse:
+        """Équivalent synchrone de GenerativeModel.generate_content"""
+        delay, timeout = self._delay(), self._timeout(kwargs)
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("Deadline Exceeded")
+        time.sleep(delay)
+        return self._respond(prompt)
+
+    async def generate_content_async(self, prompt: str, **kwargs) -> FakeResponse:
+        """Équivalent asynchrone de GenerativeModel.generate_content_async"""
+        delay, timeout = self._delay(), self._timeout(kwargs)
+        if timeout is not None and delay > timeout:
+            await asyncio.sleep(timeout)
+            raise TimeoutError("Deadline Exceeded")
+        await asyncio.sleep(delay)
+        return self._respond(prompt)
+
+    @staticmethod
+    def _timeout(kwargs: Dict[str, Any]) -> Optional[float]:
+        """Délai de la requête (request_options={"timeout": ...}), comme le client Gemini"""
+        return (kwargs.get("request_options") or {}).get("timeout")
+
+    def _delay(self) -> float:
+        """Latence simulée en secondes"""
+        jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def _respond(self, prompt: str) -> FakeResponse:
+        """Choisir la réponse correspondant au prompt"""
+        self.calls += 1
+        if '"sql_query"' not in prompt:
+            return FakeResponse(prompt, self.DEFAULT_SUMMARY)
+
+        normalized_prompt = normalize_query(prompt)
+        for query, response in self.responses:
+            if query and query in normalized_prompt:
+                return FakeResponse(prompt, json.dumps(response, ensure_ascii=False))
+        return FakeResponse(prompt, json.dumps(self.DEFAULT_TRANSLATION, ensure_ascii=False))
@@ -1,34 +1,95 @@
 """
 Module d'intégration avec l'API Gemini pour la compréhension du langage naturel
 """
+import asyncio
+import datetime
+import time
 import google.generativeai as genai
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import json
 import re
 from config.settings import Config
+from src.fake_llm import FakeGenerativeModel
+from src.llm_scheduler import LatencyWindow, LLMDeadlineError, LLMScheduler, LLMUnavailableError
+from src.metrics import LLM_DEADLINES, LLM_HEDGES, record_llm_usage, stage
+from src.prompt_builder import PromptBuilder
+from src.query_cache import TranslationCache
+from src.semantic_index import SemanticQueryIndex
+from src.sql_validator import SQLValidator
 
 class GeminiNLQProcessor:
     """Processeur de requêtes en langage naturel utilisant l'API Gemini"""
     
-    def __init__(self):
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+    # Requête minimale envoyée au démarrage pour établir la connexion au LLM
+    WARM_UP_PROMPT = "Réponds uniquement: OK"
+    
+    def __init__(self, cache: Optional[TranslationCache] = None, full_text_search: bool = True,
+                 model: Any = None, sql_validator: Optional[SQLValidator] = None,
+                 prompt_builder: Optional[PromptBuilder] = None,
+                 semantic_index: Optional[SemanticQueryIndex] = None,
+                 scheduler: Optional[LLMScheduler] = None):
+        if model is None and Config.LLM_BACKEND == "fake":
+            model = FakeGenerativeModel.from_config()
+        if model is None:
+            genai.configure(api_key=Config.GEMINI_API_KEY)
+            model = genai.GenerativeModel('gemini-2.0-flash')
+        # Tout objet exposant generate_content / generate_content_async convient
+        self.model = model
+        self.cache = cache
+        # Questions proches déjà traduites (reformulations), consultées après le cache exact
+        self.semantic_index = semantic_index
+        # Débit, concurrence et reprises des appels au LLM
+        self.scheduler = scheduler if scheduler is not None else (
+            LLMScheduler() if Config.LLM_SCHEDULER_ENABLED else None
+        )
+        # Durées des traductions abouties, hors attente (délai avant de doubler une traduction lente)
+        self.translation_latency = LatencyWindow()
+        # Sans schéma fourni, seules les vérifications de structure sont appliquées
+        self.sql_validator = sql_validator or SQLValidator()
+        
+        self.full_text_search = full_text_search
+        self.prompt_builder = prompt_builder or PromptBuilder(full_text_search=full_text_search)
         
-        # Schéma de base de données pour le contexte
-        self.db_schema = """
-        Base de données e-commerce avec les tables suivantes:
+        # Modèle de traduction dont les instructions sont dans un contexte mis en cache
+        self.translation_model = self.model
+        self.instructions_cached = False
+        if Config.GEMINI_CONTEXT_CACHE_ENABLED and isinstance(self.model, genai.GenerativeModel):
+            self._enable_context_cache()
+    
+    def _enable_context_cache(self):
+        """
+        Placer les instructions de traduction dans un contexte Gemini mis en cache
         
-        1. categories: id, name, description, parent_id
-        2. brands: id, name, description, country
-        3. products: id, name, description, price, original_price, category_id, brand_id, 
-           sku, stock_quantity, color, size, material, gender, season, is_active
-        4. orders: id, customer_email, total_amount, status, order_date, shipping_address
-        5. order_items: id, order_id, product_id, quantity, unit_price, total_price
+        L'API impose une taille minimale de contexte: si les instructions sont
+        trop courtes (ou si le cache est indisponible), elles restent envoyées
+        dans chaque prompt.
+        """
+        try:
+            cached_content = genai.caching.CachedContent.create(
+                model=Config.GEMINI_CACHED_MODEL,
+                system_instruction=self.prompt_builder.instructions,
+                ttl=datetime.timedelta(seconds=Config.GEMINI_CONTEXT_CACHE_TTL)
+            )
+            self.translation_model = genai.GenerativeModel.from_cached_content(cached_content)
+            self.instructions_cached = True
+        except Exception:
+            self.translation_model = self.model
+    
+    def warm_up(self):
+        """Charger à l'avance le contexte de schéma utilisé par les prompts"""
+        self.prompt_builder.warm_up()
+    
+    async def warm_up_llm_async(self):
+        """
+        Envoyer une requête minimale au LLM (connexion et handshake TLS établis
+        avant la première requête utilisateur)
         
-        Genres possibles: homme, femme, enfant
-        Saisons possibles: printemps, été, automne, hiver, toute_saison
-        Statuts de commande: en_attente, confirmé, expédié, livré, annulé
+        Raises:
+            Exception: Toute erreur de l'appel Gemini
         """
+        await self.model.generate_content_async(
+            self.WARM_UP_PROMPT, generation_config={"max_output_tokens": 1}
+        )
     
     def process_natural_query(self, user_query: str) -> Dict[str, Any]:
         """
@@ -40,69 +101,269 @@ class GeminiNLQProcessor:
         Returns:
             Dictionnaire contenant la requête SQL et les métadonnées
         """
-        prompt = f"""
-        Tu es un expert en SQL pour une base de données e-commerce de vêtements.
-        
-        {self.db_schema}
-        
-        Convertis cette requête en langage naturel en une requête SQL valide:
-        "{user_query}"
-        
-        Règles importantes:
-        1. Génère UNIQUEMENT une requête SELECT
-        2. Utilise des JOINs appropriés quand nécessaire
-        3. Limite les résultats à 50 maximum
-        4. Assure-toi que la requête est sécurisée (pas d'injection SQL)
-        5. Utilise des noms de colonnes clairs dans le SELECT
-        6. Si la requête concerne les prix, assure-toi d'utiliser la colonne 'price'
-        7. Pour les recherches de texte, utilise LIKE avec des wildcards appropriés
-        
-        Réponds UNIQUEMENT avec un JSON valide contenant:
-        {{
-            "sql_query": "la requête SQL générée",
-            "explanation": "explication de ce que fait la requête",
-            "filters_applied": ["liste des filtres appliqués"],
-            "confidence": "niveau de confiance entre 0 et 1"
-        }}
-        
-        Ne génère aucun autre texte en dehors du JSON.
-        Si la requête n'a pas une relation avec le contexte de la base de données et de e-commerce de vêtements, retourne ce json:
-        {{
-            "sql_query": "",
-            "explanation": "Requête non pertinente",
-            "filters_applied": [],
-            "confidence": 0.0,
-            "error": "requete hors contexte"
-
-        }}
+        if self.cache is not None:
+            cached_result = self.cache.get(user_query)
+            if cached_result is not None and self._validate_sql_query(cached_result.get('sql_query', '')):
+                return cached_result
+        
+        if self.semantic_index is not None:
+            similar_result = self.semantic_index.lookup(user_query)
+            if similar_result is not None and self._validate_sql_query(similar_result.get('sql_query', '')):
+                return similar_result
+        
+        try:
+            with stage("prompt_build"):
+                prompt = self._build_query_prompt(user_query)
+            with stage("llm_translation"):
+                response = self._generate(self.translation_model, prompt, Config.LLM_TRANSLATION_TIMEOUT_MS,
+                                          "translation", self.translation_latency)
+            record_llm_usage("translation", response)
+            result = self._parse_query_response(response.text)
+        except LLMUnavailableError as e:
+            return self._error_result(e, unavailable=True)
+        except Exception as e:
+            return self._error_result(e)
+        
+        if self.cache is not None:
+            self.cache.set(user_query, result)
+        if self.semantic_index is not None:
+            self.semantic_index.add(user_query, result)
+        return result
+    
+    async def process_natural_query_async(self, user_query: str) -> Dict[str, Any]:
+        """
+        Variante asynchrone de process_natural_query (appel Gemini non bloquant)
+        
+        Args:
+            user_query: La requête de l'utilisateur en langage naturel
+            
+        Returns:
+            Dictionnaire contenant la requête SQL et les métadonnées
+        """
+        # Le cache est une base SQLite locale: la lecture est déportée hors de la boucle
+        if self.cache is not None:
+            cached_result = await asyncio.to_thread(self.cache.get, user_query)
+            if cached_result is not None and self._validate_sql_query(cached_result.get('sql_query', '')):
+                return cached_result
+        
+        if self.semantic_index is not None:
+            similar_result = await asyncio.to_thread(self.semantic_index.lookup, user_query)
+            if similar_result is not None and self._validate_sql_query(similar_result.get('sql_query', '')):
+                return similar_result
+        
+        try:
+            with stage("prompt_build"):
+                prompt = self._build_query_prompt(user_query)
+            result = await self._translate_prompt_async(prompt)
+        except LLMUnavailableError as e:
+            return self._error_result(e, unavailable=True)
+        except Exception as e:
+            return self._error_result(e)
+        
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.set, user_query, result)
+        if self.semantic_index is not None:
+            await asyncio.to_thread(self.semantic_index.add, user_query, result)
+        return result
+    
+    def _generate(self, model: Any, prompt: str, timeout_ms: float = 0, call: str = "translation",
+                  latency: Optional[LatencyWindow] = None) -> Any:
+        """
+        Appel synchrone au LLM, via l'ordonnanceur s'il est actif
+        
+        L'échéance couvre l'attente d'une place, d'un jeton et des reprises;
+        le temps restant est transmis au client comme délai de la requête
+        (request_options), qui interrompt lui-même un appel trop long: aucun
+        appel abandonné ne continue d'occuper une place de l'ordonnanceur.
+        
+        Args:
+            timeout_ms: Échéance de l'appel (0: sans limite)
+            call: Nature de l'appel (translation / summary), pour les métriques
+            latency: Fenêtre recevant la durée des appels aboutis
+            
+        Raises:
+            LLMUnavailableError: Si l'échéance est dépassée ou l'appel refusé
+        """
+        deadline = time.monotonic() + timeout_ms / 1000 if timeout_ms else None
+        
+        def attempt() -> Any:
+            options = {}
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LLMDeadlineError("échéance atteinte avant l'appel au LLM")
+                options["request_options"] = {"timeout": remaining}
+            start = time.perf_counter()
+            try:
+                response = model.generate_content(prompt, **options)
+            except Exception as e:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise LLMDeadlineError(str(e)) from e
+                raise
+            if latency is not None:
+                latency.add(time.perf_counter() - start)
+            return response
+        
+        try:
+            if self.scheduler is None:
+                return attempt()
+            return self.scheduler.call(attempt, deadline=deadline)
+        except LLMDeadlineError as e:
+            raise self._deadline_exceeded(call, timeout_ms) from e
+    
+    async def _generate_async(self, model: Any, prompt: str, latency: Optional[LatencyWindow] = None) -> Any:
+        """
+        Appel asynchrone au LLM, via l'ordonnanceur s'il est actif
+        
+        Seule la durée d'un appel abouti est enregistrée dans latency: ni
+        l'attente d'une place ou d'un jeton, ni un appel annulé.
+        """
+        async def attempt() -> Any:
+            start = time.perf_counter()
+            response = await model.generate_content_async(prompt)
+            if latency is not None:
+                latency.add(time.perf_counter() - start)
+            return response
+        
+        if self.scheduler is None:
+            return await attempt()
+        return await self.scheduler.call_async(attempt)
+    
+    async def _with_deadline(self, awaitable: Any, timeout_ms: float, call: str) -> Any:
+        """
+        Attendre un appel au LLM au plus timeout_ms (0: sans limite)
+        
+        Raises:
+            LLMUnavailableError: Si l'échéance est dépassée (l'appel est annulé)
+        """
+        if not timeout_ms:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, timeout_ms / 1000)
+        except asyncio.TimeoutError as e:
+            raise self._deadline_exceeded(call, timeout_ms) from e
+    
+    @staticmethod
+    def _deadline_exceeded(call: str, timeout_ms: float) -> LLMUnavailableError:
+        """Compter une échéance dépassée et construire l'erreur correspondante"""
+        LLM_DEADLINES.inc(call=call)
+        return LLMUnavailableError(f"réponse du LLM non reçue dans le délai de {timeout_ms:g} ms")
+    
+    async def _translate_prompt_async(self, prompt: str) -> Dict[str, Any]:
+        """
+        Traduire un prompt, dans la limite de LLM_TRANSLATION_TIMEOUT_MS
+        
+        Si la réponse tarde au-delà du percentile LLM_HEDGE_PERCENTILE des
+        traductions récentes, une seconde requête identique est envoyée et la
+        première réponse valide (JSON et SQL acceptés) est retenue, l'autre
+        requête étant annulée. Le doublon n'est pas envoyé si l'ordonnanceur
+        n'a ni place libre ni jeton disponible: il doublerait la charge au
+        moment où le quota est le facteur limitant.
+        
+        Raises:
+            LLMUnavailableError: Si l'échéance est dépassée ou l'appel refusé
+            ValueError / SQLValidationError: Si aucune réponse n'est valide
         """
+        async def attempt() -> Dict[str, Any]:
+            response = await self._generate_async(self.translation_model, prompt, self.translation_latency)
+            record_llm_usage("translation", response)
+            return self._parse_query_response(response.text)
         
+        can_hedge = self.scheduler.has_capacity if self.scheduler is not None else (lambda: True)
+        with stage("llm_translation"):
+            return await self._with_deadline(
+                self._first_valid(attempt, self._hedge_delay(), can_hedge),
+                Config.LLM_TRANSLATION_TIMEOUT_MS, "translation"
+            )
+    
+    def _hedge_delay(self) -> Optional[float]:
+        """Délai (s) avant de doubler une traduction, None si le doublement est désactivé"""
+        if not Config.LLM_HEDGING_ENABLED:
+            return None
+        observed = self.translation_latency.percentile(Config.LLM_HEDGE_PERCENTILE, Config.LLM_HEDGE_MIN_SAMPLES)
+        if observed is None:
+            return None
+        return max(observed, Config.LLM_HEDGE_MIN_DELAY_MS / 1000)
+    
+    @staticmethod
+    async def _first_valid(attempt: Any, hedge_delay: Optional[float], can_hedge: Any) -> Any:
+        """
+        Résultat de la première tentative réussie; une seconde tentative est
+        lancée si la première n'a pas abouti après hedge_delay secondes et
+        si can_hedge() l'autorise à ce moment
+        """
+        primary = asyncio.ensure_future(attempt())
+        pending = {primary}
         try:
-            response = self.model.generate_content(prompt)
-            result_text = response.text.strip()
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+                if not done:
+                    if can_hedge():
+                        LLM_HEDGES.inc(outcome="sent")
+                        pending.add(asyncio.ensure_future(attempt()))
+                    else:
+                        LLM_HEDGES.inc(outcome="skipped")
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            LLM_HEDGES.inc(outcome="won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    def _build_query_prompt(self, user_query: str) -> str:
+        """Construire le prompt de traduction NL -> SQL"""
+        return self.prompt_builder.query_prompt(user_query, include_instructions=not self.instructions_cached)
+    
+    def _parse_query_response(self, result_text: str) -> Dict[str, Any]:
+        """
+        Extraire et valider le JSON renvoyé par Gemini
+        
+        Raises:
+            ValueError: Si la réponse n'est pas un JSON valide
+            SQLValidationError: Si la requête SQL est refusée (avant toute exécution)
+        """
+        with stage("json_extract"):
+            result_text = result_text.strip()
             
             # Nettoyer la réponse pour extraire le JSON
             json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-            if json_match:
-                json_text = json_match.group()
-                result = json.loads(json_text)
-                
-                # Validation de la requête SQL
-                if self._validate_sql_query(result.get('sql_query', '')):
-                    return result
-                else:
-                    raise ValueError("Requête SQL non valide générée")
-            else:
+            if not json_match:
                 raise ValueError("Format de réponse JSON non valide")
-                
-        except Exception as e:
-            return {
-                "sql_query": "",
-                "explanation": f"Erreur lors du traitement: {str(e)}",
-                "filters_applied": [],
-                "confidence": 0.0,
-                "error": str(e)
-            }
+            
+            result = json.loads(json_match.group())
+        
+        # Validation de la requête SQL
+        with stage("sql_validation"):
+            self.sql_validator.validate(result.get('sql_query', ''))
+        
+        return result
+    
+    def _error_result(self, error: Exception, unavailable: bool = False) -> Dict[str, Any]:
+        """
+        Construire le résultat renvoyé en cas d'échec de la traduction
+        
+        Args:
+            error: Erreur rencontrée
+            unavailable: Le LLM n'a pas pu être appelé (quota, surcharge): le
+                service peut servir une traduction de repli
+        """
+        result = {
+            "sql_query": "",
+            "explanation": f"Erreur lors du traitement: {str(error)}",
+            "filters_applied": [],
+            "confidence": 0.0,
+            "error": str(error)
+        }
+        if unavailable:
+            result["llm_unavailable"] = True
+        return result
     
     def _validate_sql_query(self, sql_query: str) -> bool:
         """
@@ -114,27 +375,7 @@ class GeminiNLQProcessor:
         Returns:
             True si la requête est valide, False sinon
         """
-        if not sql_query:
-            return False
-        
-        # Vérifications de sécurité de base
-        sql_lower = sql_query.lower().strip()
-        
-        # Doit commencer par SELECT
-        if not sql_lower.startswith('select'):
-            return False
-        
-        # Ne doit pas contenir de mots-clés dangereux
-        dangerous_keywords = [
-            'drop', 'delete', 'insert', 'update', 'alter', 'create',
-            'truncate', 'exec', 'execute', 'union', '--'
-        ]
-        
-        for keyword in dangerous_keywords:
-            if keyword in sql_lower:
-                return False
-        
-        return True
+        return self.sql_validator.is_valid(sql_query)
     
     def generate_natural_response(self, query_result: Dict[str, Any], 
                                 original_query: str) -> str:
@@ -155,27 +396,54 @@ class GeminiNLQProcessor:
         if not data:
             return "Aucun résultat trouvé pour votre recherche."
         
-        prompt = f"""
-        Tu es un assistant e-commerce expert. 
-        
-        L'utilisateur a demandé: "{original_query}"
-        
-        Voici les résultats trouvés (au format JSON):
-        {json.dumps(data[:5], ensure_ascii=False, indent=2)}
-        
-        Nombre total de résultats: {len(data)}
-        
-        Génère une réponse naturelle et utile qui:
-        1. Résume les résultats trouvés
-        2. Mentionne les informations les plus pertinentes (prix, marques, etc.)
-        3. Suggère d'autres recherches si pertinent
-        4. Reste concise mais informative
+        count = query_result.get('count', len(data))
+        try:
+            with stage("summary_prompt_build"):
+                prompt = self._build_response_prompt(data, original_query, count)
+            with stage("llm_summary"):
+                response = self._generate(self.model, prompt, Config.LLM_SUMMARY_TIMEOUT_MS, "summary")
+            record_llm_usage("summary", response)
+            return response.text.strip()
+        except Exception as e:
+            return self._fallback_response(count)
+    
+    async def generate_natural_response_async(self, query_result: Dict[str, Any],
+                                              original_query: str) -> str:
+        """
+        Variante asynchrone de generate_natural_response (appel Gemini non bloquant)
         
-        Réponds en français de manière naturelle et engageante.
+        Args:
+            query_result: Résultats de la requête SQL
+            original_query: Requête originale de l'utilisateur
+            
+        Returns:
+            Réponse en langage naturel
         """
+        if 'error' in query_result:
+            return f"Désolé, je n'ai pas pu traiter votre demande: {query_result['error']}"
         
+        data = query_result.get('data', [])
+        if not data:
+            return "Aucun résultat trouvé pour votre recherche."
+        
+        count = query_result.get('count', len(data))
         try:
-            response = self.model.generate_content(prompt)
+            with stage("summary_prompt_build"):
+                prompt = self._build_response_prompt(data, original_query, count)
+            with stage("llm_summary"):
+                response = await self._with_deadline(
+                    self._generate_async(self.model, prompt), Config.LLM_SUMMARY_TIMEOUT_MS, "summary"
+                )
+            record_llm_usage("summary", response)
             return response.text.strip()
         except Exception as e:
-            return f"Voici les résultats de votre recherche: {len(data)} produit(s) trouvé(s)."
+            return self._fallback_response(count)
+    
+    def _build_response_prompt(self, data: List[Dict[str, Any]], original_query: str,
+                               count: int) -> str:
+        """Construire le prompt de génération de la réponse naturelle"""
+        return self.prompt_builder.response_prompt(data, original_query, count)
+    
+    def _fallback_response(self, count: int) -> str:
+        """Réponse de repli lorsque Gemini ne peut pas générer de résumé"""
+        return f"Voici les résultats de votre recherche: {count} produit(s) trouvé(s)."
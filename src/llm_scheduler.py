@@ -0,0 +1,528 @@
+"""
+Module d'ordonnancement des appels au LLM (débit, concurrence, priorités, reprises, disjoncteur)
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+from config.settings import Config
+from src.metrics import LLM_SCHEDULER
+
+# Priorités des appels: les requêtes interactives passent avant les lots
+INTERACTIVE = 0
+BATCH = 1
+
+# Priorité des appels du traitement en cours (les tâches asyncio héritent du contexte)
+_priority: ContextVar[int] = ContextVar("nlq_llm_priority", default=INTERACTIVE)
+
+# Codes HTTP des erreurs transitoires (quota dépassé, erreurs serveur)
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+QUOTA_STATUS = 429
+
+
+class LLMUnavailableError(RuntimeError):
+    """Appel au LLM refusé (disjoncteur ouvert, file d'attente saturée) ou reprises épuisées"""
+
+
+class LLMDeadlineError(LLMUnavailableError):
+    """Échéance de l'appel atteinte (en attente d'une place, d'un jeton, d'une reprise ou de la réponse)"""
+
+
+@contextmanager
+def llm_priority(priority: int) -> Iterator[None]:
+    """Appliquer une priorité aux appels au LLM effectués dans le bloc"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """Code HTTP d'une erreur du client (google.api_core: .code, sinon .status_code)"""
+    code = getattr(error, "code", None)
+    if code is None:
+        code = getattr(error, "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(error: Exception) -> bool:
+    """L'erreur est-elle transitoire (quota, surcharge, réseau) ?"""
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    # google.api_core: ResourceExhausted: 429, ServiceUnavailable: 503...
+    return _status_code(error) in RETRYABLE_STATUS
+
+
+def is_quota_error(error: Exception) -> bool:
+    """L'erreur signale-t-elle un dépassement du quota (429) ?"""
+    return _status_code(error) == QUOTA_STATUS
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Délai (s) demandé par le fournisseur avant un nouvel appel (attribut ou en-tête Retry-After)"""
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        if headers is not None:
+            value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        # Date HTTP: ignorée, le délai exponentiel s'applique
+        return None
+
+
+class LatencyWindow:
+    """Durées des derniers appels, pour estimer un percentile glissant"""
+
+    def __init__(self, size: int = 200):
+        self._durations = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        """Enregistrer la durée d'un appel"""
+        with self._lock:
+            self._durations.append(seconds)
+
+    def percentile(self, percent: float, min_samples: int = 1) -> Optional[float]:
+        """Percentile des durées enregistrées (None avant min_samples appels)"""
+        with self._lock:
+            durations = sorted(self._durations)
+        if not durations or len(durations) < min_samples:
+            return None
+        index = min(len(durations) - 1, int(len(durations) * percent / 100))
+        return durations[index]
+
+
+class TokenBucket:
+    """
+    Limiteur de débit à seau de jetons, adapté aux signaux de quota
+
+    rate jetons par seconde, au plus burst accumulés. Chaque appel réserve un
+    jeton et reçoit le délai à attendre avant de l'utiliser: les appelants
+    sont servis dans l'ordre de réservation sans jamais dépasser le débit.
+
+    Le débit suit un schéma AIMD: divisé par deux à chaque dépassement de
+    quota (au plus une fois par DECREASE_INTERVAL, les appels simultanés
+    recevant la même erreur), puis augmenté de INCREASE_STEP du débit
+    nominal à chaque succès jusqu'à revenir au débit nominal. Un délai
+    Retry-After suspend la distribution des jetons.
+    """
+
+    DECREASE_FACTOR = 0.5
+    DECREASE_INTERVAL = 1.0
+    INCREASE_STEP = 0.05
+    # Débit plancher, en fraction du débit nominal
+    MIN_RATE = 0.05
+
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._last_decrease = float("-inf")
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Réserver un jeton, renvoie le délai d'attente en secondes"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            delay = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            return max(delay, self._paused_until - now)
+
+    def available(self) -> bool:
+        """Un jeton est-il disponible immédiatement (sans le réserver) ?"""
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return self._tokens >= 1 and self._paused_until <= now
+
+    def throttle(self, pause: Optional[float] = None) -> bool:
+        """
+        Quota dépassé: réduire le débit et suspendre les appels pendant pause secondes
+
+        Returns:
+            True si le débit a été réduit
+        """
+        if self.max_rate <= 0:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if pause:
+                self._paused_until = max(self._paused_until, now + pause)
+            if now - self._last_decrease < self.DECREASE_INTERVAL:
+                return False
+            self._refill(now)
+            self.rate = max(self.max_rate * self.MIN_RATE, self.rate * self.DECREASE_FACTOR)
+            self._last_decrease = now
+            return True
+
+    def recover(self):
+        """Appel réussi: remonter progressivement vers le débit nominal"""
+        if self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.max_rate * self.INCREASE_STEP)
+
+    def _refill(self, now: float):
+        """Ajouter les jetons accumulés depuis la dernière mise à jour (au débit courant)"""
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur: après failure_threshold échecs consécutifs, les appels sont
+    refusés pendant reset_timeout secondes, puis un seul appel d'essai est
+    autorisé; son succès referme le circuit, son échec le rouvre.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        # Ouverture du circuit, puis début de l'appel d'essai
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Un appel peut-il être tenté ?"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            # Circuit ouvert depuis reset_timeout, ou essai resté sans réponse: nouvel essai
+            if now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._opened_at = now
+                return True
+            return False
+
+    def record_success(self):
+        """Le LLM a répondu: refermer le circuit"""
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        """Erreur transitoire: ouvrir le circuit au-delà du seuil (ou si l'essai a échoué)"""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class _Waiter:
+    """Appelant en attente d'une place, réveillé par wake()"""
+
+    __slots__ = ("wake", "granted", "cancelled")
+
+    def __init__(self, wake: Callable[[], None]):
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+
+def _resolve(future: asyncio.Future):
+    """Réveiller un appelant asynchrone (depuis sa boucle d'événements)"""
+    if not future.done():
+        future.set_result(None)
+
+
+class PrioritySlots:
+    """
+    Nombre borné d'appels simultanés
+
+    Une place libérée est confiée directement à l'appelant en attente le plus
+    prioritaire (puis le plus ancien). Les appelants synchrones (threads) et
+    asynchrones partagent les mêmes places.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.in_use = 0
+        self._waiters: List[tuple] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        """Nombre d'appelants en attente"""
+        with self._lock:
+            return sum(not waiter.cancelled for _, _, waiter in self._waiters)
+
+    def free(self) -> bool:
+        """Une place est-elle libre, sans appelant en attente ?"""
+        with self._lock:
+            return self.in_use < self.size and not any(not waiter.cancelled for _, _, waiter in self._waiters)
+
+    def acquire(self, priority: int, timeout: Optional[float]) -> bool:
+        """Obtenir une place (False si le délai est écoulé)"""
+        with self._lock:
+            if self.in_use < self.size and not self._waiters:
+                self.in_use += 1
+                return True
+            event = threading.Event()
+            waiter = _Waiter(event.set)
+            heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        if event.wait(timeout):
+            return True
+        return self._abandon(waiter)
+
+    async def acquire_async(self, priority: int, timeout: Optional[float]) -> bool:
+        """Variante asynchrone de acquire"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.in_use < self.size and not self._waiters:
+                self.in_use += 1
+                return True
+            future = loop.create_future()
+            waiter = _Waiter(lambda: loop.call_soon_threadsafe(_resolve, future))
+            heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self._abandon(waiter)
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release()
+            raise
+
+    def release(self):
+        """Libérer une place, confiée au premier appelant en attente"""
+        with self._lock:
+            while self._waiters:
+                _, _, waiter = heapq.heappop(self._waiters)
+                if not waiter.cancelled:
+                    waiter.granted = True
+                    waiter.wake()
+                    return
+            self.in_use -= 1
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Renoncer à attendre; True si la place a été attribuée entre-temps"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            return False
+
+
+class LLMScheduler:
+    """
+    Ordonnanceur des appels au LLM
+
+    Chaque appel obtient une place parmi max_concurrency (par priorité), puis
+    un jeton du seau (débit du quota, réduit après un 429 et rétabli
+    progressivement). Les erreurs transitoires (429, 5xx, réseau) sont reprises avec un délai exponentiel à gigue complète; au-delà
+    de max_retries, ou si le disjoncteur s'ouvre, LLMUnavailableError est
+    levée pour que l'appelant serve une réponse de repli au lieu d'attendre.
+    Les limites s'appliquent par processus worker.
+    """
+
+    def __init__(self, requests_per_minute: float = None, burst: int = None, max_concurrency: int = None,
+                 max_retries: int = None, backoff_base_ms: float = None, backoff_max_ms: float = None,
+                 queue_timeout: float = None, failure_threshold: int = None, reset_timeout: float = None,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            requests_per_minute: Débit maximal (0 = illimité)
+            burst: Appels pouvant partir d'un coup après une période calme
+            max_concurrency: Appels simultanés
+            max_retries: Reprises d'un appel après une erreur transitoire
+            backoff_base_ms / backoff_max_ms: Délai de la première reprise, plafond des délais
+            queue_timeout: Attente maximale d'une place (secondes)
+            failure_threshold / reset_timeout: Échecs consécutifs ouvrant le disjoncteur, durée d'ouverture (s)
+            seed: Graine de la gigue (tests)
+        """
+        rate = requests_per_minute if requests_per_minute is not None else Config.LLM_REQUESTS_PER_MINUTE
+        self.bucket = TokenBucket(rate / 60, burst or Config.LLM_BURST)
+        self.slots = PrioritySlots(max_concurrency or Config.LLM_MAX_CONCURRENCY)
+        self.max_retries = max_retries if max_retries is not None else Config.LLM_MAX_RETRIES
+        self.backoff_base = (backoff_base_ms if backoff_base_ms is not None else Config.LLM_BACKOFF_BASE_MS) / 1000
+        self.backoff_max = (backoff_max_ms if backoff_max_ms is not None else Config.LLM_BACKOFF_MAX_MS) / 1000
+        self.queue_timeout = queue_timeout if queue_timeout is not None else Config.LLM_QUEUE_TIMEOUT
+        self.breaker = CircuitBreaker(
+            failure_threshold or Config.LLM_CIRCUIT_FAILURES,
+            reset_timeout if reset_timeout is not None else Config.LLM_CIRCUIT_RESET
+        )
+        self._random = random.Random(seed)
+
+    def call(self, func: Callable[[], Any], priority: Optional[int] = None,
+             deadline: Optional[float] = None) -> Any:
+        """
+        Exécuter un appel synchrone au LLM
+
+        Args:
+            func: Appel au LLM (une tentative)
+            priority: Priorité de l'appel (par défaut celle du contexte)
+            deadline: Échéance (time.monotonic()) au-delà de laquelle l'appel
+                n'attend plus de place, de jeton ni de reprise
+
+        Raises:
+            LLMDeadlineError: Échéance atteinte avant l'appel ou avant une reprise
+            LLMUnavailableError: Appel refusé ou reprises épuisées
+            Exception: Erreur non transitoire de l'appel (requête invalide...)
+        """
+        self._check_circuit()
+        if not self.slots.acquire(self._priority(priority), self._wait_timeout(deadline)):
+            raise self._queue_rejected(deadline)
+        try:
+            attempt = 0
+            while True:
+                time.sleep(self._before_deadline(self.bucket.reserve(), deadline))
+                try:
+                    result = func()
+                except Exception as e:
+                    attempt = self._after_failure(e, attempt)
+                    time.sleep(self._before_deadline(self._backoff(attempt, e), deadline))
+                    continue
+                self._after_success()
+                return result
+        finally:
+            self.slots.release()
+
+    async def call_async(self, func: Callable[[], Awaitable[Any]], priority: Optional[int] = None,
+                         deadline: Optional[float] = None) -> Any:
+        """
+        Exécuter un appel asynchrone au LLM (func renvoie une coroutine à chaque tentative)
+
+        Raises:
+            LLMDeadlineError: Échéance atteinte avant l'appel ou avant une reprise
+            LLMUnavailableError: Appel refusé ou reprises épuisées
+            Exception: Erreur non transitoire de l'appel (requête invalide...)
+        """
+        self._check_circuit()
+        if not await self.slots.acquire_async(self._priority(priority), self._wait_timeout(deadline)):
+            raise self._queue_rejected(deadline)
+        try:
+            attempt = 0
+            while True:
+                await asyncio.sleep(self._before_deadline(self.bucket.reserve(), deadline))
+                try:
+                    result = await func()
+                except Exception as e:
+                    attempt = self._after_failure(e, attempt)
+                    await asyncio.sleep(self._before_deadline(self._backoff(attempt, e), deadline))
+                    continue
+                self._after_success()
+                return result
+        finally:
+            self.slots.release()
+
+    def has_capacity(self) -> bool:
+        """Un appel supplémentaire partirait-il immédiatement (place libre et jeton disponible) ?"""
+        return self.breaker.state == CircuitBreaker.CLOSED and self.slots.free() and self.bucket.available()
+
+    def stats(self) -> Dict[str, Any]:
+        """État courant: disjoncteur, débit adapté au quota, places occupées et appelants en attente"""
+        return {
+            "circuit": self.breaker.state,
+            "rate_per_minute": round(self.bucket.rate * 60, 3),
+            "consecutive_failures": self.breaker.failures,
+            "in_flight": self.slots.in_use,
+            "waiting": self.slots.waiting,
+            "max_concurrency": self.slots.size
+        }
+
+    @staticmethod
+    def _priority(priority: Optional[int]) -> int:
+        """Priorité explicite, sinon celle du contexte"""
+        return _priority.get() if priority is None else priority
+
+    def _wait_timeout(self, deadline: Optional[float]) -> float:
+        """Attente maximale d'une place: queue_timeout, ou moins si l'échéance est plus proche"""
+        if deadline is None:
+            return self.queue_timeout
+        return max(0.0, min(self.queue_timeout, deadline - time.monotonic()))
+
+    def _queue_rejected(self, deadline: Optional[float]) -> LLMUnavailableError:
+        """Erreur d'un appel resté sans place (échéance atteinte ou file saturée)"""
+        if deadline is not None and time.monotonic() >= deadline:
+            return LLMDeadlineError("échéance atteinte en attente d'une place")
+        return self._rejected("queue_timeout", "file d'attente du LLM saturée")
+
+    @staticmethod
+    def _before_deadline(delay: float, deadline: Optional[float]) -> float:
+        """
+        Délai d'attente (jeton, reprise), s'il se termine avant l'échéance
+
+        Raises:
+            LLMDeadlineError: Si l'attente dépasserait l'échéance
+        """
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            raise LLMDeadlineError("échéance atteinte avant l'appel au LLM")
+        return delay
+
+    def _check_circuit(self):
+        """Refuser immédiatement l'appel si le disjoncteur est ouvert"""
+        if not self.breaker.allow():
+            raise self._rejected("circuit_open", "LLM temporairement indisponible (disjoncteur ouvert)")
+
+    def _after_failure(self, error: Exception, attempt: int) -> int:
+        """
+        Traiter l'échec d'une tentative, renvoie le numéro de la reprise
+
+        Raises:
+            Exception: L'erreur elle-même si elle n'est pas transitoire
+            LLMUnavailableError: Si les reprises sont épuisées ou le disjoncteur ouvert
+        """
+        if isinstance(error, LLMUnavailableError):
+            # Échéance de l'appelant: ni reprise ni effet sur le disjoncteur
+            raise error
+        if not is_retryable(error):
+            # Le LLM a répondu (requête refusée): le service est disponible
+            self.breaker.record_success()
+            raise error
+        if is_quota_error(error) and self.bucket.throttle(retry_after(error)):
+            LLM_SCHEDULER.inc(event="throttled")
+        self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            raise self._rejected("exhausted", f"LLM indisponible après {attempt + 1} tentative(s): {error}") from error
+        if self.breaker.state == CircuitBreaker.OPEN:
+            raise self._rejected("circuit_open", f"LLM temporairement indisponible: {error}") from error
+        LLM_SCHEDULER.inc(event="retry")
+        return attempt + 1
+
+    def _after_success(self):
+        """Le LLM a répondu: refermer le circuit et remonter le débit"""
+        self.breaker.record_success()
+        self.bucket.recover()
+
+    def _backoff(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """
+        Délai avant la reprise (gigue complète: uniforme entre 0 et le délai
+        exponentiel), au moins le Retry-After demandé par le fournisseur
+        """
+        delay = self._random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        requested = retry_after(error) if error is not None else None
+        return max(delay, requested or 0.0)
+
+    @staticmethod
+    def _rejected(event: str, message: str) -> LLMUnavailableError:
+        """Compter un appel abandonné et construire l'erreur correspondante"""
+        LLM_SCHEDULER.inc(event=event)
+        return LLMUnavailableError(message)
@@ -0,0 +1,208 @@
+"""
+Module de mesure des performances (histogrammes par étape, format Prometheus)
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+# Bornes des histogrammes de durée, en secondes
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 500, 1000, 5000, 10000)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+def _escape(value: Any) -> str:
+    """Échapper une valeur d'étiquette Prometheus"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    """Formater les étiquettes d'une série Prometheus"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Compteur monotone, éventuellement décliné par étiquettes"""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        """Incrémenter la série correspondant aux étiquettes"""
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        """Lignes au format texte Prometheus"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Histogramme à bornes fixes, éventuellement décliné par étiquettes"""
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = DURATION_BUCKETS,
+                 labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labels = labels
+        # Par série: [compteurs par borne (+Inf en dernier), somme]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        """Enregistrer une observation"""
+        key = tuple(labels[name] for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        """Lignes au format texte Prometheus (bornes cumulées)"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Ensemble des métriques exposées par /metrics"""
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def counter(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Counter:
+        """Déclarer un compteur"""
+        metric = Counter(name, documentation, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, buckets: Tuple[float, ...] = DURATION_BUCKETS,
+                  labels: Tuple[str, ...] = ()) -> Histogram:
+        """Déclarer un histogramme"""
+        metric = Histogram(name, documentation, buckets, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Exporter toutes les métriques au format texte Prometheus"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    "nlq_stage_duration_seconds", "Durée de chaque étape du traitement d'une requête", labels=("stage",)
+)
+QUERY_DURATION = REGISTRY.histogram(
+    "nlq_query_duration_seconds", "Durée totale du traitement d'une requête", labels=("outcome",)
+)
+RESULT_ROWS = REGISTRY.histogram(
+    "nlq_result_rows", "Nombre de lignes renvoyées par requête SQL", buckets=ROW_BUCKETS
+)
+LLM_TOKENS = REGISTRY.histogram(
+    "nlq_llm_tokens", "Tokens consommés par appel au LLM", buckets=TOKEN_BUCKETS, labels=("call", "kind")
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "nlq_cache_lookups_total", "Consultations des caches", labels=("cache", "result")
+)
+TRANSLATIONS = REGISTRY.counter(
+    "nlq_translations_total", "Traductions NL -> SQL par origine", labels=("source",)
+)
+LLM_SCHEDULER = REGISTRY.counter(
+    "nlq_llm_scheduler_events_total",
+    "Reprises et refus des appels au LLM (retry, throttled, queue_timeout, circuit_open, exhausted)",
+    labels=("event",)
+)
+LLM_HEDGES = REGISTRY.counter(
+    "nlq_llm_hedged_requests_total",
+    "Traductions doublées après le p95 observé (sent), doublons gagnants (won) ou non envoyés faute de capacité (skipped)",
+    labels=("outcome",)
+)
+LLM_DEADLINES = REGISTRY.counter(
+    "nlq_llm_deadline_exceeded_total", "Appels au LLM abandonnés à l'échéance de leur étape", labels=("call",)
+)
+SINGLE_FLIGHT = REGISTRY.counter(
+    "nlq_single_flight_total", "Requêtes traitées (leader) ou partagées avec une requête identique en cours (follower)",
+    labels=("role",)
+)
+
+# Durées (ms) par étape de la requête en cours, si elles sont demandées
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("nlq_request_timings", default=None)
+
+
+def record_stage(name: str, seconds: float):
+    """Enregistrer la durée d'une étape (histogramme et requête en cours)"""
+    STAGE_DURATION.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds * 1000
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Chronométrer le bloc comme une étape du traitement"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+@contextmanager
+def track_request() -> Iterator[Dict[str, float]]:
+    """
+    Collecter les durées des étapes de la requête en cours
+
+    Le dictionnaire est partagé par le contexte courant et ses copies (threads
+    du pool, asyncio.to_thread): les étapes exécutées hors de la boucle y sont
+    aussi enregistrées.
+    """
+    timings: Dict[str, float] = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def record_llm_usage(call: str, response: Any):
+    """Enregistrer les tokens d'une réponse du LLM (si l'API les fournit)"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for kind, attribute in (("prompt", "prompt_token_count"), ("completion", "candidates_token_count")):
+        count = getattr(usage, attribute, None)
+        if count:
+            LLM_TOKENS.observe(count, call=call, kind=kind)
@@ -1,101 +1,592 @@
 """
 Service principal pour le traitement des requêtes NLQ
 """
-from typing import Dict, Any, List
-from src.database_manager import DatabaseManager
+import asyncio
+import contextvars
+import functools
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, AsyncIterator, Iterator, List, Optional, Union
+from src.columnar import ColumnarResult
+from src.database_manager import DatabaseManager, QueryTooExpensiveError
+from src.database_stats import DatabaseStats
 from src.gemini_processor import GeminiNLQProcessor
+from src.metrics import QUERY_DURATION, TRANSLATIONS, stage, track_request
+from src.llm_scheduler import BATCH, llm_priority
+from src.pagination import ResultPager, decode_cursor, encode_cursor
+from src.prompt_builder import PromptBuilder
+from src.query_budget import QueryCostGuard
+from src.query_cache import TranslationCache, normalize_query
+from src.result_store import ResultStore
+from src.result_summarizer import summarize_results
+from src.semantic_index import SemanticQueryIndex
+from src.single_flight import AsyncSingleFlight, SingleFlight
+from src.sql_validator import SQLValidator
+from src.rule_based_parser import RuleBasedQueryParser
 from config.settings import Config
 
 class NLQService:
     """Service principal pour traiter les requêtes en langage naturel"""
     
-    def __init__(self):
-        self.db_manager = DatabaseManager()
-        self.nlq_processor = GeminiNLQProcessor()
+    # Nombre de lignes transmises à Gemini pour résumer un résultat
+    SUMMARY_SAMPLE_SIZE = 5
     
-    def process_query(self, user_query: str) -> Dict[str, Any]:
+    # Modes de génération de la réponse naturelle:
+    # - llm: résumé Gemini calculé avant de répondre
+    # - template: résumé local immédiat (nombre, fourchette de prix, marques)
+    # - deferred: résumé local immédiat, résumé Gemini disponible ensuite via get_summary
+    SUMMARY_MODES = ("llm", "template", "deferred")
+    
+    # Formats du champ data: une liste de dictionnaires ("rows") ou une liste
+    # de valeurs par colonne ("columnar", noms de colonnes dans "columns")
+    RESULT_FORMATS = ("rows", "columnar")
+    
+    def __init__(self, db_manager: Optional[DatabaseManager] = None,
+                 nlq_processor: Optional[GeminiNLQProcessor] = None):
+        self.db_manager = db_manager or DatabaseManager()
+        self.translation_cache = TranslationCache() if Config.TRANSLATION_CACHE_ENABLED else None
+        self.sql_validator = SQLValidator.from_database(self.db_manager)
+        self.rule_parser = RuleBasedQueryParser(self.db_manager) if Config.RULE_BASED_ENABLED else None
+        self.semantic_index = None
+        if nlq_processor is None and Config.SEMANTIC_CACHE_ENABLED:
+            # Termes clés comparés via les vocabulaires du catalogue (homme / femme, marques...)
+            self.semantic_index = SemanticQueryIndex(
+                key_terms=self.rule_parser.key_terms if self.rule_parser is not None else None
+            )
+        self.nlq_processor = nlq_processor or GeminiNLQProcessor(
+            cache=self.translation_cache, full_text_search=self.db_manager.fts_enabled,
+            sql_validator=self.sql_validator,
+            prompt_builder=PromptBuilder(self.db_manager, full_text_search=self.db_manager.fts_enabled),
+            semantic_index=self.semantic_index
+        )
+        self.cost_guard = (QueryCostGuard(self.db_manager, self.sql_validator)
+                           if Config.QUERY_PLAN_CHECK_ENABLED else None)
+        self.result_store = ResultStore()
+        self.pager = ResultPager(self.db_manager, self.sql_validator) if Config.PAGINATION_ENABLED else None
+        self.database_stats = DatabaseStats(self.db_manager)
+        self.single_flight = SingleFlight() if Config.SINGLE_FLIGHT_ENABLED else None
+    
+    def warm_up(self) -> Dict[str, float]:
+        """
+        Préparer le service avant la première requête
+        
+        Ouvre les connexions de lecture du pool et charge les caches dérivés de
+        la base: contexte de schéma des prompts, vocabulaires des règles, index
+        des questions proches et statistiques du catalogue.
+        
+        Returns:
+            Durée de chaque étape en millisecondes
+        """
+        steps = [("db_pool", self.db_manager.warm_up)]
+        processor_warm_up = getattr(self.nlq_processor, "warm_up", None)
+        if processor_warm_up is not None:
+            steps.append(("schema", processor_warm_up))
+        if self.rule_parser is not None:
+            steps.append(("vocabulary", self.rule_parser.refresh_vocabulary))
+        if self.semantic_index is not None:
+            steps.append(("semantic_index", self.semantic_index.warm_up))
+        steps.append(("stats", self.database_stats.get))
+        
+        timings = {}
+        for name, func in steps:
+            start = time.perf_counter()
+            func()
+            timings[name] = round((time.perf_counter() - start) * 1000, 3)
+        return timings
+    
+    def process_query(self, user_query: str, summary_mode: str = "llm", include_timings: bool = False,
+                      limit: Optional[int] = None, result_format: str = "rows",
+                      paginate: bool = False) -> Dict[str, Any]:
         """
         Traiter une requête utilisateur complète
         
         Args:
             user_query: Requête de l'utilisateur en langage naturel
+            summary_mode: Mode de génération de la réponse naturelle (voir SUMMARY_MODES)
+            include_timings: Joindre à la réponse la durée de chaque étape (champ "timings")
+            limit: Nombre maximal de lignes (défaut Config.DEFAULT_LIMIT, plafonné à MAX_RESULT_LIMIT)
+            result_format: Format du champ data (voir RESULT_FORMATS)
+            paginate: Conserver la requête d'un résultat incomplet pour en lire
+                les pages suivantes (result_id et next_cursor dans la réponse)
             
         Returns:
             Dictionnaire contenant les résultats et métadonnées
         """
-        # Validation de la requête
-        if not user_query or len(user_query.strip()) == 0:
-            return {
-                "success": False,
-                "error": "Requête vide",
-                "data": [],
-                "natural_response": "Veuillez saisir une requête valide."
-            }
-        
-        if len(user_query) > Config.MAX_QUERY_LENGTH:
-            return {
-                "success": False,
-                "error": "Requête trop longue",
-                "data": [],
-                "natural_response": f"Votre requête dépasse la limite de {Config.MAX_QUERY_LENGTH} caractères."
-            }
+        with track_request() as timings:
+            start = time.perf_counter()
+            if self.single_flight is None:
+                response = self._process_query(user_query, summary_mode, limit, result_format, paginate)
+            else:
+                # Copie: chaque appelant reçoit son propre dictionnaire (timings...)
+                response = dict(self.single_flight.do(
+                    self._flight_key(user_query, summary_mode, limit, result_format, paginate),
+                    lambda: self._process_query(user_query, summary_mode, limit, result_format, paginate)
+                ))
+            return self._record_query(response, timings, start, include_timings)
+    
+    def _process_query(self, user_query: str, summary_mode: str, limit: Optional[int],
+                       result_format: str = "rows", paginate: bool = False) -> Dict[str, Any]:
+        """Traitement d'une requête, sans la mesure globale (voir process_query)"""
+        invalid_response = self._check_user_query(user_query, summary_mode, result_format)
+        if invalid_response is not None:
+            return invalid_response
         
         try:
-            # 1. Traiter la requête avec Gemini
-            nlq_result = self.nlq_processor.process_natural_query(user_query)
+            # 1. Traduire la requête (règles locales, sinon Gemini)
+            nlq_result = self._translate(user_query)
             
-            if 'error' in nlq_result:
-                return {
-                    "success": False,
-                    "error": nlq_result['error'],
-                    "data": [],
-                    "natural_response": "Je n'ai pas pu comprendre votre requête. Pouvez-vous la reformuler?"
-                }
+            translation_error = self._check_translation(nlq_result)
+            if translation_error is not None:
+                return translation_error
+            translated_sql = nlq_result['sql_query']
+            nlq_result = self._apply_limit(nlq_result, limit)
             
             # 2. Exécuter la requête SQL
-            sql_query = nlq_result.get('sql_query', '')
-            if not sql_query:
-                return {
-                    "success": False,
-                    "error": "Aucune requête SQL générée",
-                    "data": [],
-                    "natural_response": "Je n'ai pas pu générer une requête appropriée."
-                }
-            
-            # Exécuter la requête
-            query_results = self.db_manager.execute_query(sql_query)
+            query_results = self._execute_sql(nlq_result, result_format)
             
             # 3. Générer une réponse naturelle
-            result_data = {
-                "data": query_results,
-                "sql_query": sql_query,
-                "explanation": nlq_result.get('explanation', ''),
-                "filters_applied": nlq_result.get('filters_applied', []),
-                "confidence": nlq_result.get('confidence', 0.0)
-            }
+            result_data = self._build_result_data(nlq_result, query_results)
+            if summary_mode == "llm":
+                natural_response = self.nlq_processor.generate_natural_response(
+                    self._summary_input(query_results), user_query
+                )
+            else:
+                with stage("template_summary"):
+                    natural_response = summarize_results(self._result_rows(query_results))
+            
+            # 4. Conserver le résultat pour le résumé différé et les pages suivantes
+            pagination = self._plan_pagination(translated_sql, user_query, query_results, limit, paginate)
+            result_id = None
+            if summary_mode == "deferred" or pagination is not None:
+                result_id = self.result_store.put(self._result_payload(
+                    user_query, nlq_result, query_results, result_format, pagination,
+                    natural_response if summary_mode == "llm" else None
+                ))
+            
+            return self._build_success_response(
+                result_data, natural_response, result_id, self._first_cursor(query_results, pagination)
+            )
+            
+        except QueryTooExpensiveError as e:
+            return self._too_expensive_response(e)
+        except Exception as e:
+            return self._error_response(
+                str(e), "Une erreur s'est produite lors du traitement de votre requête."
+            )
+    
+    def stream_query(self, user_query: str, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Traiter une requête utilisateur en produisant les résultats au fil de l'eau
+        
+        Les événements sont émis dans l'ordre: "metadata" (requête SQL et
+        explication), un ou plusieurs "rows" (blocs de lignes lus sur le
+        curseur), puis "summary" (nombre total et réponse naturelle). Seul un
+        échantillon des premières lignes est conservé pour le résumé.
+        
+        Args:
+            user_query: Requête de l'utilisateur en langage naturel
+            limit: Nombre maximal de lignes diffusées (défaut et plafond: Config.STREAM_MAX_ROWS)
+            
+        Yields:
+            Dictionnaires d'événements sérialisables en NDJSON
+        """
+        invalid_response = self._check_user_query(user_query)
+        if invalid_response is not None:
+            yield self._error_event(invalid_response)
+            return
+        
+        try:
+            nlq_result = self._translate(user_query)
+            
+            translation_error = self._check_translation(nlq_result)
+            if translation_error is not None:
+                yield self._error_event(translation_error)
+                return
+            nlq_result = self._apply_limit(nlq_result, limit or Config.STREAM_MAX_ROWS, Config.STREAM_MAX_ROWS)
+            
+            chunks = self._iter_sql(nlq_result)
+            yield self._metadata_event(nlq_result)
+            
+            sample, count = [], 0
+            for rows in chunks:
+                sample.extend(rows[:self.SUMMARY_SAMPLE_SIZE - len(sample)])
+                count += len(rows)
+                yield {"event": "rows", "rows": rows}
             
             natural_response = self.nlq_processor.generate_natural_response(
-                result_data, user_query
+                {"data": sample, "count": count}, user_query
             )
+            yield self._summary_event(count, natural_response)
             
+        except QueryTooExpensiveError as e:
+            yield self._error_event(self._too_expensive_response(e))
+        except Exception as e:
+            yield self._error_event(self._error_response(
+                str(e), "Une erreur s'est produite lors du traitement de votre requête."
+            ))
+    
+    def _translate(self, user_query: str) -> Dict[str, Any]:
+        """Traduire une requête: chemin rapide par règles, Gemini en repli"""
+        rule_result = self._parse_rules(user_query)
+        if rule_result is not None:
+            return rule_result
+        TRANSLATIONS.inc(source="llm")
+        nlq_result = self.nlq_processor.process_natural_query(user_query)
+        if nlq_result.get('llm_unavailable'):
+            return self._fallback_translation(user_query, nlq_result)
+        return nlq_result
+    
+    def _fallback_translation(self, user_query: str, nlq_result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Traduction de repli quand le LLM est indisponible (quota, disjoncteur ouvert)
+        
+        Le SQL d'une question proche déjà traduite (seuil abaissé à
+        LLM_FALLBACK_SIMILARITY), sinon la traduction par règles en ignorant
+        les mots inconnus; à défaut, le résultat d'erreur est conservé.
+        """
+        fallback = None
+        if self.semantic_index is not None:
+            similar_result = self.semantic_index.lookup(user_query, Config.LLM_FALLBACK_SIMILARITY)
+            if similar_result is not None and self.sql_validator.is_valid(similar_result.get('sql_query', '')):
+                fallback = similar_result
+        if fallback is None and self.rule_parser is not None:
+            with stage("rules"):
+                fallback = self.rule_parser.parse(user_query, lenient=True)
+        if fallback is None:
+            return nlq_result
+        
+        TRANSLATIONS.inc(source="fallback")
+        return {
+            **fallback,
+            "explanation": f"Réponse approximative (traduction indisponible): {fallback.get('explanation', '')}"
+        }
+    
+    def _parse_rules(self, user_query: str) -> Optional[Dict[str, Any]]:
+        """Tenter la traduction par règles locales (None si elle ne s'applique pas)"""
+        if self.rule_parser is None:
+            return None
+        with stage("rules"):
+            rule_result = self.rule_parser.parse(user_query)
+        if rule_result is not None:
+            TRANSLATIONS.inc(source="rules")
+        return rule_result
+    
+    @staticmethod
+    def _flight_key(user_query: str, summary_mode: str, limit: Optional[int], result_format: str = "rows",
+                    paginate: bool = False) -> tuple:
+        """Clé des requêtes équivalentes, partageant un même traitement en cours"""
+        return normalize_query(user_query or ""), summary_mode, limit or Config.DEFAULT_LIMIT, result_format, paginate
+    
+    @staticmethod
+    def _record_query(response: Dict[str, Any], timings: Dict[str, float], start: float,
+                      include_timings: bool) -> Dict[str, Any]:
+        """Mesurer la durée totale d'une requête et joindre les étapes si demandé"""
+        elapsed = time.perf_counter() - start
+        QUERY_DURATION.observe(elapsed, outcome="success" if response.get("success") else "error")
+        if include_timings:
+            response["timings"] = {
+                **{name: round(ms, 3) for name, ms in timings.items()},
+                "total": round(elapsed * 1000, 3)
+            }
+        return response
+    
+    def _apply_limit(self, nlq_result: Dict[str, Any], limit: Optional[int],
+                     max_limit: Optional[int] = None) -> Dict[str, Any]:
+        """Copie de la traduction dont la requête SQL est bornée en nombre de lignes"""
+        return {**nlq_result, 'sql_query': self.sql_validator.apply_limit(nlq_result['sql_query'], limit, max_limit)}
+    
+    def _check_cost(self, nlq_result: Dict[str, Any]):
+        """Refuser la requête SQL si son plan d'exécution est trop coûteux"""
+        if self.cost_guard is not None:
+            with stage("query_plan"):
+                self.cost_guard.check(nlq_result['sql_query'], self._sql_params(nlq_result))
+    
+    def _execute_sql(self, nlq_result: Dict[str, Any],
+                     result_format: str = "rows") -> Union[List[Dict[str, Any]], ColumnarResult]:
+        """
+        Exécuter la requête SQL traduite dans son budget (plan vérifié, durée bornée)
+        
+        Le plan n'est vérifié que si la requête n'est pas servie par le cache
+        de résultats: un succès du cache n'exécute rien sur SQLite.
+        """
+        execute = (self.db_manager.execute_query_columnar if result_format == "columnar"
+                   else self.db_manager.execute_query)
+        return execute(nlq_result['sql_query'], self._sql_params(nlq_result), timeout_ms=Config.QUERY_TIMEOUT_MS,
+                       before_execute=lambda: self._check_cost(nlq_result))
+    
+    def _result_rows(self, query_results: Union[List[Dict[str, Any]], ColumnarResult],
+                     limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Lignes (dictionnaires) d'un résultat, quel que soit son format"""
+        if isinstance(query_results, ColumnarResult):
+            return query_results.rows(limit)
+        return query_results[:limit]
+    
+    def _iter_sql(self, nlq_result: Dict[str, Any]) -> Iterator[List[Dict[str, Any]]]:
+        """Vérifier le plan puis lire la requête SQL traduite par blocs, dans son budget"""
+        self._check_cost(nlq_result)
+        return self.db_manager.iter_query(
+            nlq_result['sql_query'], self._sql_params(nlq_result), timeout_ms=Config.QUERY_TIMEOUT_MS
+        )
+    
+    @staticmethod
+    def _sql_params(nlq_result: Dict[str, Any]) -> tuple:
+        """Paramètres de la requête SQL (seules les traductions par règles en ont)"""
+        return tuple(nlq_result.get('sql_params', ()))
+    
+    def _metadata_event(self, nlq_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Premier événement d'un flux: la requête SQL et ses métadonnées"""
+        return {
+            "event": "metadata",
+            "sql_query": nlq_result.get('sql_query', ''),
+            "explanation": nlq_result.get('explanation', ''),
+            "filters_applied": nlq_result.get('filters_applied', []),
+            "confidence": nlq_result.get('confidence', 0.0)
+        }
+    
+    def _summary_event(self, count: int, natural_response: str) -> Dict[str, Any]:
+        """Dernier événement d'un flux: le nombre total de lignes et la réponse naturelle"""
+        return {
+            "event": "summary",
+            "success": True,
+            "count": count,
+            "natural_response": natural_response
+        }
+    
+    def _error_event(self, error_response: Dict[str, Any]) -> Dict[str, Any]:
+        """Événement terminal d'un flux en échec"""
+        return {
+            "event": "error",
+            "success": False,
+            "error": error_response["error"],
+            "natural_response": error_response["natural_response"]
+        }
+    
+    def _check_user_query(self, user_query: str, summary_mode: str = "llm",
+                          result_format: str = "rows") -> Optional[Dict[str, Any]]:
+        """Valider la requête utilisateur, retourne la réponse d'erreur le cas échéant"""
+        if summary_mode not in self.SUMMARY_MODES:
+            return self._error_response(
+                "Mode de résumé inconnu",
+                f"Les modes de résumé disponibles sont: {', '.join(self.SUMMARY_MODES)}."
+            )
+        
+        if result_format not in self.RESULT_FORMATS:
+            return self._error_response(
+                "Format de résultat inconnu",
+                f"Les formats disponibles sont: {', '.join(self.RESULT_FORMATS)}."
+            )
+        
+        if not user_query or len(user_query.strip()) == 0:
+            return self._error_response("Requête vide", "Veuillez saisir une requête valide.")
+        
+        if len(user_query) > Config.MAX_QUERY_LENGTH:
+            return self._error_response(
+                "Requête trop longue",
+                f"Votre requête dépasse la limite de {Config.MAX_QUERY_LENGTH} caractères."
+            )
+        
+        return None
+    
+    def _check_translation(self, nlq_result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Vérifier le résultat de la traduction NL -> SQL, retourne la réponse d'erreur le cas échéant"""
+        if nlq_result.get('llm_unavailable'):
+            return self._error_response(
+                nlq_result['error'],
+                "Le service de traduction est momentanément saturé. Veuillez réessayer dans quelques instants."
+            )
+        
+        if 'error' in nlq_result:
+            return self._error_response(
+                nlq_result['error'],
+                "Je n'ai pas pu comprendre votre requête. Pouvez-vous la reformuler?"
+            )
+        
+        if not nlq_result.get('sql_query', ''):
+            return self._error_response(
+                "Aucune requête SQL générée",
+                "Je n'ai pas pu générer une requête appropriée."
+            )
+        
+        return None
+    
+    def _build_result_data(self, nlq_result: Dict[str, Any],
+                           query_results: Union[List[Dict[str, Any]], ColumnarResult]) -> Dict[str, Any]:
+        """Assembler les résultats SQL et les métadonnées de la traduction"""
+        if isinstance(query_results, ColumnarResult):
             return {
-                "success": True,
-                "data": query_results,
-                "sql_query": sql_query,
-                "explanation": nlq_result.get('explanation', ''),
-                "filters_applied": nlq_result.get('filters_applied', []),
-                "confidence": nlq_result.get('confidence', 0.0),
-                "natural_response": natural_response,
-                "count": len(query_results)
+                "format": "columnar",
+                "columns": query_results.columns,
+                "data": query_results.data,
+                "count": len(query_results),
+                **self._translation_metadata(nlq_result)
             }
+        return {"data": query_results, **self._translation_metadata(nlq_result)}
+    
+    @staticmethod
+    def _translation_metadata(nlq_result: Dict[str, Any]) -> Dict[str, Any]:
+        """Métadonnées de la traduction jointes aux résultats"""
+        return {
+            "sql_query": nlq_result.get('sql_query', ''),
+            "explanation": nlq_result.get('explanation', ''),
+            "filters_applied": nlq_result.get('filters_applied', []),
+            "confidence": nlq_result.get('confidence', 0.0)
+        }
+    
+    def _build_success_response(self, result_data: Dict[str, Any], natural_response: str,
+                                result_id: Optional[str] = None,
+                                next_cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Construire la réponse finale d'une requête réussie"""
+        return {
+            "success": True,
+            **result_data,
+            "natural_response": natural_response,
+            "count": result_data.get("count", len(result_data["data"])),
+            "result_id": result_id,
+            "next_cursor": next_cursor
+        }
+    
+    def _summary_input(self, query_results: Union[List[Dict[str, Any]], ColumnarResult]) -> Dict[str, Any]:
+        """Échantillon des résultats et nombre total, transmis au résumé Gemini"""
+        return {"data": self._result_rows(query_results, self.SUMMARY_SAMPLE_SIZE), "count": len(query_results)}
+    
+    def _result_payload(self, user_query: str, nlq_result: Dict[str, Any],
+                        query_results: Union[List[Dict[str, Any]], ColumnarResult], result_format: str,
+                        pagination: Optional[Dict[str, Any]] = None,
+                        natural_response: Optional[str] = None) -> Dict[str, Any]:
+        """Données conservées avec un résultat: échantillon pour le résumé Gemini, requête SQL des pages suivantes"""
+        payload = {"user_query": user_query, **self._summary_input(query_results), "natural_response": natural_response}
+        if pagination is not None:
+            payload.update(pagination=pagination, sql_params=list(self._sql_params(nlq_result)), format=result_format)
+        return payload
+    
+    def _plan_pagination(self, translated_sql: str, user_query: str,
+                         query_results: Union[List[Dict[str, Any]], ColumnarResult],
+                         limit: Optional[int], paginate: bool) -> Optional[Dict[str, Any]]:
+        """
+        État de pagination d'un résultat dont la première page est pleine (d'autres lignes peuvent suivre)
+        
+        Seule la requête traduite est conservée: le plan des pages (clés de
+        tri, requête d'essai sur SQLite) n'est établi qu'à la lecture de la
+        deuxième page, hors du chemin de la réponse. Une clause LIMIT dont le
+        nombre ne figure pas dans la question a été ajoutée par le LLM: elle
+        est retirée pour que les pages parcourent tout le résultat. Une limite
+        demandée ("les 20 moins chers") borne les pages.
+        """
+        if not paginate or self.pager is None or len(query_results) < self.sql_validator.row_limit(limit):
+            return None
+        count = self.sql_validator.limit_count(translated_sql)
+        if count is not None and str(count) not in re.findall(r"\d+", user_query):
+            translated_sql = self.sql_validator.remove_limit(translated_sql, count)
+        return {"translated_sql": translated_sql}
+    
+    def _page_state(self, result_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Plan des pages d'un résultat conservé, établi à la première page lue"""
+        state = payload["pagination"]
+        if "translated_sql" in state:
+            with stage("pagination"):
+                state = self.pager.plan(state["translated_sql"], tuple(payload["sql_params"]))
+            payload["pagination"] = state
+            self.result_store.update(result_id, payload)
+        return state
+    
+    @staticmethod
+    def _first_cursor(query_results: Union[List[Dict[str, Any]], ColumnarResult],
+                      pagination: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Curseur de la deuxième page (lue par décalage, les suivantes par clé)"""
+        return None if pagination is None else encode_cursor({"o": len(query_results)})
+    
+    def get_page(self, result_id: str, cursor: Optional[str] = None,
+                 limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Obtenir une page suivante d'un résultat, sans nouvelle traduction
+        
+        Args:
+            result_id: Identifiant renvoyé par process_query
+            cursor: Curseur renvoyé avec la page précédente (next_cursor); par
+                défaut la page qui suit la réponse de process_query
+            limit: Nombre de lignes de la page (défaut Config.DEFAULT_LIMIT, plafonné à MAX_RESULT_LIMIT)
+            
+        Returns:
+            Dictionnaire contenant la page et le curseur suivant (None en fin de
+            résultat), ou None si le résultat est inconnu, expiré ou sans pagination
             
+        Raises:
+            InvalidCursorError: Si le curseur est illisible
+        """
+        payload = self.result_store.get(result_id)
+        if payload is None or payload.get("pagination") is None:
+            return None
+        return self._read_page(result_id, payload, cursor, limit)
+    
+    def _read_page(self, result_id: str, payload: Dict[str, Any], cursor: Optional[str],
+                   limit: Optional[int]) -> Dict[str, Any]:
+        """Lire une page d'un résultat conservé"""
+        position = decode_cursor(cursor) if cursor else {"o": payload["count"]}
+        size = self.sql_validator.row_limit(limit)
+        state = self._page_state(result_id, payload)
+        sql_query, params = self.pager.page_query(state, position, size, tuple(payload["sql_params"]))
+        try:
+            results = self._execute_sql({"sql_query": sql_query, "sql_params": params}, payload["format"])
+            results, next_cursor = self.pager.finish_page(state, position, results, size)
+        except QueryTooExpensiveError as e:
+            return self._too_expensive_response(e)
         except Exception as e:
-            return {
-                "success": False,
-                "error": str(e),
-                "data": [],
-                "natural_response": "Une erreur s'est produite lors du traitement de votre requête."
-            }
+            return self._error_response(
+                str(e), "Une erreur s'est produite lors de la lecture de cette page."
+            )
+        
+        if isinstance(results, ColumnarResult):
+            page = {"format": "columnar", "columns": results.columns, "data": results.data}
+        else:
+            page = {"format": "rows", "data": results}
+        return {"success": True, "result_id": result_id, **page, "count": len(results), "next_cursor": next_cursor}
+    
+    def get_summary(self, result_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtenir le résumé Gemini d'un résultat obtenu en mode "deferred"
+        
+        Le résumé est généré au premier appel puis conservé avec le résultat.
+        
+        Args:
+            result_id: Identifiant renvoyé par process_query
+            
+        Returns:
+            Dictionnaire contenant la réponse naturelle, ou None si le résultat est inconnu ou expiré
+        """
+        payload = self.result_store.get(result_id)
+        if payload is None:
+            return None
+        
+        if payload["natural_response"] is None:
+            payload["natural_response"] = self.nlq_processor.generate_natural_response(
+                payload, payload["user_query"]
+            )
+            self.result_store.update(result_id, payload)
+        
+        return {
+            "result_id": result_id,
+            "count": payload["count"],
+            "natural_response": payload["natural_response"]
+        }
+    
+    def _too_expensive_response(self, error: QueryTooExpensiveError) -> Dict[str, Any]:
+        """Réponse d'erreur d'une requête refusée ou interrompue par son budget"""
+        return self._error_response(
+            f"Requête trop coûteuse: {error}",
+            "Cette recherche est trop coûteuse à exécuter. Pouvez-vous la préciser "
+            "(catégorie, marque, fourchette de prix...) ?"
+        )
+    
+    def _error_response(self, error: str, natural_response: str) -> Dict[str, Any]:
+        """Construire une réponse d'échec"""
+        return {
+            "success": False,
+            "error": error,
+            "data": [],
+            "count": 0,
+            "natural_response": natural_response
+        }
     
     def get_suggestions(self) -> List[str]:
         """Obtenir des suggestions de requêtes exemple"""
@@ -112,36 +603,339 @@ class NLQService:
             "Trouve des accessoires pour homme"
         ]
     
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """
+        Obtenir les compteurs du cache de traduction, de l'index des questions
+        proches (clé "semantic") et des caches de résultats SQL (clés "results"
+        et "shared_results", partagé entre workers)
+        """
+        if self.translation_cache is None:
+            stats = {"enabled": False}
+        else:
+            stats = {"enabled": True, **self.translation_cache.stats()}
+        stats["semantic"] = ({"enabled": False} if self.semantic_index is None
+                             else {"enabled": True, **self.semantic_index.stats()})
+        result_cache = self.db_manager.result_cache
+        stats["results"] = {"enabled": False} if result_cache is None else {"enabled": True, **result_cache.stats()}
+        shared_cache = self.db_manager.shared_result_cache
+        stats["shared_results"] = ({"enabled": False} if shared_cache is None
+                                   else {"enabled": True, **shared_cache.stats()})
+        return stats
+    
     def get_database_stats(self) -> Dict[str, Any]:
-        """Obtenir des statistiques sur la base de données"""
+        """Obtenir des statistiques sur la base de données (recalculées après modification)"""
         try:
-            stats = {}
+            return self.database_stats.get()
+        except Exception as e:
+            return {"error": str(e)}
+
+
+class AsyncNLQService(NLQService):
+    """
+    Variante asynchrone du service NLQ
+    
+    Les appels Gemini utilisent generate_content_async et le travail SQLite est
+    déporté sur un pool de threads borné, afin de ne jamais bloquer la boucle
+    d'événements pendant qu'une requête attend le LLM ou la base.
+    """
+    
+    def __init__(self, db_manager: Optional[DatabaseManager] = None,
+                 nlq_processor: Optional[GeminiNLQProcessor] = None,
+                 max_workers: int = None):
+        super().__init__(db_manager, nlq_processor)
+        self.single_flight = AsyncSingleFlight() if Config.SINGLE_FLIGHT_ENABLED else None
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or Config.DB_EXECUTOR_WORKERS,
+            thread_name_prefix="nlq-db"
+        )
+    
+    async def _run_blocking(self, func, *args):
+        """Exécuter une fonction bloquante dans le pool de threads en conservant le contexte"""
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(context.run, func, *args)
+        )
+    
+    async def warm_up_async(self, llm: bool = False) -> Dict[str, Any]:
+        """
+        Préparer le service sans bloquer la boucle d'événements
+        
+        Args:
+            llm: Envoyer aussi une requête minimale au LLM; son échec n'empêche
+                pas le service de démarrer (erreur reportée dans "llm_error")
+        
+        Returns:
+            Durée de chaque étape en millisecondes (et "llm_error" le cas échéant)
+        """
+        timings: Dict[str, Any] = await self._run_blocking(self.warm_up)
+        warm_up_llm = getattr(self.nlq_processor, "warm_up_llm_async", None)
+        if llm and warm_up_llm is not None:
+            start = time.perf_counter()
+            try:
+                await warm_up_llm()
+                timings["llm"] = round((time.perf_counter() - start) * 1000, 3)
+            except Exception as e:
+                timings["llm_error"] = str(e)
+        return timings
+    
+    async def process_query_async(self, user_query: str, summary_mode: str = "llm", include_timings: bool = False,
+                                  limit: Optional[int] = None, result_format: str = "rows",
+                                  paginate: bool = False) -> Dict[str, Any]:
+        """
+        Traiter une requête utilisateur complète sans bloquer la boucle d'événements
+        
+        Args:
+            user_query: Requête de l'utilisateur en langage naturel
+            summary_mode: Mode de génération de la réponse naturelle (voir SUMMARY_MODES)
+            include_timings: Joindre à la réponse la durée de chaque étape (champ "timings")
+            limit: Nombre maximal de lignes (défaut Config.DEFAULT_LIMIT, plafonné à MAX_RESULT_LIMIT)
+            result_format: Format du champ data (voir RESULT_FORMATS)
+            paginate: Conserver la requête d'un résultat incomplet pour en lire
+                les pages suivantes (result_id et next_cursor dans la réponse)
             
-            # Nombre de produits
-            products_count = self.db_manager.execute_query(
-                "SELECT COUNT(*) as count FROM products WHERE is_active = 1"
-            )
-            stats['active_products'] = products_count[0]['count'] if products_count else 0
+        Returns:
+            Dictionnaire contenant les résultats et métadonnées
+        """
+        with track_request() as timings:
+            start = time.perf_counter()
+            if self.single_flight is None:
+                response = await self._process_query_async(user_query, summary_mode, limit, result_format, paginate)
+            else:
+                response = dict(await self.single_flight.do(
+                    self._flight_key(user_query, summary_mode, limit, result_format, paginate),
+                    lambda: self._process_query_async(user_query, summary_mode, limit, result_format, paginate)
+                ))
+            return self._record_query(response, timings, start, include_timings)
+    
+    async def _process_query_async(self, user_query: str, summary_mode: str, limit: Optional[int],
+                                   result_format: str = "rows", paginate: bool = False) -> Dict[str, Any]:
+        """Traitement asynchrone d'une requête, sans la mesure globale"""
+        invalid_response = self._check_user_query(user_query, summary_mode, result_format)
+        if invalid_response is not None:
+            return invalid_response
+        
+        try:
+            # 1. Traduire la requête (règles locales, sinon Gemini)
+            nlq_result = await self._translate_async(user_query)
+            
+            translation_error = self._check_translation(nlq_result)
+            if translation_error is not None:
+                return translation_error
+            translated_sql = nlq_result['sql_query']
+            nlq_result = self._apply_limit(nlq_result, limit)
+            
+            # 2. Exécuter la requête SQL
+            query_results = await self._run_blocking(self._execute_sql, nlq_result, result_format)
+            
+            # 3. Générer une réponse naturelle
+            result_data = self._build_result_data(nlq_result, query_results)
+            if summary_mode == "llm":
+                natural_response = await self.nlq_processor.generate_natural_response_async(
+                    self._summary_input(query_results), user_query
+                )
+            else:
+                with stage("template_summary"):
+                    natural_response = summarize_results(self._result_rows(query_results))
+            
+            # 4. Conserver le résultat pour le résumé différé et les pages suivantes
+            pagination = self._plan_pagination(translated_sql, user_query, query_results, limit, paginate)
+            result_id = None
+            if summary_mode == "deferred" or pagination is not None:
+                result_id = await self._run_blocking(self.result_store.put, self._result_payload(
+                    user_query, nlq_result, query_results, result_format, pagination,
+                    natural_response if summary_mode == "llm" else None
+                ))
             
-            # Nombre de catégories
-            categories_count = self.db_manager.execute_query(
-                "SELECT COUNT(*) as count FROM categories"
+            return self._build_success_response(
+                result_data, natural_response, result_id, self._first_cursor(query_results, pagination)
             )
-            stats['categories'] = categories_count[0]['count'] if categories_count else 0
             
-            # Nombre de marques
-            brands_count = self.db_manager.execute_query(
-                "SELECT COUNT(*) as count FROM brands"
+        except QueryTooExpensiveError as e:
+            return self._too_expensive_response(e)
+        except Exception as e:
+            return self._error_response(
+                str(e), "Une erreur s'est produite lors du traitement de votre requête."
             )
-            stats['brands'] = brands_count[0]['count'] if brands_count else 0
+    
+    async def process_batch_async(self, user_queries: List[str], summary_mode: str = "llm",
+                                  include_timings: bool = False, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Traiter un lot de requêtes en parallèle
+        
+        Les requêtes identiques (après normalisation) ne sont traitées qu'une
+        fois. Les requêtes distinctes sont lancées simultanément, au plus
+        BATCH_CONCURRENCY à la fois: la durée du lot est proche de celle des
+        requêtes les plus lentes et non de leur somme.
+        
+        Args:
+            user_queries: Requêtes en langage naturel
+            summary_mode: Mode de génération de la réponse naturelle (voir SUMMARY_MODES)
+            include_timings: Joindre à chaque résultat la durée de ses étapes
+            limit: Nombre maximal de lignes par requête
             
-            # Nombre de commandes
-            orders_count = self.db_manager.execute_query(
-                "SELECT COUNT(*) as count FROM orders"
+        Returns:
+            Dictionnaire contenant un résultat par requête, dans l'ordre reçu
+        """
+        start = time.perf_counter()
+        if not user_queries:
+            return self._batch_error("Lot vide", "Veuillez fournir au moins une requête.")
+        if len(user_queries) > Config.MAX_BATCH_SIZE:
+            return self._batch_error(
+                "Lot trop grand",
+                f"Un lot est limité à {Config.MAX_BATCH_SIZE} requêtes."
             )
-            stats['orders'] = orders_count[0]['count'] if orders_count else 0
+        
+        unique_queries: Dict[str, str] = {}
+        for user_query in user_queries:
+            unique_queries.setdefault(normalize_query(user_query or ""), user_query)
+        
+        semaphore = asyncio.Semaphore(Config.BATCH_CONCURRENCY)
+        
+        async def process_one(user_query: str) -> Dict[str, Any]:
+            # Appels au LLM des lots servis après ceux des requêtes interactives
+            with llm_priority(BATCH):
+                async with semaphore:
+                    return await self.process_query_async(user_query, summary_mode, include_timings, limit)
+        
+        # Chaque requête s'exécute dans sa propre tâche (et donc son propre contexte de mesure)
+        results = dict(zip(
+            unique_queries,
+            await asyncio.gather(*[process_one(user_query) for user_query in unique_queries.values()])
+        ))
+        
+        items = [
+            {"query": user_query, **results[normalize_query(user_query or "")]}
+            for user_query in user_queries
+        ]
+        response = {
+            "success": True,
+            "count": len(items),
+            "unique_queries": len(unique_queries),
+            "failed": sum(not item["success"] for item in items),
+            "results": items
+        }
+        if include_timings:
+            response["timings"] = {"total": round((time.perf_counter() - start) * 1000, 3)}
+        return response
+    
+    @staticmethod
+    def _batch_error(error: str, natural_response: str) -> Dict[str, Any]:
+        """Réponse d'un lot refusé dans son ensemble"""
+        return {
+            "success": False,
+            "count": 0,
+            "unique_queries": 0,
+            "failed": 0,
+            "results": [],
+            "error": error,
+            "natural_response": natural_response
+        }
+    
+    async def _translate_async(self, user_query: str) -> Dict[str, Any]:
+        """Variante asynchrone de _translate"""
+        if self.rule_parser is not None:
+            # Recharge les vocabulaires depuis SQLite au premier appel et après une écriture
+            rule_result = await self._run_blocking(self._parse_rules, user_query)
+            if rule_result is not None:
+                return rule_result
+        TRANSLATIONS.inc(source="llm")
+        nlq_result = await self.nlq_processor.process_natural_query_async(user_query)
+        if nlq_result.get('llm_unavailable'):
+            return await self._run_blocking(self._fallback_translation, user_query, nlq_result)
+        return nlq_result
+    
+    async def stream_query_async(self, user_query: str,
+                                 limit: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Variante asynchrone de stream_query
+        
+        Chaque bloc de lignes est lu dans le pool de threads, la boucle
+        d'événements reste libre entre deux blocs.
+        
+        Args:
+            user_query: Requête de l'utilisateur en langage naturel
+            limit: Nombre maximal de lignes diffusées (défaut et plafond: Config.STREAM_MAX_ROWS)
+            
+        Yields:
+            Dictionnaires d'événements sérialisables en NDJSON
+        """
+        invalid_response = self._check_user_query(user_query)
+        if invalid_response is not None:
+            yield self._error_event(invalid_response)
+            return
+        
+        try:
+            nlq_result = await self._translate_async(user_query)
+            
+            translation_error = self._check_translation(nlq_result)
+            if translation_error is not None:
+                yield self._error_event(translation_error)
+                return
+            nlq_result = self._apply_limit(nlq_result, limit or Config.STREAM_MAX_ROWS, Config.STREAM_MAX_ROWS)
+            
+            chunks = await self._run_blocking(self._iter_sql, nlq_result)
+            yield self._metadata_event(nlq_result)
             
-            return stats
+            sample, count = [], 0
+            try:
+                while True:
+                    rows = await self._run_blocking(next, chunks, None)
+                    if rows is None:
+                        break
+                    sample.extend(rows[:self.SUMMARY_SAMPLE_SIZE - len(sample)])
+                    count += len(rows)
+                    yield {"event": "rows", "rows": rows}
+            finally:
+                # Rendre la connexion au pool même si le client s'est déconnecté
+                chunks.close()
             
+            natural_response = await self.nlq_processor.generate_natural_response_async(
+                {"data": sample, "count": count}, user_query
+            )
+            yield self._summary_event(count, natural_response)
+            
+        except QueryTooExpensiveError as e:
+            yield self._error_event(self._too_expensive_response(e))
         except Exception as e:
-            return {"error": str(e)}
+            yield self._error_event(self._error_response(
+                str(e), "Une erreur s'est produite lors du traitement de votre requête."
+            ))
+    
+    async def get_summary_async(self, result_id: str) -> Optional[Dict[str, Any]]:
+        """Variante asynchrone de get_summary"""
+        payload = await self._run_blocking(self.result_store.get, result_id)
+        if payload is None:
+            return None
+        
+        if payload["natural_response"] is None:
+            payload["natural_response"] = await self.nlq_processor.generate_natural_response_async(
+                payload, payload["user_query"]
+            )
+            await self._run_blocking(self.result_store.update, result_id, payload)
+        
+        return {
+            "result_id": result_id,
+            "count": payload["count"],
+            "natural_response": payload["natural_response"]
+        }
+    
+    async def get_page_async(self, result_id: str, cursor: Optional[str] = None,
+                             limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Variante asynchrone de get_page"""
+        payload = await self._run_blocking(self.result_store.get, result_id)
+        if payload is None or payload.get("pagination") is None:
+            return None
+        return await self._run_blocking(self._read_page, result_id, payload, cursor, limit)
+    
+    async def get_database_stats_async(self) -> Dict[str, Any]:
+        """Obtenir des statistiques sur la base de données sans bloquer la boucle d'événements"""
+        return await self._run_blocking(self.get_database_stats)
+    
+    async def get_cache_stats_async(self) -> Dict[str, Any]:
+        """Obtenir les compteurs des caches sans bloquer la boucle d'événements"""
+        return await self._run_blocking(self.get_cache_stats)
+    
+    def close(self):
+        """Libérer le pool de threads"""
+        self._executor.shutdown(wait=False)
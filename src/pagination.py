@@ -0,0 +1,227 @@
+"""
+Module de pagination des résultats conservés (curseurs opaques, lecture par clé)
+"""
+import base64
+import json
+import sqlite3
+from typing import Dict, Any, List, Optional, Tuple, Union
+from config.settings import Config
+from src.columnar import ColumnarResult
+from src.database_manager import DatabaseManager
+from src.sql_validator import SQLValidator, SQLValidationError
+
+
+class InvalidCursorError(ValueError):
+    """Curseur de pagination illisible ou incompatible avec le résultat"""
+
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    """
+    Encoder une position de lecture en curseur opaque
+
+    Args:
+        position: {"o": lignes déjà lues, "k": clés de tri de la dernière ligne lue (optionnel)}
+    """
+    raw = json.dumps(position, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Décoder un curseur produit par encode_cursor
+
+    Raises:
+        InvalidCursorError: Si le curseur est illisible ou mal formé
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError("Curseur illisible") from e
+
+    if not isinstance(position, dict):
+        raise InvalidCursorError("Curseur mal formé")
+    offset, keys = position.get("o"), position.get("k")
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        raise InvalidCursorError("Curseur mal formé: position invalide")
+    if keys is not None and (not isinstance(keys, list) or not all(
+            value is None or isinstance(value, (str, int, float)) for value in keys)):
+        raise InvalidCursorError("Curseur mal formé: clés invalides")
+    return position
+
+
+def _quote(identifier: str) -> str:
+    """Identifiant SQL entre guillemets"""
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class ResultPager:
+    """
+    Découpage en pages de la requête SQL d'un résultat conservé
+
+    La première page est la réponse de /query; les suivantes relisent la même
+    requête SQL, sans nouvelle traduction. Lorsque la clause ORDER BY se
+    termine par l'identifiant d'une table dont chaque ligne n'apparaît qu'une
+    fois dans le résultat (jointures vers une seule ligne: produit -> marque,
+    catégorie), les clés de tri sont ajoutées à la requête et la page suivante
+    est sélectionnée par clé (WHERE clés > dernières clés lues): seules les
+    lignes de la page sont lues, quelle que soit sa profondeur. Sinon les pages
+    sont lues par décalage (OFFSET).
+    """
+
+    KEY_COLUMN = "_page_key_{}"
+
+    def __init__(self, db_manager: DatabaseManager, sql_validator: SQLValidator):
+        self.db_manager = db_manager
+        self.sql_validator = sql_validator
+        self._foreign_keys: Dict[str, Dict[str, str]] = {}
+        self._schema_version: Optional[int] = None
+
+    def plan(self, sql_query: str, params: tuple = ()) -> Dict[str, Any]:
+        """
+        Préparer la pagination d'une requête (état conservé avec le résultat)
+
+        Args:
+            sql_query: Requête traduite, avant application de la limite de page
+            params: Paramètres de la requête
+
+        Returns:
+            {"sql": requête sans plafond générique, "keyed_sql": requête exposant
+            ses clés de tri (None: lecture par décalage), "descending": sens de chaque clé}
+        """
+        base = self.sql_validator.remove_limit(sql_query, Config.MAX_RESULT_LIMIT)
+        state = {"sql": base, "keyed_sql": None, "descending": []}
+        terms = self.sql_validator.order_by_terms(base)
+        if not terms or not self._unique_key(base, terms[-1]):
+            return state
+
+        expressions = [
+            f"{_quote(qualifier) + '.' if qualifier else ''}{_quote(column)} AS {self.KEY_COLUMN.format(index)}"
+            for index, (qualifier, column, _) in enumerate(terms)
+        ]
+        try:
+            keyed = self.sql_validator.append_select_columns(base, expressions)
+            # Une clé peut désigner un alias du SELECT, inutilisable dans la liste SELECT elle-même
+            self.db_manager.execute_query(f"SELECT * FROM ({keyed}) AS page LIMIT 0", params, use_cache=False)
+        except (SQLValidationError, sqlite3.Error):
+            return state
+        state.update(keyed_sql=keyed, descending=[descending for _, _, descending in terms])
+        return state
+
+    def page_query(self, state: Dict[str, Any], position: Dict[str, Any], size: int,
+                   params: tuple = ()) -> Tuple[str, tuple]:
+        """
+        Requête SQL d'une page (une ligne de plus que la page, pour savoir si d'autres suivent)
+
+        Raises:
+            InvalidCursorError: Si les clés du curseur ne correspondent pas à la requête
+        """
+        offset, keys = position["o"], position.get("k")
+        params = tuple(params)
+        if state["keyed_sql"] is None:
+            return f"SELECT * FROM ({state['sql']}) AS page LIMIT ? OFFSET ?", params + (size + 1, offset)
+
+        descending = state["descending"]
+        columns = [self.KEY_COLUMN.format(index) for index in range(len(descending))]
+        order_by = ", ".join(f"{column} {'DESC' if desc else 'ASC'}" for column, desc in zip(columns, descending))
+        if keys is None or any(value is None for value in keys):
+            return (f"SELECT * FROM ({state['keyed_sql']}) AS page ORDER BY {order_by} LIMIT ? OFFSET ?",
+                    params + (size + 1, offset))
+        if len(keys) != len(columns):
+            raise InvalidCursorError("Curseur incompatible avec ce résultat")
+
+        # (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ..., comparaison inversée pour un tri décroissant
+        conditions, condition_params = [], []
+        for index, (column, desc) in enumerate(zip(columns, descending)):
+            terms = [f"{previous} = ?" for previous in columns[:index]]
+            # Tri décroissant: les valeurs NULL viennent en dernier
+            terms.append(f"({column} < ? OR {column} IS NULL)" if desc else f"{column} > ?")
+            conditions.append(f"({' AND '.join(terms)})")
+            condition_params.extend(keys[:index + 1])
+        return (f"SELECT * FROM ({state['keyed_sql']}) AS page WHERE {' OR '.join(conditions)} "
+                f"ORDER BY {order_by} LIMIT ?", params + tuple(condition_params) + (size + 1,))
+
+    def finish_page(self, state: Dict[str, Any], position: Dict[str, Any],
+                    results: Union[List[Dict[str, Any]], ColumnarResult],
+                    size: int) -> Tuple[Union[List[Dict[str, Any]], ColumnarResult], Optional[str]]:
+        """
+        Retirer les clés de tri et la ligne supplémentaire d'une page lue avec page_query
+
+        Returns:
+            (lignes de la page, curseur de la page suivante ou None)
+        """
+        key_columns = ([self.KEY_COLUMN.format(index) for index in range(len(state["descending"]))]
+                       if state["keyed_sql"] is not None else [])
+        more = len(results) > size
+        count = min(len(results), size)
+
+        if isinstance(results, ColumnarResult):
+            keys = [results.data.pop(column) for column in key_columns]
+            last_keys = [self._native(values[count - 1]) for values in keys] if count else []
+            results = ColumnarResult([column for column in results.columns if column not in key_columns],
+                                     {column: values[:count] for column, values in results.data.items()})
+        else:
+            results = results[:count]
+            last_keys = [results[-1].get(column) for column in key_columns] if count else []
+            for row in results:
+                for column in key_columns:
+                    row.pop(column, None)
+
+        if not more:
+            return results, None
+        next_position: Dict[str, Any] = {"o": position["o"] + count}
+        if key_columns and all(value is not None for value in last_keys):
+            next_position["k"] = last_keys
+        return results, encode_cursor(next_position)
+
+    def _unique_key(self, sql_query: str, term: Tuple[Optional[str], str, bool]) -> bool:
+        """
+        La clé de tri finale (table.id) identifie-t-elle chaque ligne du résultat ?
+
+        Vrai si chacune des autres tables est jointe à partir de la table de la
+        clé par une clé étrangère (une seule ligne jointe), directement ou de
+        proche en proche. Les index plein texte (products_fts) sont associés à
+        leur table ligne à ligne.
+        """
+        qualifier, column, _ = term
+        if column != "id":
+            return False
+        references = self.sql_validator.table_references(sql_query)
+        tables = set(references.values())
+        if None in tables:
+            return False
+        if qualifier is not None:
+            owner = references.get(qualifier)
+        else:
+            owner = next(iter(tables)) if len(tables) == 1 else None
+        if owner is None:
+            return False
+
+        accepted, pending = {owner}, tables - {owner}
+        changed = True
+        while pending and changed:
+            changed = False
+            for table in list(pending):
+                joined = (table.endswith("_fts") and table[:-len("_fts")] in accepted) or any(
+                    target == f"{table}.id"
+                    for source in accepted for target in self._table_foreign_keys(source).values()
+                )
+                if joined:
+                    accepted.add(table)
+                    pending.discard(table)
+                    changed = True
+        return not pending
+
+    def _table_foreign_keys(self, table: str) -> Dict[str, str]:
+        """Clés étrangères d'une table, relues après un changement de schéma"""
+        schema_version = self.db_manager.schema_version()
+        if schema_version != self._schema_version:
+            self._foreign_keys = {}
+            self._schema_version = schema_version
+        if table not in self._foreign_keys:
+            self._foreign_keys[table] = self.db_manager.get_foreign_keys(table)
+        return self._foreign_keys[table]
+
+    @staticmethod
+    def _native(value: Any) -> Any:
+        """Valeur Python native (les colonnes NumPy renvoient des scalaires NumPy)"""
+        return value.item() if hasattr(value, "item") else value
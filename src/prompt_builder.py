@@ -0,0 +1,240 @@
+"""
+Module de construction des prompts Gemini (contexte de schéma compact et lignes projetées)
+"""
+import json
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+from src.database_manager import DatabaseManager
+from src.rule_based_parser import RuleBasedQueryParser, tokenize
+
+
+def _stem(word: str) -> str:
+    """Forme singulière approximative d'un mot normalisé"""
+    return word[:-1] if len(word) > 3 and word[-1] in "sx" else word
+
+
+class PromptBuilder:
+    """
+    Constructeur des prompts de traduction et de résumé
+
+    Le contexte de schéma (colonnes, clés étrangères, valeurs énumérées) est
+    dérivé de la base une seule fois, puis recalculé seulement si le schéma
+    change (PRAGMA schema_version). Chaque prompt de traduction ne décrit que
+    les tables utiles à la requête: les produits, plus les tables évoquées par
+    un mot-clé ou par le nom d'une catégorie ou d'une marque. Les instructions,
+    identiques d'un appel à l'autre, forment le début du prompt pour profiter
+    de la mise en cache du préfixe côté Gemini.
+    """
+
+    # Table toujours décrite: toute recherche porte sur le catalogue
+    CORE_TABLE = "products"
+
+    # Racines (normalisées) qui rendent une table pertinente
+    TABLE_KEYWORDS = {
+        "categories": ("categor", "rayon", "famille"),
+        "brands": ("marque", "fabricant", "pays", "origine"),
+        "orders": ("command", "client", "achat", "achet", "vente", "vendu", "livr", "expedi", "statut"),
+        "order_items": ("command", "vente", "vendu", "achat", "achet", "populaire", "quantite"),
+    }
+
+    # Tables dont les valeurs de la colonne name désignent la table (Robes -> categories)
+    NAMED_TABLES = ("categories", "brands")
+
+    # Schéma de référence, utilisé sans gestionnaire de base de données
+    DEFAULT_SCHEMA = {
+        "categories": ["id", "name", "description", "parent_id"],
+        "brands": ["id", "name", "description", "country"],
+        "products": ["id", "name", "description", "price", "original_price", "category_id", "brand_id",
+                     "sku", "stock_quantity", "color", "size", "material", "gender", "season", "is_active"],
+        "orders": ["id", "customer_email", "total_amount", "status", "order_date", "shipping_address"],
+        "order_items": ["id", "order_id", "product_id", "quantity", "unit_price", "total_price"],
+    }
+    DEFAULT_FOREIGN_KEYS = {
+        "categories": {"parent_id": "categories.id"},
+        "products": {"category_id": "categories.id", "brand_id": "brands.id"},
+        "order_items": {"order_id": "orders.id", "product_id": "products.id"},
+    }
+    DEFAULT_ENUMS = {
+        "products": {"gender": ["homme", "femme", "enfant", "unisexe"],
+                     "season": ["printemps", "été", "automne", "hiver", "toute_saison"]},
+        "orders": {"status": ["en_attente", "confirmé", "expédié", "livré", "annulé"]},
+    }
+
+    # Colonnes privilégiées dans les lignes envoyées pour le résumé
+    SUMMARY_COLUMNS = ("name", "brand", "brand_name", "category", "category_name", "price",
+                       "original_price", "color", "size", "material", "gender", "season", "stock_quantity")
+    SUMMARY_MAX_COLUMNS = 8
+    SUMMARY_ROWS = 5
+    SUMMARY_MAX_CHARS = 80
+
+    def __init__(self, db_manager: Optional[DatabaseManager] = None, full_text_search: bool = True):
+        self.db_manager = db_manager
+        self.full_text_search = full_text_search
+        self.refreshes = 0
+        self._tables: Dict[str, str] = {}
+        self._vocabulary: Dict[str, set] = {}
+        self._schema_version: Optional[int] = None
+        self._data_version: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+        self.instructions = self._build_instructions()
+        if db_manager is None:
+            self._tables = self._describe_tables(self.DEFAULT_SCHEMA, self.DEFAULT_FOREIGN_KEYS, self.DEFAULT_ENUMS)
+
+    def query_prompt(self, user_query: str, include_instructions: bool = True) -> str:
+        """
+        Construire le prompt de traduction NL -> SQL
+
+        Args:
+            user_query: Requête de l'utilisateur en langage naturel
+            include_instructions: Inclure les instructions (sauf si elles sont déjà
+                dans un contexte mis en cache côté Gemini)
+        """
+        tables = self.relevant_tables(user_query)
+        parts = [self.instructions] if include_instructions else []
+        parts.append("Tables disponibles:\n" + "\n".join(self._tables[table] for table in tables))
+        parts.append(f'Requête à convertir: "{user_query}"')
+        return "\n\n".join(parts)
+
+    def relevant_tables(self, user_query: str) -> List[str]:
+        """Tables à décrire pour une requête, dans l'ordre du schéma"""
+        self._refresh()
+        words = [word for word in tokenize(user_query) if word not in RuleBasedQueryParser.STOPWORDS]
+        stems = {_stem(word) for word in words}
+
+        selected = {self.CORE_TABLE}
+        for table, roots in self.TABLE_KEYWORDS.items():
+            if any(word.startswith(roots) for word in words):
+                selected.add(table)
+        for table, names in self._vocabulary.items():
+            if stems & names:
+                selected.add(table)
+        return [table for table in self._tables if table in selected]
+
+    def warm_up(self):
+        """Charger à l'avance le contexte de schéma et le vocabulaire du catalogue"""
+        self._refresh()
+    
+    def response_prompt(self, data: List[Dict[str, Any]], original_query: str, count: int) -> str:
+        """Construire le prompt de génération de la réponse naturelle"""
+        columns, rows = self.compact_rows(data)
+        lines = "\n".join(json.dumps(row, ensure_ascii=False) for row in rows)
+        return (
+            "Tu es un assistant e-commerce expert.\n"
+            f'L\'utilisateur a demandé: "{original_query}"\n'
+            f"Nombre total de résultats: {count}\n"
+            f"Premiers résultats (colonnes {json.dumps(columns, ensure_ascii=False)}, une ligne par résultat):\n"
+            f"{lines}\n"
+            "Génère une réponse naturelle, concise mais informative, en français: résume les résultats, "
+            "mentionne les informations les plus pertinentes (prix, marques...) et suggère d'autres "
+            "recherches si pertinent."
+        )
+
+    @classmethod
+    def compact_rows(cls, data: List[Dict[str, Any]]) -> Tuple[List[str], List[List[Any]]]:
+        """
+        Projeter les premières lignes sur les colonnes utiles au résumé
+
+        Les identifiants et clés étrangères sont omis, les textes longs tronqués
+        et chaque ligne est réduite à la liste de ses valeurs.
+        """
+        sample = data[:cls.SUMMARY_ROWS]
+        available = list(sample[0]) if sample else []
+        useful = [column for column in available if column != "id" and not column.endswith("_id")]
+        columns = [column for column in cls.SUMMARY_COLUMNS if column in useful]
+        columns += [column for column in useful if column not in columns]
+        columns = columns[:cls.SUMMARY_MAX_COLUMNS]
+
+        def compact(value: Any) -> Any:
+            if isinstance(value, str) and len(value) > cls.SUMMARY_MAX_CHARS:
+                return value[:cls.SUMMARY_MAX_CHARS - 1] + "…"
+            return value
+
+        return columns, [[compact(row.get(column)) for column in columns] for row in sample]
+
+    def _refresh(self):
+        """Recalculer le contexte après un changement de schéma, le vocabulaire après une écriture"""
+        if self.db_manager is None:
+            return
+        schema_version = self.db_manager.schema_version()
+        data_version = self.db_manager.data_version()
+        if schema_version == self._schema_version and data_version == self._data_version:
+            return
+
+        with self._lock:
+            if schema_version != self._schema_version:
+                self._tables = self._load_tables()
+                self._schema_version = schema_version
+                self.refreshes += 1
+            if data_version != self._data_version:
+                self._vocabulary = self._load_vocabulary()
+                self._data_version = data_version
+
+    def _load_tables(self) -> Dict[str, str]:
+        """Décrire les tables de la base (colonnes, clés étrangères, valeurs énumérées)"""
+        db = self.db_manager
+        schema = db.get_schema()
+        foreign_keys = {table: db.get_foreign_keys(table) for table in schema}
+        enums = {table: db.get_column_enums(table) for table in schema}
+        return self._describe_tables(schema, foreign_keys, enums)
+
+    def _load_vocabulary(self) -> Dict[str, set]:
+        """Mots (au singulier) des noms de catégories et de marques"""
+        vocabulary = {}
+        for table in self.NAMED_TABLES:
+            if table not in self._tables:
+                continue
+            names = self.db_manager.execute_query(f"SELECT name FROM {table}")
+            vocabulary[table] = {
+                _stem(word) for row in names for word in tokenize(row['name'] or '')
+                if len(word) > 2 and word not in RuleBasedQueryParser.STOPWORDS
+            }
+        return vocabulary
+
+    def _describe_tables(self, schema: Dict[str, List[str]], foreign_keys: Dict[str, Dict[str, str]],
+                         enums: Dict[str, Dict[str, List[str]]]) -> Dict[str, str]:
+        """Une ligne compacte par table: table(colonne, clé->table.id) valeurs énumérées"""
+        tables = {}
+        for table, columns in schema.items():
+            if table.endswith("_fts"):
+                continue
+            described = [
+                f"{column}->{foreign_keys[table][column]}" if column in foreign_keys.get(table, {}) else column
+                for column in columns
+            ]
+            line = f"- {table}({', '.join(described)})"
+            values = [f"{column}: {'|'.join(options)}" for column, options in enums.get(table, {}).items()]
+            if values:
+                line += f" [{'; '.join(values)}]"
+            if table == self.CORE_TABLE and self.full_text_search:
+                line += ("\n- products_fts(name, description, material, color): index plein texte FTS5, "
+                         "products_fts.rowid = products.id")
+            tables[table] = line
+        return tables
+
+    def _build_instructions(self) -> str:
+        """Instructions communes à toutes les traductions (préfixe stable du prompt)"""
+        if self.full_text_search:
+            text_search_rule = (
+                "Pour les recherches de texte sur les produits (nom, description, matière, couleur), "
+                "utilise l'index plein texte: JOIN products_fts ON products_fts.rowid = p.id "
+                "WHERE products_fts MATCH 'mot*' (plusieurs mots séparés par des espaces), "
+                "jamais LIKE '%...%'"
+            )
+        else:
+            text_search_rule = "Pour les recherches de texte, utilise LIKE avec des wildcards appropriés"
+        return f"""Tu es un expert en SQL pour une base de données e-commerce de vêtements (SQLite).
+Convertis la requête en langage naturel donnée à la fin en une requête SQL valide.
+
+Règles importantes:
+1. Génère UNIQUEMENT une requête SELECT, sur les seules tables listées
+2. Utilise des JOINs appropriés quand nécessaire (colonne->table.id indique la clé étrangère)
+3. N'ajoute une clause LIMIT que si la requête demande un nombre précis de résultats (le serveur pagine les résultats); termine ORDER BY par l'identifiant de la table principale (ex: p.id)
+4. Assure-toi que la requête est sécurisée (pas d'injection SQL)
+5. Utilise des noms de colonnes clairs dans le SELECT
+6. Si la requête concerne les prix, assure-toi d'utiliser la colonne 'price'
+7. {text_search_rule}
+
+Réponds UNIQUEMENT avec un JSON valide:
+{{"sql_query": "la requête SQL générée", "explanation": "explication de ce que fait la requête", "filters_applied": ["liste des filtres appliqués"], "confidence": "niveau de confiance entre 0 et 1"}}
+Si la requête n'a pas de relation avec la base de données e-commerce de vêtements, réponds:
+{{"sql_query": "", "explanation": "Requête non pertinente", "filters_applied": [], "confidence": 0.0, "error": "requete hors contexte"}}"""
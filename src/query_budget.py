@@ -0,0 +1,99 @@
+"""
+Module de contrôle du coût des requêtes générées avant leur exécution
+"""
+import re
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+from config.settings import Config
+from src.database_manager import DatabaseManager, QueryTooExpensiveError
+from src.sql_validator import SQLValidator
+
+
+class QueryCostGuard:
+    """
+    Refus des plans d'exécution manifestement trop coûteux
+
+    Le plan (EXPLAIN QUERY PLAN) est examiné sans exécuter la requête: un
+    parcours complet d'une grande table est refusé s'il est répété, c'est-à-dire
+    placé dans la boucle interne d'une jointure ou dans une sous-requête
+    corrélée, ou si la requête parcourt entièrement trop de grandes tables.
+    """
+
+    # "SCAN p", "SCAN b USING COVERING INDEX idx" (les recherches par index sont exclues)
+    SCAN_PATTERN = re.compile(r"^SCAN (\S+)")
+    LOOP_PATTERN = re.compile(r"^(SCAN|SEARCH) ")
+
+    def __init__(self, db_manager: DatabaseManager, sql_validator: SQLValidator,
+                 large_table_rows: int = None, max_full_scans: int = None):
+        self.db_manager = db_manager
+        self.sql_validator = sql_validator
+        self.large_table_rows = large_table_rows if large_table_rows is not None else Config.LARGE_TABLE_ROWS
+        self.max_full_scans = max_full_scans if max_full_scans is not None else Config.QUERY_MAX_FULL_SCANS
+        self.rejections = 0
+        self._table_rows: Dict[str, int] = {}
+        self._version: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def check(self, sql_query: str, params: tuple = ()):
+        """
+        Vérifier le plan d'exécution d'une requête
+
+        Raises:
+            QueryTooExpensiveError: Si le plan est jugé trop coûteux
+        """
+        references = self.sql_validator.table_references(sql_query)
+        plan = self.db_manager.explain_query_plan(sql_query, params)
+        details = {row['id']: row['detail'] for row in plan}
+
+        full_scans = []
+        for index, row in enumerate(plan):
+            match = self.SCAN_PATTERN.match(row['detail'])
+            if not match or "VIRTUAL TABLE" in row['detail']:
+                continue
+            table = references.get(match.group(1)) or match.group(1)
+            if self.table_rows(table) < self.large_table_rows:
+                continue
+            if self._is_repeated(plan, index, details):
+                self._reject(f"parcours complet répété de la table {table}")
+            full_scans.append(table)
+
+        if len(full_scans) > self.max_full_scans:
+            self._reject(f"parcours complet de {len(full_scans)} grandes tables ({', '.join(full_scans)})")
+
+    def table_rows(self, table: str) -> int:
+        """Estimer le nombre de lignes d'une table (mis en cache par version des données)"""
+        version = self.db_manager.data_version()
+        with self._lock:
+            if version != self._version:
+                self._table_rows, self._version = {}, version
+            if table in self._table_rows:
+                return self._table_rows[table]
+
+        rows = 0
+        if table in self.sql_validator.schema:
+            # Le plus grand rowid borne le nombre de lignes sans parcourir la table
+            result = self.db_manager.execute_query(f'SELECT MAX(rowid) AS estimate FROM "{table}"')
+            rows = result[0]['estimate'] or 0
+        with self._lock:
+            self._table_rows[table] = rows
+        return rows
+
+    def _is_repeated(self, plan: List[Dict[str, Any]], index: int, details: Dict[int, str]) -> bool:
+        """Vérifier si une étape du plan est exécutée pour chaque ligne d'une autre"""
+        row = plan[index]
+        # Boucle interne: une autre boucle la précède au même niveau du plan
+        for previous in plan[:index]:
+            if previous['parent'] == row['parent'] and self.LOOP_PATTERN.match(previous['detail']):
+                return True
+        # Sous-requête corrélée: réévaluée pour chaque ligne de la requête englobante
+        parent = row['parent']
+        while parent:
+            if details.get(parent, "").startswith("CORRELATED"):
+                return True
+            parent = next((step['parent'] for step in plan if step['id'] == parent), 0)
+        return False
+
+    def _reject(self, reason: str):
+        """Refuser la requête"""
+        self.rejections += 1
+        raise QueryTooExpensiveError(reason)
@@ -0,0 +1,199 @@
+"""
+Module de cache des traductions langage naturel -> SQL
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Dict, Any, Optional
+from config.settings import Config
+from src.metrics import CACHE_LOOKUPS
+
+
+def normalize_query(user_query: str) -> str:
+    """
+    Normaliser une requête utilisateur pour en faire une clé de cache
+
+    La casse, les accents, la ponctuation et les espaces multiples sont ignorés,
+    de sorte que "Robes d'été ?" et "robes d ete" partagent la même clé.
+    """
+    text = unicodedata.normalize('NFKD', user_query.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def connect_cache_database(db_path: str) -> sqlite3.Connection:
+    """Ouvrir une connexion à la base SQLite des caches partagés entre workers"""
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=5.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class TranslationCache:
+    """
+    Cache LRU/TTL des traductions NL -> SQL, partagé entre workers via SQLite
+
+    Une lecture n'écrit rien dans la base: les dates de dernier accès sont
+    conservées en mémoire et reportées par lot, lors d'un enregistrement
+    (avant l'éviction LRU) ou au plus toutes les ACCESS_FLUSH_INTERVAL secondes.
+    """
+
+    # Champs du résultat Gemini conservés dans le cache (déjà validés)
+    CACHED_FIELDS = ('sql_query', 'explanation', 'filters_applied', 'confidence')
+    # Délai maximal (s) avant le report des dates de dernier accès
+    ACCESS_FLUSH_INTERVAL = 30.0
+
+    def __init__(self, db_path: str = None, max_entries: int = None, ttl: int = None):
+        self.db_path = db_path or Config.CACHE_DATABASE_PATH
+        self.max_entries = max_entries if max_entries is not None else Config.TRANSLATION_CACHE_MAX_ENTRIES
+        self.ttl = ttl if ttl is not None else Config.TRANSLATION_CACHE_TTL
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Dates de dernier accès non encore reportées dans la base
+        self._pending_access: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        self.init_table()
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Obtenir la connexion au cache propre au thread courant"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect_cache_database(self.db_path)
+        return conn
+
+    def init_table(self):
+        """Créer la table du cache si nécessaire"""
+        conn = self.get_connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS translation_cache (
+                    query_key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_translation_cache_last_access
+                ON translation_cache (last_access)
+            """)
+
+    def get(self, user_query: str) -> Optional[Dict[str, Any]]:
+        """
+        Rechercher la traduction d'une requête
+
+        Args:
+            user_query: Requête de l'utilisateur en langage naturel
+
+        Returns:
+            Le résultat validé mis en cache, ou None en cas d'absence/expiration
+        """
+        key = normalize_query(user_query)
+        now = time.time()
+        conn = self.get_connection()
+
+        row = conn.execute(
+            "SELECT payload, created_at FROM translation_cache WHERE query_key = ?", (key,)
+        ).fetchone()
+
+        if row is None or (self.ttl and now - row[1] > self.ttl):
+            if row is not None:
+                with conn:
+                    conn.execute("DELETE FROM translation_cache WHERE query_key = ?", (key,))
+            self._record(hit=False)
+            return None
+
+        with self._lock:
+            self._pending_access[key] = now
+            due = time.monotonic() - self._last_flush >= self.ACCESS_FLUSH_INTERVAL
+        if due:
+            with conn:
+                self._flush_access(conn)
+        self._record(hit=True)
+        return json.loads(row[0])
+
+    def set(self, user_query: str, result: Dict[str, Any]):
+        """
+        Enregistrer la traduction validée d'une requête
+
+        Args:
+            user_query: Requête de l'utilisateur en langage naturel
+            result: Résultat validé de process_natural_query
+        """
+        key = normalize_query(user_query)
+        payload = {field: result.get(field) for field in self.CACHED_FIELDS}
+        now = time.time()
+        conn = self.get_connection()
+
+        with conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO translation_cache
+                   (query_key, payload, created_at, last_access) VALUES (?, ?, ?, ?)""",
+                (key, json.dumps(payload, ensure_ascii=False), now, now)
+            )
+            self._flush_access(conn)
+            # Éviction LRU au-delà de la taille maximale
+            conn.execute(
+                """DELETE FROM translation_cache WHERE query_key IN (
+                       SELECT query_key FROM translation_cache
+                       ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        """Vider le cache et remettre les compteurs à zéro"""
+        conn = self.get_connection()
+        with conn:
+            conn.execute("DELETE FROM translation_cache")
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self._pending_access.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Obtenir les compteurs de succès/échecs du cache"""
+        entries = self.get_connection().execute(
+            "SELECT COUNT(*) FROM translation_cache"
+        ).fetchone()[0]
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / total if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl
+        }
+
+    def _flush_access(self, conn: sqlite3.Connection):
+        """Reporter les dates de dernier accès en attente (dans la transaction de l'appelant)"""
+        with self._lock:
+            pending, self._pending_access = self._pending_access, {}
+            self._last_flush = time.monotonic()
+        if pending:
+            conn.executemany(
+                "UPDATE translation_cache SET last_access = MAX(last_access, ?) WHERE query_key = ?",
+                [(accessed, key) for key, accessed in pending.items()]
+            )
+
+    def _record(self, hit: bool):
+        """Mettre à jour les compteurs de manière thread-safe"""
+        CACHE_LOOKUPS.inc(cache="translation", result="hit" if hit else "miss")
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
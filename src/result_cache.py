@@ -0,0 +1,283 @@
+"""
+Module de cache mémoire des résultats de requêtes SQL
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Hashable, List, Optional, Tuple
+from config.settings import Config
+from src.metrics import CACHE_LOOKUPS
+from src.query_cache import connect_cache_database
+
+# Dépendance optionnelle: (dé)sérialisation plus rapide des entrées partagées
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Chaînes et identifiants entre guillemets conservés tels quels, blancs réduits ailleurs
+_SQL_SPACING = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|\s+")
+
+# Résultats non reproductibles à données égales (aléatoire, date courante)
+_VOLATILE_SQL = re.compile(
+    r"\b(random|randomblob|changes|total_changes|last_insert_rowid)\s*\(|'now'|\bcurrent_(date|time|timestamp)\b",
+    re.IGNORECASE
+)
+
+
+def normalize_sql(sql: str) -> str:
+    """Normaliser une requête SQL (espaces) sans modifier ses littéraux"""
+    return _SQL_SPACING.sub(lambda match: match.group(1) or " ", sql).strip().rstrip(";").strip()
+
+
+class ResultCache:
+    """
+    Cache LRU des résultats de requêtes, borné en mémoire
+
+    Les lignes sont conservées sous forme de tuples (plus compacts que des
+    dictionnaires, et immuables: l'appelant construit ses propres lignes ou
+    colonnes à partir de l'entrée sans pouvoir altérer le cache). Chaque entrée est associée à la
+    version des données au moment de l'exécution; le cache est vidé dès que
+    cette version change (écriture locale ou d'un autre processus).
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 8
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.bytes = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Tuple[str, ...], List[tuple], int]]" = OrderedDict()
+        self._version: Any = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cacheable(sql: str) -> bool:
+        """Vérifier que le résultat d'une requête ne dépend que des données"""
+        return _VOLATILE_SQL.search(sql) is None
+
+    @staticmethod
+    def key(sql: str, params: tuple = ()) -> Hashable:
+        """Clé d'une requête: SQL normalisé et paramètres"""
+        return normalize_sql(sql), tuple(params)
+
+    def get(self, key: Hashable, version: Any) -> Optional[Tuple[Tuple[str, ...], List[tuple]]]:
+        """Obtenir (colonnes, lignes) en cache (None si absent ou si les données ont changé)"""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        CACHE_LOOKUPS.inc(cache="result", result="miss" if entry is None else "hit")
+        if entry is None:
+            return None
+        return entry[0], entry[1]
+
+    def set(self, key: Hashable, version: Any, columns: Tuple[str, ...], rows: List[tuple]):
+        """Enregistrer un résultat obtenu pour la version des données indiquée"""
+        size = self._estimate_size(key, columns, rows)
+        if size > self.max_entry_bytes:
+            return
+
+        with self._lock:
+            self._check_version(version)
+            if version != self._version:
+                # Résultat calculé avant une écriture déjà prise en compte: périmé
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[2]
+            self._entries[key] = (columns, rows, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """Vider le cache"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Obtenir les compteurs et l'occupation mémoire du cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+    def _check_version(self, version: Any):
+        """Vider le cache si la version des données a changé (verrou déjà acquis)"""
+        if version == self._version:
+            return
+        # Une version plus ancienne (lecture concurrente d'une écriture) ne vide pas le cache
+        if self._version is not None and version < self._version:
+            return
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self.bytes = 0
+        self._version = version
+
+    @staticmethod
+    def _estimate_size(key: Hashable, columns: Tuple[str, ...], rows: List[tuple]) -> int:
+        """Estimer la mémoire occupée par une entrée (octets)"""
+        size = sys.getsizeof(key[0]) + sys.getsizeof(rows) + sum(sys.getsizeof(column) for column in columns)
+        for row in rows:
+            size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+        return size
+
+
+class SharedResultCache:
+    """
+    Cache des résultats partagé entre workers via la base SQLite des caches
+
+    Second niveau derrière le cache mémoire de chaque processus: un résultat
+    calculé par un worker est servi par les autres sans réexécuter la requête.
+    Chaque entrée est enregistrée avec la génération des données lue avant
+    l'exécution (compteur des écritures de la base, voir
+    DatabaseManager.generation), et n'est servie qu'à cette même génération.
+    Les lectures ne modifient pas la base (pas de mise à jour d'accès), afin
+    que les workers ne se disputent pas le verrou d'écriture; l'éviction se
+    fait par ancienneté.
+    """
+
+    def __init__(self, database: str, db_path: str = None, max_entries: int = None,
+                 max_entry_bytes: int = None):
+        """
+        Args:
+            database: Chemin de la base de données dont les résultats sont mis en cache
+            db_path: Base SQLite des caches
+            max_entries: Nombre maximal de résultats conservés
+            max_entry_bytes: Taille maximale d'un résultat sérialisé (octets)
+        """
+        self.database = os.path.abspath(database)
+        self.db_path = db_path or Config.CACHE_DATABASE_PATH
+        self.max_entries = max_entries or Config.SHARED_RESULT_CACHE_MAX_ENTRIES
+        self.max_entry_bytes = max_entry_bytes or Config.RESULT_CACHE_MAX_BYTES // 8
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.init_tables()
+
+    def get_connection(self):
+        """Obtenir la connexion propre au thread courant"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect_cache_database(self.db_path)
+        return conn
+
+    def init_tables(self):
+        """Créer la table des résultats si nécessaire"""
+        conn = self.get_connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    database TEXT NOT NULL,
+                    query_key TEXT NOT NULL,
+                    generation INTEGER NOT NULL,
+                    payload BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (database, query_key)
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_result_cache_created_at
+                ON result_cache (database, created_at)
+            """)
+
+    @staticmethod
+    def key(key: Hashable) -> str:
+        """Clé textuelle d'une clé de ResultCache.key (SQL normalisé, paramètres)"""
+        sql, params = key
+        return json.dumps([sql, list(params)], ensure_ascii=False, default=repr)
+
+    def get(self, key: Hashable, generation: int) -> Optional[Tuple[Tuple[str, ...], List[tuple]]]:
+        """Obtenir (colonnes, lignes) enregistrés à cette génération, ou None"""
+        row = self.get_connection().execute(
+            "SELECT payload FROM result_cache WHERE database = ? AND query_key = ? AND generation = ?",
+            (self.database, self.key(key), generation)
+        ).fetchone()
+        CACHE_LOOKUPS.inc(cache="shared_result", result="miss" if row is None else "hit")
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return None
+        columns, rows = orjson.loads(row[0]) if orjson is not None else json.loads(row[0])
+        return tuple(columns), [tuple(values) for values in rows]
+
+    def set(self, key: Hashable, generation: int, columns: Tuple[str, ...], rows: List[tuple]):
+        """Enregistrer un résultat lu à la génération indiquée"""
+        try:
+            payload = (orjson.dumps([columns, rows]) if orjson is not None
+                       else json.dumps([columns, rows], ensure_ascii=False).encode("utf-8"))
+        except TypeError:
+            # Valeurs binaires (BLOB): non partagées
+            return
+        if len(payload) > self.max_entry_bytes:
+            return
+
+        conn = self.get_connection()
+        with conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO result_cache (database, query_key, generation, payload, created_at)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (self.database, self.key(key), generation, payload, time.time())
+            )
+            # Entrées des générations passées, puis les plus anciennes au-delà de la taille maximale
+            conn.execute("DELETE FROM result_cache WHERE database = ? AND generation < ?",
+                         (self.database, generation))
+            conn.execute(
+                """DELETE FROM result_cache WHERE database = ? AND query_key IN (
+                       SELECT query_key FROM result_cache WHERE database = ?
+                       ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.database, self.database, self.max_entries)
+            )
+
+    def clear(self):
+        """Vider le cache de cette base et remettre les compteurs à zéro"""
+        conn = self.get_connection()
+        with conn:
+            conn.execute("DELETE FROM result_cache WHERE database = ?", (self.database,))
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Obtenir les compteurs de ce processus et le nombre d'entrées partagées"""
+        entries = self.get_connection().execute(
+            "SELECT COUNT(*) FROM result_cache WHERE database = ?", (self.database,)
+        ).fetchone()[0]
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / total if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries
+        }
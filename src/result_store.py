@@ -0,0 +1,87 @@
+"""
+Module de conservation des résultats de requêtes pour les appels de suivi
+"""
+import json
+import threading
+import time
+import uuid
+from typing import Dict, Any, Optional
+from config.settings import Config
+from src.query_cache import connect_cache_database
+
+
+class ResultStore:
+    """
+    Stockage temporaire des résultats, indexé par un identifiant de résultat
+
+    Les entrées sont conservées dans la base SQLite des caches afin qu'un appel
+    de suivi (résumé différé, etc.) puisse être servi par n'importe quel worker.
+    """
+
+    def __init__(self, db_path: str = None, ttl: int = None):
+        self.db_path = db_path or Config.CACHE_DATABASE_PATH
+        self.ttl = ttl if ttl is not None else Config.RESULT_STORE_TTL
+        self._local = threading.local()
+        self.init_table()
+
+    def get_connection(self):
+        """Obtenir la connexion propre au thread courant"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect_cache_database(self.db_path)
+        return conn
+
+    def init_table(self):
+        """Créer la table des résultats si nécessaire"""
+        conn = self.get_connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_results (
+                    result_id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_query_results_expires_at
+                ON query_results (expires_at)
+            """)
+
+    def put(self, payload: Dict[str, Any]) -> str:
+        """
+        Enregistrer un résultat
+
+        Args:
+            payload: Données sérialisables en JSON
+
+        Returns:
+            L'identifiant du résultat
+        """
+        result_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self.get_connection()
+        with conn:
+            # Purge opportuniste des entrées expirées
+            conn.execute("DELETE FROM query_results WHERE expires_at < ?", (now,))
+            conn.execute(
+                "INSERT INTO query_results (result_id, payload, expires_at) VALUES (?, ?, ?)",
+                (result_id, json.dumps(payload, ensure_ascii=False, default=str), now + self.ttl)
+            )
+        return result_id
+
+    def get(self, result_id: str) -> Optional[Dict[str, Any]]:
+        """Obtenir un résultat, ou None s'il est inconnu ou expiré"""
+        row = self.get_connection().execute(
+            "SELECT payload FROM query_results WHERE result_id = ? AND expires_at >= ?",
+            (result_id, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, result_id: str, payload: Dict[str, Any]):
+        """Remplacer le contenu d'un résultat existant sans modifier son expiration"""
+        conn = self.get_connection()
+        with conn:
+            conn.execute(
+                "UPDATE query_results SET payload = ? WHERE result_id = ?",
+                (json.dumps(payload, ensure_ascii=False, default=str), result_id)
+            )
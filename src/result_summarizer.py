@@ -0,0 +1,54 @@
+"""
+Module de résumé local des résultats, sans appel au LLM
+"""
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+# Colonnes reconnues pour le prix et la marque, quel que soit l'alias choisi dans le SELECT
+PRICE_COLUMNS = ('price', 'prix', 'unit_price')
+BRAND_COLUMNS = ('brand', 'brand_name', 'marque')
+
+
+def summarize_results(data: List[Dict[str, Any]], count: Optional[int] = None) -> str:
+    """
+    Résumer des résultats à partir d'un modèle de phrase
+
+    Le résumé couvre le nombre de résultats, la fourchette de prix et les
+    marques les plus représentées lorsque ces colonnes sont présentes.
+
+    Args:
+        data: Lignes de résultat
+        count: Nombre total de résultats (par défaut len(data))
+
+    Returns:
+        Réponse en langage naturel
+    """
+    count = len(data) if count is None else count
+    if not count:
+        return "Aucun résultat trouvé pour votre recherche."
+
+    sentences = [f"J'ai trouvé {count} résultat(s)."]
+
+    prices = [
+        row[column] for row in data for column in PRICE_COLUMNS
+        if isinstance(row.get(column), (int, float))
+    ]
+    if prices:
+        low, high = min(prices), max(prices)
+        if low == high:
+            sentences.append(f"Prix: {low:.2f} €.")
+        else:
+            sentences.append(f"Prix de {low:.2f} € à {high:.2f} €.")
+
+    brands = Counter(
+        row[column] for row in data for column in BRAND_COLUMNS if row.get(column)
+    )
+    if brands:
+        top_brands = ", ".join(f"{name} ({total})" for name, total in brands.most_common(3))
+        sentences.append(f"Marques principales: {top_brands}.")
+
+    names = [row['name'] for row in data[:3] if row.get('name')]
+    if names:
+        sentences.append(f"Par exemple: {', '.join(names)}.")
+
+    return " ".join(sentences)
@@ -0,0 +1,409 @@
+"""
+Module de traduction déterministe des requêtes simples sur le catalogue
+"""
+import itertools
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, Any, FrozenSet, Hashable, List, Optional, Tuple
+from config.settings import Config
+from src.database_manager import DatabaseManager
+
+
+def tokenize(text: str) -> List[str]:
+    """Découper une requête en mots normalisés (minuscules, sans accents) et en nombres"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = text.replace('_', ' ')
+    for pattern, replacement in RuleBasedQueryParser.SYNONYMS:
+        text = re.sub(pattern, replacement, text)
+    return re.findall(r"\d+(?:[.,]\d+)?|[a-z]+", text)
+
+
+class RuleBasedQueryParser:
+    """
+    Traducteur intention/attributs des requêtes simples sur les produits
+
+    Les vocabulaires (marques, catégories, couleurs, matières) sont lus dans la
+    base et les genres/saisons proviennent des contraintes CHECK du schéma. Une
+    requête n'est traduite que si chacun de ses mots est reconnu; sinon parse()
+    retourne None et la requête est confiée à Gemini.
+
+    Après le premier chargement, les vocabulaires ne sont relus que si le
+    compteur de génération "vocabulary" de la base a changé (nouvelle marque,
+    catégorie, couleur ou matière; pas une commande). Le rechargement se fait
+    dans un thread d'arrière-plan, au plus une fois par refresh_interval, et
+    l'ancien vocabulaire reste utilisé en attendant.
+    """
+
+    # Réécritures appliquées au texte normalisé avant le découpage
+    SYNONYMS = [
+        (r"\btee[\s-]?shirt", "t shirt"),
+        (r"\btshirt", "t shirt"),
+    ]
+
+    # Mots sans effet sur la requête générée
+    STOPWORDS = {
+        "a", "affiche", "afficher", "articles", "article", "au", "aux", "avec", "ce", "ces",
+        "cherche", "chercher", "d", "de", "des", "donne", "du", "en", "est", "et", "il",
+        "je", "l", "la", "le", "les", "liste", "lister", "me", "moi", "mon", "montre",
+        "montrer", "pour", "produit", "produits", "quel", "quelle", "quelles", "quels",
+        "qui", "sont", "tous", "tout", "toute", "toutes", "trouve", "trouver", "un", "une",
+        "vetement", "vetements", "veux", "voir", "voudrais", "y"
+    }
+
+    # Mots qui inversent le sens d'une requête ("sans manches", "pas en coton")
+    NEGATION_WORDS = {"sans", "pas", "non", "sauf", "hors", "ni", "aucun", "aucune"}
+
+    # Mots désignant le catalogue lui-même ("tous les produits")
+    CATALOG_WORDS = {"produit", "produits", "article", "articles", "vetement", "vetements"}
+
+    # Formes supplémentaires des valeurs énumérées du schéma
+    ENUM_SYNONYMS = {
+        "homme": ["masculin"],
+        "femme": ["feminin", "feminine"],
+        "enfant": ["junior", "juniors"],
+        "unisexe": ["mixte"],
+        "ete": ["estival", "estivale", "estivaux"]
+    }
+
+    # Expressions fixes: (mots, attribut, valeur)
+    KEYWORDS = [
+        (("promotion",), "promotion", True),
+        (("promo",), "promotion", True),
+        (("soldes",), "promotion", True),
+        (("solde",), "promotion", True),
+        (("reduction",), "promotion", True),
+        (("remise",), "promotion", True),
+        (("disponible",), "in_stock", True),
+        (("stock",), "in_stock", True),
+        (("moins", "cher"), "order", "price_asc"),
+        (("pas", "cher"), "order", "price_asc"),
+        (("plus", "cher"), "order", "price_desc"),
+        (("nouveau",), "order", "newest"),
+        (("nouveaux",), "order", "newest"),
+        (("nouvelle",), "order", "newest"),
+        (("nouveaute",), "order", "newest"),
+        (("recent",), "order", "newest"),
+        (("dernier",), "order", "newest"),
+    ]
+
+    # Expressions de seuil de prix précédant un montant
+    PRICE_MAX_PREFIXES = [("moins", "de"), ("inferieur", "a"), ("en", "dessous", "de"),
+                          ("sous",), ("maximum",), ("max",)]
+    PRICE_MIN_PREFIXES = [("plus", "de"), ("superieur", "a"), ("au", "dessus", "de"),
+                          ("a", "partir", "de"), ("minimum",), ("min",)]
+    CURRENCY_WORDS = {"euro", "euros", "eur", "e"}
+
+    ORDER_CLAUSES = {
+        "price_asc": "p.price ASC, p.id",
+        "price_desc": "p.price DESC, p.id",
+        "newest": "p.created_at DESC, p.id"
+    }
+
+    def __init__(self, db_manager: DatabaseManager, refresh_interval: float = None):
+        self.db_manager = db_manager
+        # Délai minimal entre deux rechargements quand le catalogue change en continu
+        self.refresh_interval = (refresh_interval if refresh_interval is not None
+                                 else Config.VOCABULARY_REFRESH_INTERVAL)
+        self._phrases = None
+        self._max_phrase_length = 1
+        # Version des données déjà contrôlée et génération du vocabulaire chargé
+        self._data_version: Optional[Tuple[int, int]] = None
+        self._generation: Optional[int] = None
+        self._loaded_at = 0.0
+        self._reloader: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def refresh_vocabulary(self):
+        """(Re)charger les vocabulaires depuis la base de données"""
+        # Versions lues avant les tables: une écriture concurrente provoquera un nouveau chargement
+        data_version = self.db_manager.data_version()
+        generation = self.db_manager.generation("vocabulary")
+        phrases = {}
+
+        def add(words: Tuple[str, ...], slot: str, value: Any, label: str):
+            for variant in self._variants(words):
+                phrases.setdefault(variant, (slot, value, label))
+
+        # Catégories: une catégorie couvre aussi ses sous-catégories
+        categories = self.db_manager.execute_query("SELECT id, name, parent_id FROM categories")
+        children = {}
+        for row in categories:
+            children.setdefault(row['parent_id'], []).append(row['id'])
+        for row in categories:
+            add(tuple(tokenize(row['name'])), "category",
+                tuple(self._descendants(row['id'], children)), row['name'])
+
+        for row in self.db_manager.execute_query("SELECT id, name FROM brands"):
+            words = tuple(tokenize(row['name']))
+            add(words, "brand", row['id'], row['name'])
+            if len(words) > 1:
+                add(("".join(words),), "brand", row['id'], row['name'])
+
+        for column, slot in (("color", "color"), ("material", "material")):
+            values = self.db_manager.execute_query(
+                f"SELECT DISTINCT {column} FROM products WHERE {column} IS NOT NULL"
+            )
+            for row in values:
+                add(tuple(tokenize(row[column])), slot, row[column], row[column])
+
+        for column, values in self.db_manager.get_column_enums('products').items():
+            for value in values:
+                words = tuple(tokenize(value))
+                add(words, column, value, value)
+                for synonym in self.ENUM_SYNONYMS.get(" ".join(words), []):
+                    add((synonym,), column, value, value)
+
+        for words, slot, value in self.KEYWORDS:
+            add(words, slot, value, " ".join(words))
+
+        with self._lock:
+            self._phrases = phrases
+            self._max_phrase_length = max(len(words) for words in phrases)
+            self._data_version, self._generation = data_version, generation
+
+    def _refresh(self):
+        """Charger les vocabulaires au premier appel, puis planifier leur rechargement s'ils ont changé"""
+        if self._phrases is None:
+            self.refresh_vocabulary()
+            return
+        # Aucune écriture depuis le dernier contrôle: ni lecture du compteur ni rechargement
+        data_version = self.db_manager.data_version()
+        if data_version == self._data_version:
+            return
+        if self.db_manager.generation("vocabulary") == self._generation:
+            self._data_version = data_version
+        else:
+            self._schedule_reload()
+
+    def _schedule_reload(self):
+        """Lancer le rechargement en arrière-plan (un seul à la fois, au plus un par refresh_interval)"""
+        with self._lock:
+            if self._reloader is not None and self._reloader.is_alive():
+                return
+            if time.monotonic() - self._loaded_at < self.refresh_interval:
+                return
+            self._loaded_at = time.monotonic()
+            self._reloader = threading.Thread(target=self._reload, name="vocabulary-reload", daemon=True)
+            self._reloader.start()
+
+    def _reload(self):
+        """Corps du thread de rechargement: en cas d'échec, l'ancien vocabulaire reste utilisé"""
+        try:
+            self.refresh_vocabulary()
+        except Exception:
+            # Nouvel essai à un prochain appel, après refresh_interval
+            pass
+
+    def parse(self, user_query: str, lenient: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Traduire une requête simple en SELECT paramétré
+
+        Args:
+            user_query: La requête de l'utilisateur en langage naturel
+            lenient: Ignorer les mots inconnus (traduction approximative, utilisée
+                quand le LLM est indisponible) au lieu de renoncer
+
+        Returns:
+            Dictionnaire au format de GeminiNLQProcessor.process_natural_query
+            (avec les paramètres SQL dans 'sql_params'), ou None si la requête
+            n'est pas entièrement reconnue (en mode lenient: si aucun attribut
+            n'est reconnu)
+        """
+        self._refresh()
+
+        tokens = tokenize(user_query)
+        if lenient and self.NEGATION_WORDS.intersection(tokens):
+            # Une négation ignorée inverserait le sens de la requête
+            return None
+        slots = self._extract_slots(tokens, lenient)
+        if slots is None or (not slots and (lenient or not self.CATALOG_WORDS.intersection(tokens))):
+            return None
+        return self._build_query(slots)
+
+    def key_terms(self, user_query: str) -> FrozenSet[Hashable]:
+        """
+        Attributs reconnus dans une requête, les mots inconnus étant ignorés
+
+        Deux requêtes qui désignent les mêmes valeurs du catalogue (catégorie,
+        marque, couleur, matière, genre, saison), les mêmes prix et le même tri
+        ont les mêmes termes clés; les nombres et négations non reconnus en
+        font aussi partie.
+        """
+        self._refresh()
+
+        tokens = tokenize(user_query)
+        terms = set()
+        i = 0
+        while i < len(tokens):
+            price = self._match_price(tokens, i)
+            if price is not None:
+                slot, value, i = price
+                terms.add((slot, value))
+                continue
+
+            for length in range(min(self._max_phrase_length, len(tokens) - i), 0, -1):
+                match = self._phrases.get(tuple(tokens[i:i + length]))
+                if match is not None:
+                    terms.add(match[:2])
+                    i += length
+                    break
+            else:
+                if tokens[i][0].isdigit() or tokens[i] in self.NEGATION_WORDS:
+                    terms.add(("word", tokens[i]))
+                i += 1
+        return frozenset(terms)
+
+    def _extract_slots(self, tokens: List[str], lenient: bool = False) -> Optional[Dict[str, Tuple[Any, str]]]:
+        """Associer chaque mot à un attribut; None si un mot est ambigu ou (sauf lenient) inconnu"""
+        slots = {}
+
+        def assign(slot: str, value: Any, label: str) -> bool:
+            if slot in slots and slots[slot][0] != value:
+                return False
+            slots[slot] = (value, label)
+            return True
+
+        i = 0
+        while i < len(tokens):
+            price = self._match_price(tokens, i)
+            if price is not None:
+                slot, value, i = price
+                if not assign(slot, value, str(value)):
+                    return None
+                continue
+
+            for length in range(min(self._max_phrase_length, len(tokens) - i), 0, -1):
+                match = self._phrases.get(tuple(tokens[i:i + length]))
+                if match is not None:
+                    if not assign(*match):
+                        return None
+                    i += length
+                    break
+            else:
+                if not lenient and tokens[i] not in self.STOPWORDS:
+                    return None
+                i += 1
+
+        return slots
+
+    def _match_price(self, tokens: List[str], i: int) -> Optional[Tuple[str, Any, int]]:
+        """Reconnaître un filtre de prix à la position i: (attribut, valeur, position suivante)"""
+        def number_at(position: int) -> Optional[float]:
+            if position < len(tokens) and re.fullmatch(r"\d+(?:[.,]\d+)?", tokens[position]):
+                return float(tokens[position].replace(',', '.'))
+            return None
+
+        def skip_currency(position: int) -> int:
+            return position + 1 if position < len(tokens) and tokens[position] in self.CURRENCY_WORDS else position
+
+        if tokens[i] == "entre":
+            low, high = number_at(i + 1), None
+            position = skip_currency(i + 2)
+            if low is not None and position < len(tokens) and tokens[position] == "et":
+                high = number_at(position + 1)
+            if high is not None:
+                return "price_between", (min(low, high), max(low, high)), skip_currency(position + 2)
+            return None
+
+        for slot, prefixes in (("price_max", self.PRICE_MAX_PREFIXES), ("price_min", self.PRICE_MIN_PREFIXES)):
+            for prefix in prefixes:
+                if tuple(tokens[i:i + len(prefix)]) == prefix:
+                    amount = number_at(i + len(prefix))
+                    if amount is not None:
+                        return slot, amount, skip_currency(i + len(prefix) + 1)
+        return None
+
+    def _build_query(self, slots: Dict[str, Tuple[Any, str]]) -> Dict[str, Any]:
+        """Construire la requête SQL paramétrée à partir des attributs reconnus"""
+        conditions, params, filters = ["p.is_active = 1"], [], []
+
+        if "category" in slots:
+            category_ids, label = slots["category"]
+            conditions.append(f"p.category_id IN ({', '.join('?' for _ in category_ids)})")
+            params.extend(category_ids)
+            filters.append(f"catégorie: {label}")
+        if "brand" in slots:
+            conditions.append("p.brand_id = ?")
+            params.append(slots["brand"][0])
+            filters.append(f"marque: {slots['brand'][1]}")
+        if "gender" in slots:
+            # Les produits unisexes conviennent à tous les genres
+            conditions.append("p.gender IN (?, 'unisexe')")
+            params.append(slots["gender"][0])
+            filters.append(f"genre: {slots['gender'][1]}")
+        for slot, column, name in (("season", "season", "saison"), ("color", "color", "couleur"),
+                                   ("material", "material", "matière")):
+            if slot in slots:
+                conditions.append(f"p.{column} = ?")
+                params.append(slots[slot][0])
+                filters.append(f"{name}: {slots[slot][1]}")
+        if "price_max" in slots:
+            conditions.append("p.price < ?")
+            params.append(slots["price_max"][0])
+            filters.append(f"prix < {slots['price_max'][0]:g}")
+        if "price_min" in slots:
+            conditions.append("p.price > ?")
+            params.append(slots["price_min"][0])
+            filters.append(f"prix > {slots['price_min'][0]:g}")
+        if "price_between" in slots:
+            low, high = slots["price_between"][0]
+            conditions.append("p.price BETWEEN ? AND ?")
+            params.extend([low, high])
+            filters.append(f"prix entre {low:g} et {high:g}")
+        if "promotion" in slots:
+            conditions.append("p.original_price IS NOT NULL AND p.price < p.original_price")
+            filters.append("en promotion")
+        if "in_stock" in slots:
+            conditions.append("p.stock_quantity > 0")
+            filters.append("en stock")
+
+        # Ordre total (terminé par p.id): pages suivantes lues par clé
+        order_by = " ORDER BY p.id"
+        if "order" in slots:
+            order_by = f" ORDER BY {self.ORDER_CLAUSES[slots['order'][0]]}"
+            filters.append(f"tri: {slots['order'][1]}")
+
+        sql_query = (
+            "SELECT p.id, p.name, p.description, p.price, p.original_price, p.stock_quantity, "
+            "p.color, p.size, p.material, p.gender, p.season, "
+            "b.name AS brand, c.name AS category "
+            "FROM products p "
+            "LEFT JOIN brands b ON b.id = p.brand_id "
+            "LEFT JOIN categories c ON c.id = p.category_id "
+            f"WHERE {' AND '.join(conditions)}{order_by}"
+        )
+
+        return {
+            "sql_query": sql_query,
+            "sql_params": params,
+            "explanation": "Produits actifs" + (f" filtrés par {', '.join(filters)}" if filters else ""),
+            "filters_applied": filters,
+            "confidence": 0.95,
+            "source": "rules"
+        }
+
+    @staticmethod
+    def _variants(words: Tuple[str, ...]) -> List[Tuple[str, ...]]:
+        """Formes singulier/pluriel d'une expression"""
+        options = []
+        for word in words:
+            forms = {word}
+            if len(word) > 3 and word[-1] in "sx":
+                forms.add(word[:-1])
+            elif len(word) > 2 and word.isalpha():
+                forms.add(word + "s")
+            options.append(sorted(forms))
+        return [tuple(variant) for variant in itertools.product(*options)]
+
+    @staticmethod
+    def _descendants(category_id: int, children: Dict[Any, List[int]]) -> List[int]:
+        """Identifiants d'une catégorie et de toutes ses sous-catégories"""
+        ids, pending = [], [category_id]
+        while pending:
+            current = pending.pop()
+            ids.append(current)
+            pending.extend(children.get(current, []))
+        return sorted(ids)
@@ -0,0 +1,286 @@
+"""
+Module d'index vectoriel des traductions: réutilisation du SQL des questions proches
+"""
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Dict, Any, Callable, FrozenSet, Hashable, Optional, Tuple
+import numpy as np
+from config.settings import Config
+from src.metrics import CACHE_LOOKUPS, stage
+from src.query_cache import TranslationCache, connect_cache_database, normalize_query
+from src.rule_based_parser import RuleBasedQueryParser, tokenize
+
+
+def default_key_terms(user_query: str) -> FrozenSet[Hashable]:
+    """Termes devant être identiques entre deux questions proches: nombres et négations"""
+    return frozenset(word for word in tokenize(user_query)
+                     if word[0].isdigit() or word in RuleBasedQueryParser.NEGATION_WORDS)
+
+
+class SemanticQueryIndex:
+    """
+    Index des questions déjà traduites, interrogé par similarité
+
+    Chaque question est représentée par un vecteur de n-grammes de caractères
+    (trigrammes des mots normalisés, mots vides exclus) hachés sur DIMENSIONS
+    composantes, de norme 1: deux reformulations partagent l'essentiel de
+    leurs trigrammes (tee-shirts / t-shirt, hommes / homme). Les vecteurs sont
+    conservés dans un fichier mappé en mémoire (numpy.memmap) partagé entre
+    workers; la recherche est un produit matrice-vecteur (similarité cosinus
+    avec toutes les questions connues). Les traductions sont stockées dans la
+    base SQLite des caches avec le numéro de ligne de leur vecteur.
+
+    Une question proche n'est réutilisée que si sa similarité atteint le seuil
+    et si ses termes clés (nombres, négations, et valeurs du catalogue quand
+    key_terms est fourni) sont identiques: « robes à moins de 30 euros » ne
+    réutilise pas le SQL de « robes à moins de 50 euros ».
+    """
+
+    DIMENSIONS = 512
+    NGRAM_SIZE = 3
+    # Questions proches examinées (du plus similaire au moins similaire) avant d'abandonner
+    CANDIDATES = 5
+
+    def __init__(self, db_path: str = None, vectors_path: str = None, capacity: int = None,
+                 threshold: float = None, ttl: int = None,
+                 key_terms: Optional[Callable[[str], FrozenSet[Hashable]]] = None):
+        """
+        Args:
+            db_path: Base SQLite des caches (traductions associées aux vecteurs)
+            vectors_path: Fichier des vecteurs mappé en mémoire
+            capacity: Nombre maximal de questions (la plus ancienne est remplacée)
+            threshold: Similarité cosinus minimale pour réutiliser une traduction
+            ttl: Durée de vie d'une entrée en secondes (0 = illimitée)
+            key_terms: Termes clés d'une question (par défaut default_key_terms)
+        """
+        self.db_path = db_path or Config.CACHE_DATABASE_PATH
+        self.vectors_path = vectors_path or Config.SEMANTIC_INDEX_PATH
+        self.capacity = capacity or Config.SEMANTIC_INDEX_MAX_ENTRIES
+        self.threshold = threshold if threshold is not None else Config.SEMANTIC_CACHE_THRESHOLD
+        self.ttl = ttl if ttl is not None else Config.TRANSLATION_CACHE_TTL
+        self.key_terms = key_terms or default_key_terms
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Questions connues, rechargées quand la table change (autre worker compris)
+        self._entries: Dict[int, Tuple[str, float]] = {}
+        self._filled = np.zeros(self.capacity, dtype=bool)
+        self._generation: Optional[int] = None
+        created = self._open_vectors()
+        self.init_table()
+        if created:
+            # Vecteurs perdus: les traductions associées ne sont plus retrouvables
+            conn = self.get_connection()
+            with conn:
+                conn.execute("DELETE FROM semantic_index")
+
+    def get_connection(self):
+        """Obtenir la connexion propre au thread courant"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect_cache_database(self.db_path)
+        return conn
+
+    def init_table(self):
+        """Créer la table des traductions indexées et son compteur de génération si nécessaire"""
+        conn = self.get_connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS semantic_index (
+                    slot INTEGER PRIMARY KEY,
+                    query_key TEXT NOT NULL UNIQUE,
+                    question TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            # Une seule ligne, incrémentée par triggers à chaque modification de l'index
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS semantic_index_generation (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    generation INTEGER NOT NULL
+                )
+            """)
+            conn.execute("INSERT OR IGNORE INTO semantic_index_generation (id, generation) VALUES (0, 0)")
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                conn.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS semantic_index_{event.lower()}
+                    AFTER {event} ON semantic_index BEGIN
+                        UPDATE semantic_index_generation SET generation = generation + 1 WHERE id = 0;
+                    END
+                """)
+
+    @classmethod
+    def vectorize(cls, user_query: str) -> np.ndarray:
+        """Vecteur (norme 1) des trigrammes hachés d'une question"""
+        indexes, signs = [], []
+        for word in tokenize(user_query):
+            if word in RuleBasedQueryParser.STOPWORDS:
+                continue
+            padded = f" {word} "
+            for start in range(max(1, len(padded) - cls.NGRAM_SIZE + 1)):
+                # crc32: hachage stable d'un processus à l'autre (contrairement à hash())
+                digest = zlib.crc32(padded[start:start + cls.NGRAM_SIZE].encode("utf-8"))
+                indexes.append(digest % cls.DIMENSIONS)
+                signs.append(1.0 if digest & 0x80000000 else -1.0)
+        vector = np.bincount(indexes, weights=signs, minlength=cls.DIMENSIONS).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, user_query: str, threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Rechercher la traduction d'une question proche
+
+        Args:
+            user_query: Question posée
+            threshold: Similarité minimale, si différente du seuil de l'index
+
+        Returns:
+            La traduction enregistrée (avec "similar_query" et "similarity"), ou None
+        """
+        with stage("semantic_lookup"):
+            result = self._search(user_query, self.threshold if threshold is None else threshold)
+        CACHE_LOOKUPS.inc(cache="semantic", result="miss" if result is None else "hit")
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def add(self, user_query: str, result: Dict[str, Any]):
+        """
+        Indexer la traduction validée d'une question
+
+        La ligne du vecteur est choisie et écrite dans une transaction
+        d'écriture SQLite, ce qui sérialise les ajouts des différents workers.
+        """
+        key = normalize_query(user_query)
+        vector = self.vectorize(user_query)
+        if not key or not vector.any():
+            return
+        payload = {field: result.get(field) for field in TranslationCache.CACHED_FIELDS}
+        conn = self.get_connection()
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                slot = self._free_slot(conn, key)
+                self._vectors[slot] = vector
+                self._vectors.flush()
+                conn.execute(
+                    """INSERT OR REPLACE INTO semantic_index (slot, query_key, question, payload, created_at)
+                       VALUES (?, ?, ?, ?, ?)""",
+                    (slot, key, user_query, json.dumps(payload, ensure_ascii=False), time.time())
+                )
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def warm_up(self):
+        """Charger la liste des questions et lire les vecteurs (pages du fichier mappé)"""
+        self._refresh()
+        if self._entries:
+            np.asarray(self._vectors[:max(self._entries) + 1]).sum()
+
+    def clear(self):
+        """Vider l'index et remettre les compteurs à zéro"""
+        conn = self.get_connection()
+        with conn:
+            conn.execute("DELETE FROM semantic_index")
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Obtenir les compteurs et le remplissage de l'index"""
+        entries = self.get_connection().execute("SELECT COUNT(*) FROM semantic_index").fetchone()[0]
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / total if total else 0.0,
+            "entries": entries,
+            "capacity": self.capacity,
+            "threshold": self.threshold
+        }
+
+    def _search(self, user_query: str, threshold: float) -> Optional[Dict[str, Any]]:
+        """Traduction de la question connue la plus proche qui passe le seuil et les termes clés"""
+        vector = self.vectorize(user_query)
+        if not vector.any():
+            return None
+        self._refresh()
+        if not self._entries:
+            return None
+
+        # Seules les lignes jusqu'à la dernière occupée sont lues
+        size = max(self._entries) + 1
+        scores = np.asarray(self._vectors[:size]) @ vector
+        scores[~self._filled[:size]] = -1.0
+        candidates = np.argsort(scores)[::-1][:self.CANDIDATES]
+        expected_terms = None
+        now = time.time()
+        for slot in candidates:
+            similarity = float(scores[slot])
+            if similarity < threshold:
+                break
+            question, created_at = self._entries.get(int(slot), (None, 0.0))
+            if question is None or (self.ttl and now - created_at > self.ttl):
+                continue
+            if expected_terms is None:
+                expected_terms = self.key_terms(user_query)
+            if self.key_terms(question) != expected_terms:
+                continue
+            row = self.get_connection().execute(
+                "SELECT payload FROM semantic_index WHERE slot = ?", (int(slot),)
+            ).fetchone()
+            if row is None:
+                continue
+            return {**json.loads(row[0]), "similar_query": question, "similarity": round(similarity, 4)}
+        return None
+
+    def _refresh(self):
+        """Recharger la liste des questions si le compteur de génération a changé (autre worker compris)"""
+        conn = self.get_connection()
+        generation = conn.execute("SELECT generation FROM semantic_index_generation WHERE id = 0").fetchone()[0]
+        if generation == self._generation:
+            return
+        rows = conn.execute("SELECT slot, question, created_at FROM semantic_index").fetchall()
+        entries = {slot: (question, created_at) for slot, question, created_at in rows if slot < self.capacity}
+        filled = np.zeros(self.capacity, dtype=bool)
+        filled[list(entries)] = True
+        with self._lock:
+            self._entries, self._filled, self._generation = entries, filled, generation
+
+    def _free_slot(self, conn, key: str) -> int:
+        """Ligne du vecteur d'une question: la sienne, une ligne libre, sinon la plus ancienne"""
+        row = conn.execute("SELECT slot FROM semantic_index WHERE query_key = ?", (key,)).fetchone()
+        if row is not None:
+            return row[0]
+        used = {slot for (slot,) in conn.execute("SELECT slot FROM semantic_index")}
+        if len(used) < self.capacity:
+            return next(slot for slot in range(self.capacity) if slot not in used)
+        return conn.execute("SELECT slot FROM semantic_index ORDER BY created_at LIMIT 1").fetchone()[0]
+
+    def _open_vectors(self) -> bool:
+        """
+        Ouvrir (ou créer) le fichier des vecteurs
+
+        Returns:
+            True si le fichier a été créé (ou recréé pour une autre taille)
+        """
+        directory = os.path.dirname(self.vectors_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        shape = (self.capacity, self.DIMENSIONS)
+        expected_size = self.capacity * self.DIMENSIONS * np.dtype(np.float32).itemsize
+        created = not os.path.exists(self.vectors_path) or os.path.getsize(self.vectors_path) != expected_size
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="w+" if created else "r+", shape=shape)
+        return created
@@ -0,0 +1,102 @@
+"""
+Module de sérialisation rapide des réponses JSON et de compression négociée
+"""
+import base64
+import datetime
+import decimal
+import gzip
+import json
+from typing import Any, Dict, Optional, Set
+import numpy as np
+from fastapi.responses import Response
+from config.settings import Config
+from src.metrics import stage
+
+# Dépendances optionnelles: sérialiseur rapide et compression brotli
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def _default(value: Any) -> Any:
+    """Convertir les types non pris en charge nativement par le sérialiseur"""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Sérialiser en JSON (UTF-8)
+
+    orjson est utilisé s'il est installé: tableaux NumPy, dates et clés non
+    textuelles sont alors traités nativement, sans passage par des objets
+    Python intermédiaires. À défaut, le module json standard est utilisé.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> Set[str]:
+    """Encodages acceptés par le client d'après l'en-tête Accept-Encoding (q=0 exclus)"""
+    encodings = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+def compress(body: bytes, accept_encoding: Optional[str]) -> tuple:
+    """
+    Compresser un corps de réponse si sa taille le justifie
+
+    Returns:
+        (corps, encodage) — encodage None si le corps est renvoyé tel quel
+    """
+    if len(body) < Config.COMPRESSION_MIN_BYTES:
+        return body, None
+    encodings = accepted_encodings(accept_encoding)
+    with stage("compression"):
+        if brotli is not None and "br" in encodings:
+            return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+        if "gzip" in encodings or "*" in encodings:
+            return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+    return body, None
+
+
+def json_response(content: Any, accept_encoding: Optional[str] = None, status_code: int = 200) -> Response:
+    """Construire une réponse JSON sérialisée rapidement et compressée selon le client"""
+    with stage("serialization"):
+        body = dumps(content)
+    body, encoding = compress(body, accept_encoding)
+    headers: Dict[str, str] = {"Vary": "Accept-Encoding"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(body, status_code=status_code, media_type="application/json", headers=headers)
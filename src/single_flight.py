@@ -0,0 +1,85 @@
+"""
+Module de déduplication des traitements identiques exécutés simultanément
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from src.metrics import SINGLE_FLIGHT
+
+
+class SingleFlight:
+    """
+    Partage d'un traitement en cours entre appels concurrents (threads)
+
+    Le premier appel pour une clé exécute la fonction; les appels de même clé
+    qui arrivent avant la fin l'attendent et reçoivent le même résultat (ou la
+    même exception). La clé est libérée dès la fin du traitement: rien n'est
+    mis en cache au-delà.
+    """
+
+    def __init__(self):
+        self.shared = 0
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """Exécuter func, ou attendre l'exécution déjà en cours pour la même clé"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            SINGLE_FLIGHT.inc(role="follower")
+            return future.result()
+
+        SINGLE_FLIGHT.inc(role="leader")
+        try:
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        """Nombre de traitements en cours"""
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    Variante asyncio de SingleFlight
+
+    Le traitement s'exécute dans sa propre tâche: l'annulation d'un appelant
+    (client déconnecté) n'interrompt pas le traitement attendu par les autres.
+    """
+
+    def __init__(self):
+        self.shared = 0
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Exécuter func, ou attendre l'exécution déjà en cours pour la même clé"""
+        task = self._tasks.get(key)
+        if task is not None:
+            self.shared += 1
+            SINGLE_FLIGHT.inc(role="follower")
+        else:
+            SINGLE_FLIGHT.inc(role="leader")
+            # La tâche hérite du contexte de l'appelant (mesure des étapes comprise)
+            task = self._tasks[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        """Nombre de traitements en cours"""
+        return len(self._tasks)
@@ -0,0 +1,561 @@
+"""
+Module de validation des requêtes SQL générées (analyse lexicale et liste blanche du schéma)
+"""
+import re
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from config.settings import Config
+
+
+class SQLValidationError(ValueError):
+    """Requête SQL refusée par le validateur"""
+
+
+class Token(NamedTuple):
+    """Unité lexicale d'une requête SQL"""
+    kind: str
+    value: str
+    start: int
+    end: int
+
+    @property
+    def word(self) -> str:
+        """Valeur en minuscules (comparaison des mots-clés et identifiants)"""
+        return self.value.lower()
+
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+  | (?P<param>\?\d*|[:@$][^\W\d]\w*)
+  | (?P<name>[^\W\d]\w*)
+  | (?P<operator>\|\||<=|>=|<>|!=|==|<<|>>|[-+*/%<>=~&|(),;.])
+""", re.VERBOSE | re.DOTALL)
+
+
+def tokenize(sql: str) -> List[Token]:
+    """
+    Découper une requête SQL en unités lexicales (espaces exclus)
+
+    Raises:
+        SQLValidationError: Si un caractère ne peut pas être analysé (chaîne non fermée...)
+    """
+    tokens = []
+    position = 0
+    while position < len(sql):
+        match = TOKEN_PATTERN.match(sql, position)
+        if match is None:
+            raise SQLValidationError(f"Requête SQL mal formée près de: {sql[position:position + 20]!r}")
+        kind = match.lastgroup
+        if kind != "space":
+            value = match.group()
+            if kind == "quoted":
+                value = value[1:-1].replace('""', '"')
+            tokens.append(Token(kind, value, match.start(), match.end()))
+        position = match.end()
+    return tokens
+
+
+class SQLValidator:
+    """
+    Validateur des requêtes SELECT produites par le LLM
+
+    La requête est découpée en unités lexicales (les chaînes et identifiants
+    ne sont donc jamais confondus avec des mots-clés) puis vérifiée:
+    instruction SELECT unique, sans commentaire, tables et colonnes présentes
+    dans le schéma, jointures toutes conditionnées (pas de produit cartésien).
+    apply_limit impose ensuite une limite au nombre de lignes renvoyées.
+    """
+
+    KEYWORDS = {
+        "select", "distinct", "all", "from", "where", "group", "by", "having", "order", "asc", "desc",
+        "limit", "offset", "as", "on", "using", "join", "inner", "left", "right", "full", "outer",
+        "cross", "natural", "and", "or", "not", "in", "is", "null", "like", "glob", "regexp", "match",
+        "between", "case", "when", "then", "else", "end", "exists", "collate", "escape", "union",
+        "intersect", "except", "true", "false", "nocase", "rtrim", "binary", "over", "partition",
+        "window", "rows", "range", "groups", "unbounded", "preceding", "following", "current", "row",
+        "filter", "nulls", "first", "last", "current_date", "current_time", "current_timestamp",
+        "integer", "int", "real", "text", "numeric", "decimal", "float", "boolean", "varchar", "blob",
+    }
+    # Mots-clés d'instructions qui n'ont rien à faire dans une requête de lecture
+    FORBIDDEN_KEYWORDS = {
+        "insert", "update", "delete", "drop", "alter", "create", "replace", "truncate", "attach",
+        "detach", "pragma", "vacuum", "reindex", "analyze", "exec", "execute", "begin", "commit",
+        "rollback", "savepoint", "release", "with", "returning",
+    }
+    FORBIDDEN_FUNCTIONS = {"load_extension", "readfile", "writefile", "edit", "fts3_tokenizer"}
+    # Colonnes implicites acceptées sur toute table (rowid) et sur les tables FTS (rank)
+    PSEUDO_COLUMNS = {"rowid", "oid", "_rowid_", "rank"}
+    JOIN_WORDS = {"join", "inner", "left", "right", "full", "outer", "cross", "natural"}
+    CLAUSE_WORDS = {"where", "group", "having", "order", "limit", "window", "union", "intersect", "except"}
+
+    def __init__(self, schema: Optional[Dict[str, List[str]]] = None):
+        """
+        Args:
+            schema: Colonnes de chaque table autorisée; sans schéma, seules les
+                vérifications de structure sont faites
+        """
+        self.schema = {table.lower(): {column.lower() for column in columns}
+                       for table, columns in (schema or {}).items()} or None
+
+    @classmethod
+    def from_database(cls, db_manager) -> "SQLValidator":
+        """Construire le validateur à partir du schéma de la base"""
+        return cls(db_manager.get_schema())
+
+    def is_valid(self, sql_query: str) -> bool:
+        """Indiquer si une requête passe la validation"""
+        try:
+            self.validate(sql_query)
+        except SQLValidationError:
+            return False
+        return True
+
+    def validate(self, sql_query: str) -> List[Token]:
+        """
+        Valider une requête SQL
+
+        Args:
+            sql_query: Requête générée
+
+        Returns:
+            Les unités lexicales de la requête (sans le point-virgule final)
+
+        Raises:
+            SQLValidationError: Avec la raison du refus
+        """
+        if not sql_query or not sql_query.strip():
+            raise SQLValidationError("Requête SQL vide")
+
+        tokens = self._statement_tokens(sql_query)
+        if tokens[0].word != "select":
+            raise SQLValidationError("Seules les requêtes SELECT sont autorisées")
+
+        for index, token in enumerate(tokens):
+            if token.kind != "name" or self._is_qualified(tokens, index):
+                continue
+            if token.word in self.FORBIDDEN_KEYWORDS and not self._is_call(tokens, index):
+                raise SQLValidationError(f"Mot-clé interdit: {token.value.upper()}")
+            if token.word in self.FORBIDDEN_FUNCTIONS and self._is_call(tokens, index):
+                raise SQLValidationError(f"Fonction interdite: {token.value}")
+
+        tables, aliases = self._check_from_clauses(tokens)
+        self._check_identifiers(tokens, tables, aliases)
+        return tokens
+
+    def table_references(self, sql_query: str) -> Dict[str, Optional[str]]:
+        """
+        Associer chaque nom de table ou alias d'une requête à sa table réelle
+        
+        Returns:
+            nom ou alias -> table (None pour une sous-requête de la clause FROM)
+        """
+        references, _ = self._check_from_clauses(self._statement_tokens(sql_query))
+        return references
+
+    def apply_limit(self, sql_query: str, limit: Optional[int] = None, max_limit: Optional[int] = None) -> str:
+        """
+        Imposer une limite au nombre de lignes d'une requête
+
+        La limite retenue est celle demandée (par défaut Config.DEFAULT_LIMIT),
+        plafonnée à max_limit (par défaut Config.MAX_RESULT_LIMIT). Une clause
+        LIMIT absente est ajoutée; une clause plus large ou non numérique est
+        remplacée. Les sous-requêtes ne sont pas modifiées.
+
+        Args:
+            sql_query: Requête SELECT validée
+            limit: Nombre de lignes demandé
+            max_limit: Plafond du nombre de lignes
+
+        Returns:
+            La requête avec sa clause LIMIT
+        """
+        target = self.row_limit(limit, max_limit)
+        tokens = self._statement_tokens(sql_query)
+        sql_query = sql_query[:tokens[-1].end]
+
+        limit_index = self._top_level_index(tokens, "limit")
+        if limit_index is None:
+            return f"{sql_query} LIMIT {target}"
+
+        start, end = self._limit_count_span(tokens, limit_index)
+        count_tokens = tokens[start:end]
+        if (len(count_tokens) == 1 and count_tokens[0].kind == "number"
+                and count_tokens[0].value.isdigit() and int(count_tokens[0].value) <= target):
+            return sql_query
+        return f"{sql_query[:count_tokens[0].start]}{target}{sql_query[count_tokens[-1].end:]}"
+
+    @staticmethod
+    def row_limit(limit: Optional[int] = None, max_limit: Optional[int] = None) -> int:
+        """Nombre de lignes retenu: celui demandé (défaut Config.DEFAULT_LIMIT), plafonné à max_limit"""
+        return max(1, min(limit or Config.DEFAULT_LIMIT, max_limit or Config.MAX_RESULT_LIMIT))
+
+    def remove_limit(self, sql_query: str, min_count: int) -> str:
+        """
+        Retirer la clause LIMIT d'une requête si elle n'exprime qu'un plafond générique
+
+        Seule une clause LIMIT numérique d'au moins min_count lignes, sans
+        décalage, est retirée; une limite plus petite (les 5 moins chers...)
+        fait partie de la question et est conservée.
+        """
+        tokens = self._statement_tokens(sql_query)
+        sql_query = sql_query[:tokens[-1].end]
+        count = self.limit_count(sql_query)
+        if count is not None and count >= min_count:
+            return sql_query[:tokens[self._top_level_index(tokens, "limit")].start].rstrip()
+        return sql_query
+
+    def limit_count(self, sql_query: str) -> Optional[int]:
+        """Nombre de lignes de la clause LIMIT principale, si elle est numérique et sans décalage"""
+        tokens = self._statement_tokens(sql_query)
+        limit_index = self._top_level_index(tokens, "limit")
+        if limit_index is None:
+            return None
+        count_tokens = tokens[limit_index + 1:]
+        if (len(count_tokens) == 1 and count_tokens[0].kind == "number"
+                and count_tokens[0].value.isdigit()):
+            return int(count_tokens[0].value)
+        return None
+
+    def order_by_terms(self, sql_query: str) -> Optional[List[Tuple[Optional[str], str, bool]]]:
+        """
+        Termes de la clause ORDER BY principale, s'ils sont tous de simples colonnes
+
+        Returns:
+            Liste de (table ou alias, colonne, ordre décroissant), ou None sans
+            clause ORDER BY ou si un terme est une expression (ou précise NULLS, COLLATE...)
+        """
+        tokens = self._statement_tokens(sql_query)
+        order_index = self._top_level_index(tokens, "order")
+        if order_index is None or order_index + 1 >= len(tokens) or tokens[order_index + 1].word != "by":
+            return None
+        limit_index = self._top_level_index(tokens, "limit")
+        clause = tokens[order_index + 2:limit_index]
+
+        terms = []
+        term: List[Token] = []
+        for token in clause + [Token("operator", ",", 0, 0)]:
+            if not (token.kind == "operator" and token.value == ","):
+                term.append(token)
+                continue
+            descending = False
+            if term and term[-1].kind == "name" and term[-1].word in ("asc", "desc"):
+                descending = term.pop().word == "desc"
+            if len(term) == 1 and self._is_identifier(term[0]):
+                terms.append((None, term[0].word, descending))
+            elif (len(term) == 3 and self._is_identifier(term[0]) and term[1].value == "."
+                  and term[1].kind == "operator" and self._is_identifier(term[2])):
+                terms.append((term[0].word, term[2].word, descending))
+            else:
+                return None
+            term = []
+        return terms
+
+    def append_select_columns(self, sql_query: str, expressions: List[str]) -> str:
+        """
+        Ajouter des expressions à la liste SELECT principale
+
+        Raises:
+            SQLValidationError: Pour une requête composée (UNION...), DISTINCT
+                (les colonnes ajoutées changeraient le dédoublonnage) ou sans FROM
+        """
+        tokens = self._statement_tokens(sql_query)
+        if any(depth == 0 and token.kind == "name" and token.word in ("union", "intersect", "except")
+               for token, depth in self._with_depth(tokens)):
+            raise SQLValidationError("Requête composée")
+        if len(tokens) > 1 and tokens[1].word == "distinct":
+            raise SQLValidationError("Requête DISTINCT")
+        from_index = self._top_level_index(tokens, "from")
+        if from_index is None:
+            raise SQLValidationError("Requête sans clause FROM")
+        position = tokens[from_index - 1].end
+        return f"{sql_query[:position]}, {', '.join(expressions)}{sql_query[position:]}"
+
+    def _top_level_index(self, tokens: List[Token], word: str) -> Optional[int]:
+        """Position du premier mot-clé donné hors parenthèses"""
+        return next(
+            (index for index, (token, depth) in enumerate(self._with_depth(tokens))
+             if depth == 0 and token.kind == "name" and token.word == word),
+            None
+        )
+
+    def _statement_tokens(self, sql_query: str) -> List[Token]:
+        """Analyser une instruction unique, sans commentaire"""
+        tokens = tokenize(sql_query)
+        if any(token.kind == "comment" for token in tokens):
+            raise SQLValidationError("Les commentaires SQL ne sont pas autorisés")
+        while tokens and tokens[-1].value == ";":
+            tokens.pop()
+        if not tokens:
+            raise SQLValidationError("Requête SQL vide")
+        if any(token.value == ";" and token.kind == "operator" for token in tokens):
+            raise SQLValidationError("Une seule instruction SQL est autorisée")
+
+        depth = 0
+        for token in tokens:
+            if token.value == "(" and token.kind == "operator":
+                depth += 1
+            elif token.value == ")" and token.kind == "operator":
+                depth -= 1
+                if depth < 0:
+                    break
+        if depth != 0:
+            raise SQLValidationError("Parenthèses non équilibrées")
+        return tokens
+
+    @staticmethod
+    def _with_depth(tokens: List[Token]) -> List[Tuple[Token, int]]:
+        """Associer à chaque unité sa profondeur de parenthèses"""
+        result, depth = [], 0
+        for token in tokens:
+            if token.kind == "operator" and token.value == ")":
+                depth -= 1
+            result.append((token, depth))
+            if token.kind == "operator" and token.value == "(":
+                depth += 1
+        return result
+
+    @staticmethod
+    def _limit_count_span(tokens: List[Token], limit_index: int) -> Tuple[int, int]:
+        """Positions de l'expression du nombre de lignes d'une clause LIMIT"""
+        start, depth = limit_index + 1, 0
+        separators = []
+        for index in range(start, len(tokens)):
+            token = tokens[index]
+            if token.kind == "operator" and token.value == "(":
+                depth += 1
+            elif token.kind == "operator" and token.value == ")":
+                depth -= 1
+            elif depth == 0 and (token.value == "," or token.word == "offset"):
+                separators.append((index, token.value))
+        if not separators:
+            return start, len(tokens)
+        index, value = separators[0]
+        # LIMIT décalage, nombre / LIMIT nombre OFFSET décalage
+        return (index + 1, len(tokens)) if value == "," else (start, index)
+
+    @staticmethod
+    def _is_qualified(tokens: List[Token], index: int) -> bool:
+        """L'identifiant suit un point (colonne qualifiée)"""
+        return index > 0 and tokens[index - 1].kind == "operator" and tokens[index - 1].value == "."
+
+    @staticmethod
+    def _is_call(tokens: List[Token], index: int) -> bool:
+        """L'identifiant est suivi d'une parenthèse ouvrante (appel de fonction)"""
+        return index + 1 < len(tokens) and tokens[index + 1].value == "(" and tokens[index + 1].kind == "operator"
+
+    def _is_identifier(self, token: Token) -> bool:
+        """Unité utilisable comme nom de table ou alias"""
+        return token.kind == "quoted" or (token.kind == "name" and token.word not in self.KEYWORDS)
+
+    def _check_from_clauses(self, tokens: List[Token]) -> Tuple[Dict[str, Optional[str]], Set[str]]:
+        """
+        Vérifier les tables et jointures de chaque clause FROM
+
+        Returns:
+            (nom ou alias -> table réelle, ou None pour une sous-requête), et les alias de colonnes
+        """
+        references: Dict[str, Optional[str]] = {}
+        column_aliases: Set[str] = set()
+        equalities = self._column_equalities(tokens)
+
+        for index, token in enumerate(tokens):
+            if token.kind == "name" and token.word == "as" and index + 1 < len(tokens):
+                column_aliases.add(tokens[index + 1].word)
+            elif self._is_implicit_alias(tokens, index):
+                column_aliases.add(token.word)
+            if token.kind != "name" or token.word != "from":
+                continue
+
+            clause_refs = self._parse_from_clause(tokens, index + 1, references)
+            names = [name for name, _ in clause_refs]
+            for position, (name, comma_joined) in enumerate(clause_refs):
+                # Jointure par virgule: une égalité entre colonnes doit la relier aux autres tables
+                if comma_joined and not any(
+                    frozenset((name, other)) in equalities for other in names[:position] + names[position + 1:]
+                ):
+                    raise SQLValidationError(f"Produit cartésien: aucune condition de jointure pour '{name}'")
+        return references, column_aliases
+
+    def _parse_from_clause(self, tokens: List[Token], index: int,
+                           references: Dict[str, Optional[str]]) -> List[Tuple[str, bool]]:
+        """Analyser une liste de tables (virgules et JOIN) jusqu'à la clause suivante"""
+        clause_refs: List[Tuple[str, bool]] = []
+        comma_joined = False
+        while index < len(tokens):
+            token = tokens[index]
+            # Table ou sous-requête
+            if token.kind == "operator" and token.value == "(":
+                index = self._skip_parentheses(tokens, index)
+                table = None
+            elif self._is_identifier(token):
+                table = token.word
+                index += 1
+                if index + 1 < len(tokens) and tokens[index].value == "." and tokens[index].kind == "operator":
+                    # Nom qualifié par le schéma (main.products)
+                    if token.word != "main":
+                        raise SQLValidationError(f"Schéma non autorisé: {token.value}")
+                    table = tokens[index + 1].word
+                    index += 2
+                self._check_table(table)
+            else:
+                raise SQLValidationError(f"Table attendue après FROM/JOIN, trouvé: {token.value}")
+
+            name = table
+            if index < len(tokens) and tokens[index].word == "as" and tokens[index].kind == "name":
+                index += 1
+            if index < len(tokens) and self._is_identifier(tokens[index]):
+                name = tokens[index].word
+                index += 1
+            if name is None:
+                raise SQLValidationError("Une sous-requête dans FROM doit avoir un alias")
+            references[name] = table
+            if table is not None:
+                references.setdefault(table, table)
+            clause_refs.append((name, comma_joined))
+
+            # Condition de jointure
+            if index < len(tokens) and tokens[index].word in ("on", "using") and tokens[index].kind == "name":
+                index = self._skip_condition(tokens, index + 1)
+
+            if index >= len(tokens):
+                break
+            token = tokens[index]
+            if token.kind == "operator" and token.value == ",":
+                comma_joined = True
+                index += 1
+                continue
+            if token.kind == "name" and token.word in self.JOIN_WORDS:
+                join_words = []
+                while index < len(tokens) and tokens[index].word in self.JOIN_WORDS:
+                    join_words.append(tokens[index].word)
+                    index += 1
+                if "cross" in join_words:
+                    raise SQLValidationError("Produit cartésien: CROSS JOIN non autorisé")
+                if "join" not in join_words:
+                    raise SQLValidationError("Jointure mal formée")
+                if "natural" not in join_words and not self._has_join_condition(tokens, index):
+                    raise SQLValidationError("Produit cartésien: JOIN sans condition ON/USING")
+                comma_joined = False
+                continue
+            break
+        return clause_refs
+
+    def _has_join_condition(self, tokens: List[Token], index: int) -> bool:
+        """La table jointe à partir de index est suivie d'une clause ON ou USING"""
+        if index < len(tokens) and tokens[index].value == "(" and tokens[index].kind == "operator":
+            index = self._skip_parentheses(tokens, index)
+        else:
+            index += 1
+            if index < len(tokens) and tokens[index].value == "." and tokens[index].kind == "operator":
+                index += 2
+        if index < len(tokens) and tokens[index].word == "as":
+            index += 1
+        if index < len(tokens) and self._is_identifier(tokens[index]):
+            index += 1
+        return index < len(tokens) and tokens[index].kind == "name" and tokens[index].word in ("on", "using")
+
+    def _skip_condition(self, tokens: List[Token], index: int) -> int:
+        """Avancer jusqu'à la fin d'une condition de jointure"""
+        while index < len(tokens):
+            token = tokens[index]
+            if token.kind == "operator" and token.value == "(":
+                index = self._skip_parentheses(tokens, index)
+                continue
+            if token.kind == "operator" and token.value in (",", ")"):
+                break
+            if token.kind == "name" and (token.word in self.JOIN_WORDS or token.word in self.CLAUSE_WORDS):
+                break
+            index += 1
+        return index
+
+    @staticmethod
+    def _skip_parentheses(tokens: List[Token], index: int) -> int:
+        """Position qui suit la parenthèse fermante correspondant à celle de index"""
+        depth = 0
+        for position in range(index, len(tokens)):
+            token = tokens[position]
+            if token.kind == "operator" and token.value == "(":
+                depth += 1
+            elif token.kind == "operator" and token.value == ")":
+                depth -= 1
+                if depth == 0:
+                    return position + 1
+        return len(tokens)
+
+    @staticmethod
+    def _column_equalities(tokens: List[Token]) -> Set[frozenset]:
+        """Couples de tables reliés par une égalité a.colonne = b.colonne"""
+        pairs = set()
+        for index in range(len(tokens) - 6):
+            window = tokens[index:index + 7]
+            if (window[1].value == "." and window[3].value in ("=", "==") and window[5].value == "."
+                    and window[0].kind in ("name", "quoted") and window[4].kind in ("name", "quoted")
+                    and window[0].word != window[4].word):
+                pairs.add(frozenset((window[0].word, window[4].word)))
+        return pairs
+
+    def _check_table(self, table: str):
+        """Vérifier qu'une table fait partie du schéma autorisé"""
+        if table.startswith("sqlite_"):
+            raise SQLValidationError(f"Table système non autorisée: {table}")
+        if self.schema is not None and table not in self.schema:
+            raise SQLValidationError(f"Table inconnue: {table}")
+
+    def _check_identifiers(self, tokens: List[Token], references: Dict[str, Optional[str]],
+                           column_aliases: Set[str]):
+        """Vérifier que chaque colonne référencée existe dans les tables de la requête"""
+        if self.schema is None:
+            return
+        known_columns = set(self.PSEUDO_COLUMNS)
+        for table in references.values():
+            if table is not None:
+                known_columns |= self.schema[table]
+
+        for index, token in enumerate(tokens):
+            if token.kind not in ("name", "quoted") or token.word in self.KEYWORDS:
+                continue
+            if self._is_call(tokens, index):
+                continue
+
+            next_is_dot = index + 1 < len(tokens) and tokens[index + 1].value == "." and tokens[index + 1].kind == "operator"
+            if next_is_dot:
+                if token.word == "main":
+                    continue
+                if token.word not in references:
+                    raise SQLValidationError(f"Table ou alias inconnu: {token.value}")
+                continue
+
+            if self._is_qualified(tokens, index):
+                qualifier = tokens[index - 2].word
+                table = references.get(qualifier)
+                if qualifier == "main" or table is None:
+                    # Table elle-même (main.products) ou sous-requête: colonnes non connues à l'avance
+                    if token.word not in known_columns and token.word not in column_aliases \
+                            and token.word not in references:
+                        raise SQLValidationError(f"Colonne inconnue: {qualifier}.{token.value}")
+                elif token.word not in self.schema[table] and token.word not in self.PSEUDO_COLUMNS:
+                    raise SQLValidationError(f"Colonne inconnue: {qualifier}.{token.value}")
+                continue
+
+            if token.word in known_columns or token.word in references or token.word in column_aliases:
+                continue
+            if token.kind == "quoted":
+                # SQLite interprète un identifiant entre guillemets inconnu comme une chaîne
+                continue
+            raise SQLValidationError(f"Colonne inconnue: {token.value}")
+
+    def _is_implicit_alias(self, tokens: List[Token], index: int) -> bool:
+        """Alias de colonne sans AS (SELECT SUM(x) total, ... FROM)"""
+        token = tokens[index]
+        if not index or not self._is_identifier(token):
+            return False
+        following = tokens[index + 1] if index + 1 < len(tokens) else None
+        if following is not None and following.value != "," and following.word != "from":
+            return False
+        previous = tokens[index - 1]
+        return (previous.kind in ("number", "string", "quoted")
+                or (previous.kind == "operator" and previous.value == ")")
+                or (previous.kind == "name" and previous.word not in self.KEYWORDS))
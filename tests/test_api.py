@@ -95,6 +95,19 @@ class TestAPIIntegration(unittest.TestCase):
         data = response.json()
         self.assertFalse(data.get("success", True))
     
+    def test_query_compression(self):
+        """Test de la compression négociée des réponses volumineuses"""
+        response = requests.post(
+            f"{self.BASE_URL}/query",
+            json={"query": "Montre-moi tous les produits", "limit": 50, "summary_mode": "template"},
+            headers={"Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers.get("vary"), "Accept-Encoding")
+        if len(response.content) >= 1024:
+            self.assertEqual(response.headers.get("content-encoding"), "gzip")
+        self.assertIn("natural_response", response.json())
+    
     def test_home_page(self):
         """Test de la page d'accueil"""
         response = requests.get(f"{self.BASE_URL}/")
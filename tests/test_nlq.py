@@ -2,13 +2,58 @@
 Tests unitaires pour le système NLQ E-commerce
 """
 import unittest
+import asyncio
+import time
 import sys
 import os
+import sqlite3
+import tempfile
+import datetime
+import decimal
+import gzip
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from starlette.requests import Request
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.database_manager import DatabaseManager
-from src.nlq_service import NLQService
+from src.columnar import ColumnarResult
+from src.database_manager import ConnectionPool, DatabaseManager, QueryTooExpensiveError
+from src.database_stats import DatabaseStats
+from src.fake_llm import FakeGenerativeModel
+from src.gemini_processor import GeminiNLQProcessor
+from src.llm_scheduler import BATCH, INTERACTIVE, LatencyWindow, LLMScheduler, LLMUnavailableError
+from src.metrics import LLM_HEDGES, MetricsRegistry, REGISTRY, track_request, stage
+from src.nlq_service import NLQService, AsyncNLQService
+from src.pagination import InvalidCursorError, ResultPager, decode_cursor
+from src.prompt_builder import PromptBuilder
+from src.query_budget import QueryCostGuard
+from src.query_cache import TranslationCache, normalize_query
+from src.rule_based_parser import RuleBasedQueryParser
+from src.sql_validator import SQLValidator, SQLValidationError
+from src.result_cache import ResultCache, SharedResultCache, normalize_sql
+from src.result_summarizer import summarize_results
+from src.semantic_index import SemanticQueryIndex
+from src.serialization import accepted_encodings, compress, dumps, json_response
+from src.single_flight import SingleFlight
 from config.settings import Config
+import main
+
+# Caches des services construits par les tests: dans un répertoire temporaire, hors du dépôt
+_cache_dir = tempfile.TemporaryDirectory()
+_cache_paths = mock.patch.multiple(
+    Config,
+    CACHE_DATABASE_PATH=os.path.join(_cache_dir.name, "cache.db"),
+    SEMANTIC_INDEX_PATH=os.path.join(_cache_dir.name, "semantic_index.f32"),
+)
+
+def setUpModule():
+    _cache_paths.start()
+
+def tearDownModule():
+    _cache_paths.stop()
+    _cache_dir.cleanup()
 
 class TestDatabaseManager(unittest.TestCase):
     """Tests pour le gestionnaire de base de données"""
@@ -38,14 +83,183 @@ class TestDatabaseManager(unittest.TestCase):
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0]['name'], "Test Category")
 
+    def test_iter_query_chunks(self):
+        """Tester la lecture des résultats par blocs"""
+        for i in range(5):
+            self.db.execute_update("INSERT INTO brands (name) VALUES (?)", (f"Marque {i}",))
+        
+        chunks = list(self.db.iter_query("SELECT name FROM brands ORDER BY id", chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(chunks[0][0]['name'], "Marque 0")
+
+    def test_bulk_insert(self):
+        """Tester l'insertion massive par lots"""
+        rows = ((f"Marque {i}", "Pays") for i in range(2500))
+        inserted = self.db.bulk_insert("brands", ["name", "country"], rows, batch_size=1000)
+        self.assertEqual(inserted, 2500)
+        self.assertEqual(self.db.execute_query("SELECT COUNT(*) AS count FROM brands")[0]['count'], 2500)
+        
+        # Les doublons sont ignorés avec or_ignore
+        inserted = self.db.bulk_insert("brands", ["name"], [("Marque 0",), ("Nouvelle",)], or_ignore=True)
+        self.assertEqual(inserted, 1)
+    
+    def test_bulk_load_defer_indexes(self):
+        """Tester la recréation des index après un chargement massif"""
+        with self.db.bulk_load(defer_indexes=True):
+            self.db.bulk_insert("brands", ["name"], [("Nike",)])
+        indexes = [row['name'] for row in self.db.execute_query(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"
+        )]
+        self.assertIn('idx_products_category', indexes)
+    
+    def test_bulk_load_failure(self):
+        """Tester l'annulation d'un chargement massif en échec, sans ANALYZE"""
+        # Base fichier: en mémoire, le cache de pages est partagé avec les connexions de lecture
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.db = DatabaseManager(os.path.join(tmp_dir.name, "test.db"))
+        self.addCleanup(self.db.close)
+        pragmas = {"synchronous": 1, "temp_store": 1, "cache_size": -4096}
+        with self.db.write_connection() as conn:
+            for pragma, value in pragmas.items():
+                conn.execute(f"PRAGMA {pragma} = {value}")
+        with self.assertRaises(ValueError):
+            with self.db.bulk_load(defer_indexes=True) as conn:
+                conn.execute("INSERT INTO brands (name) VALUES ('Nike')")
+                raise ValueError("ligne invalide")
+        self.assertEqual(self.db.execute_query("SELECT COUNT(*) AS count FROM brands")[0]['count'], 0)
+        tables = [row['name'] for row in self.db.execute_query("SELECT name FROM sqlite_master")]
+        self.assertIn('idx_products_category', tables)
+        self.assertNotIn('sqlite_stat1', tables)
+        # Réglages de la connexion d'écriture rétablis à leurs valeurs d'avant le chargement
+        with self.db.write_connection() as conn:
+            for pragma, value in pragmas.items():
+                self.assertEqual(conn.execute(f"PRAGMA {pragma}").fetchone()[0], value)
+    
+    def test_indexes_created(self):
+        """Tester la création des index secondaires"""
+        indexes = [row['name'] for row in self.db.execute_query(
+            "SELECT name FROM sqlite_master WHERE type = 'index'"
+        )]
+        for index in ['idx_products_category', 'idx_products_brand', 'idx_order_items_order']:
+            self.assertIn(index, indexes)
+    
+    def test_schema_initialized_once(self):
+        """Tester qu'une base déjà initialisée n'est pas recréée à l'ouverture"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "test.db")
+            db = DatabaseManager(path)
+            version = db.execute_query("PRAGMA user_version")[0]["user_version"]
+            self.assertEqual(version, DatabaseManager.SCHEMA_VERSION)
+            db.execute_update("DROP INDEX idx_products_brand")
+            fts_enabled = db.fts_enabled
+            db.close()
+            
+            reopened = DatabaseManager(path)
+            indexes = [row['name'] for row in reopened.execute_query(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            )]
+            self.assertNotIn("idx_products_brand", indexes)
+            self.assertEqual(reopened.fts_enabled, fts_enabled)
+            reopened.close()
+    
+    def test_full_text_search_sync(self):
+        """Tester la synchronisation de l'index plein texte par les triggers"""
+        if not self.db.fts_enabled:
+            self.skipTest("FTS5 non disponible")
+        
+        self.db.execute_update("INSERT INTO categories (id, name) VALUES (1, 'Robes')")
+        self.db.execute_update(
+            "INSERT INTO products (id, name, price, category_id) VALUES (1, 'Robe d''été', 30, 1)"
+        )
+        search = "SELECT rowid FROM products_fts WHERE products_fts MATCH ?"
+        self.assertEqual(len(self.db.execute_query(search, ("ete",))), 1)
+        
+        self.db.execute_update("UPDATE products SET name = 'Robe de soirée' WHERE id = 1")
+        self.assertEqual(len(self.db.execute_query(search, ("ete",))), 0)
+        self.assertEqual(len(self.db.execute_query(search, ("soiree",))), 1)
+        
+        self.db.execute_update("DELETE FROM products WHERE id = 1")
+        self.assertEqual(len(self.db.execute_query(search, ("soiree",))), 0)
+
+class TestConnectionPool(unittest.TestCase):
+    """Tests pour le pool de connexions SQLite"""
+    
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp_dir.name, "test.db"), pool_size=2)
+    
+    def tearDown(self):
+        self.db.close()
+        self.tmp_dir.cleanup()
+    
+    def test_connections_are_reused(self):
+        """Tester la réutilisation des connexions de lecture"""
+        with self.db.read_connection() as first:
+            pass
+        with self.db.read_connection() as second:
+            pass
+        self.assertIs(first, second)
+    
+    def test_read_connections_are_query_only(self):
+        """Tester que les connexions de lecture refusent les écritures"""
+        with self.db.read_connection() as conn:
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute("INSERT INTO categories (name) VALUES ('Interdit')")
+    
+    def test_wal_mode(self):
+        """Tester l'activation du mode WAL"""
+        result = self.db.execute_query("PRAGMA journal_mode")
+        self.assertEqual(result[0]['journal_mode'], "wal")
+    
+    def test_unhealthy_connection_is_replaced(self):
+        """Tester le remplacement d'une connexion fermée"""
+        with self.db.read_connection() as conn:
+            conn.close()
+        result = self.db.execute_query("SELECT COUNT(*) AS count FROM categories")
+        self.assertEqual(result[0]['count'], 0)
+
+    def test_health_check_only_when_idle(self):
+        """Tester que la vérification de santé n'a lieu qu'après inactivité ou erreur"""
+        pool = self.db._read_pool
+        self.db.execute_query("SELECT 1")
+        with mock.patch.object(ConnectionPool, "_is_healthy", return_value=True) as check:
+            self.db.execute_query("SELECT 2")
+            check.assert_not_called()
+
+            with mock.patch.object(pool, "health_check_idle", 0):
+                time.sleep(0.01)
+                self.db.execute_query("SELECT 3")
+            check.assert_called_once()
+
+        # Erreur d'utilisation sur une connexion devenue inutilisable: elle est écartée
+        with mock.patch.object(ConnectionPool, "_is_healthy", return_value=False):
+            with self.assertRaises(sqlite3.Error):
+                with self.db.read_connection() as conn:
+                    conn.execute("SELECT * FROM table_absente")
+        self.assertEqual(pool._created, 0)
+        self.assertEqual(self.db.execute_query("SELECT 1 AS one")[0]['one'], 1)
+
 class TestNLQService(unittest.TestCase):
     """Tests pour le service NLQ"""
     
     def setUp(self):
         """Configuration avant chaque test"""
         # Note: Ces tests nécessitent une clé API Gemini valide
+        # Copie de la base du dépôt: le service y crée index et tables dérivées
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        database_path = os.path.join(self.tmp_dir.name, "ecommerce.db")
+        shutil.copyfile(Config.DATABASE_PATH, database_path)
+        patch = mock.patch.object(Config, "DATABASE_PATH", database_path)
+        patch.start()
+        self.addCleanup(patch.stop)
         self.service = NLQService()
     
+    def tearDown(self):
+        self.service.db_manager.close()
+        self.tmp_dir.cleanup()
+    
     def test_empty_query(self):
         """Tester une requête vide"""
         result = self.service.process_query("")
@@ -65,5 +279,1254 @@ class TestNLQService(unittest.TestCase):
         self.assertIsInstance(suggestions, list)
         self.assertGreater(len(suggestions), 0)
 
+class SlowAsyncProcessor:
+    """Processeur factice simulant un appel Gemini lent"""
+    
+    def __init__(self, delay: float, sql_query: str = "SELECT name FROM categories"):
+        self.delay = delay
+        self.sql_query = sql_query
+        self.calls = 0
+    
+    async def process_natural_query_async(self, user_query):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {
+            "sql_query": self.sql_query,
+            "explanation": "Toutes les catégories",
+            "filters_applied": [],
+            "confidence": 0.9
+        }
+    
+    async def generate_natural_response_async(self, query_result, original_query):
+        await asyncio.sleep(self.delay)
+        return f"{len(query_result['data'])} résultat(s)"
+
+class QuotaError(Exception):
+    """Erreur de quota au format google.api_core (code HTTP dans .code)"""
+    code = 429
+
+class QuotaExceededModel:
+    """Modèle factice dont le quota est épuisé"""
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        raise QuotaError("Quota exceeded")
+    
+    async def generate_content_async(self, prompt, **kwargs):
+        return self.generate_content(prompt)
+
+class SlowFirstCallModel(FakeGenerativeModel):
+    """LLM simulé dont seul le premier appel asynchrone est lent"""
+    
+    def __init__(self, first_latency: float):
+        super().__init__()
+        self.first_latency = first_latency
+        self.async_calls = 0
+    
+    async def generate_content_async(self, prompt, **kwargs):
+        self.async_calls += 1
+        if self.async_calls == 1:
+            await asyncio.sleep(self.first_latency)
+        return await super().generate_content_async(prompt, **kwargs)
+
+class TestAsyncNLQService(unittest.TestCase):
+    """Tests pour le service NLQ asynchrone"""
+    
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        db = DatabaseManager(os.path.join(self.tmp_dir.name, "test.db"))
+        db.execute_update("INSERT INTO categories (name) VALUES (?)", ("Robes",))
+        self.service = AsyncNLQService(db_manager=db, nlq_processor=SlowAsyncProcessor(0.2))
+    
+    def tearDown(self):
+        self.service.close()
+        self.tmp_dir.cleanup()
+    
+    def test_process_query_async(self):
+        """Tester le traitement complet d'une requête"""
+        result = asyncio.run(self.service.process_query_async("Toutes les catégories"))
+        self.assertTrue(result['success'])
+        self.assertEqual(result['data'], [{"name": "Robes"}])
+        self.assertEqual(result['natural_response'], "1 résultat(s)")
+    
+    def test_stream_query_async(self):
+        """Tester l'ordre des événements diffusés"""
+        async def collect():
+            return [event async for event in self.service.stream_query_async("Toutes les catégories")]
+        
+        events = asyncio.run(collect())
+        self.assertEqual([event['event'] for event in events], ["metadata", "rows", "summary"])
+        self.assertEqual(events[1]['rows'], [{"name": "Robes"}])
+        self.assertEqual(events[2]['count'], 1)
+    
+    def test_template_summary(self):
+        """Tester le résumé local sans second appel au LLM"""
+        result = asyncio.run(self.service.process_query_async("Toutes les catégories", "template"))
+        self.assertTrue(result['success'])
+        self.assertIn("1 résultat(s)", result['natural_response'])
+        self.assertIsNone(result['result_id'])
+    
+    def test_deferred_summary(self):
+        """Tester la récupération ultérieure du résumé Gemini"""
+        result = asyncio.run(self.service.process_query_async("Toutes les catégories", "deferred"))
+        self.assertIsNotNone(result['result_id'])
+        
+        summary = asyncio.run(self.service.get_summary_async(result['result_id']))
+        self.assertEqual(summary['natural_response'], "1 résultat(s)")
+        self.assertIsNone(asyncio.run(self.service.get_summary_async("inconnu")))
+    
+    def test_stage_timings(self):
+        """Tester la durée par étape jointe à la réponse sur demande"""
+        result = asyncio.run(self.service.process_query_async("Toutes les catégories", "template", True))
+        self.assertIn("sql_execute", result['timings'])
+        self.assertIn("row_conversion", result['timings'])
+        self.assertGreaterEqual(result['timings']['total'], result['timings']['sql_execute'])
+        
+        result = asyncio.run(self.service.process_query_async("Toutes les catégories", "template"))
+        self.assertNotIn("timings", result)
+        self.assertIn('nlq_stage_duration_seconds_count{stage="sql_execute"}', REGISTRY.render())
+    
+    def test_columnar_format(self):
+        """Tester le format colonnes de bout en bout"""
+        result = asyncio.run(self.service.process_query_async(
+            "Toutes les catégories", "template", result_format="columnar"
+        ))
+        self.assertEqual(result['format'], "columnar")
+        self.assertEqual(result['columns'], ["name"])
+        self.assertEqual(result['data'], {"name": ["Robes"]})
+        self.assertEqual(result['count'], 1)
+        self.assertIn("1 résultat(s)", result['natural_response'])
+        
+        result = asyncio.run(self.service.process_query_async("Toutes les catégories", result_format="csv"))
+        self.assertFalse(result['success'])
+    
+    def test_single_flight(self):
+        """Tester le partage d'un traitement entre requêtes identiques simultanées"""
+        async def burst():
+            return await asyncio.gather(
+                *[self.service.process_query_async("Toutes les catégories", "template") for _ in range(5)],
+                self.service.process_query_async("Toutes les catégories", "template", limit=5)
+            )
+        
+        results = asyncio.run(burst())
+        self.assertTrue(all(result['success'] for result in results))
+        # Une traduction pour les 5 requêtes identiques, une pour la limite différente
+        self.assertEqual(self.service.nlq_processor.calls, 2)
+        self.assertEqual(self.service.single_flight.shared, 4)
+        self.assertIsNot(results[0], results[1])
+        self.assertEqual(self.service.single_flight.in_flight(), 0)
+    
+    def test_batch_queries(self):
+        """Tester le traitement parallèle et la déduplication d'un lot"""
+        queries = [f"Requête {i}" for i in range(8)] + ["requête 0 ?", "Requête 1"]
+        
+        start = time.perf_counter()
+        result = asyncio.run(self.service.process_batch_async(queries, "template"))
+        elapsed = time.perf_counter() - start
+        
+        self.assertEqual(result['count'], 10)
+        self.assertEqual(result['unique_queries'], 8)
+        self.assertEqual([item['query'] for item in result['results']], queries)
+        self.assertTrue(all(item['success'] for item in result['results']))
+        self.assertLess(elapsed, 1.0)
+    
+    def test_batch_item_errors(self):
+        """Tester les erreurs individuelles et le refus d'un lot trop grand"""
+        result = asyncio.run(self.service.process_batch_async(["Toutes les catégories", ""], "template"))
+        self.assertEqual(result['failed'], 1)
+        self.assertFalse(result['results'][1]['success'])
+        
+        result = asyncio.run(self.service.process_batch_async(["x"] * (Config.MAX_BATCH_SIZE + 1)))
+        self.assertFalse(result['success'])
+    
+    def test_result_limit(self):
+        """Tester la limite de lignes injectée dans la requête SQL"""
+        self.service.db_manager.execute_update("INSERT INTO categories (name) VALUES (?)", ("Jeans",))
+        result = asyncio.run(self.service.process_query_async("Toutes les catégories", "template", limit=1))
+        self.assertEqual(result['count'], 1)
+        self.assertTrue(result['sql_query'].endswith("LIMIT 1"))
+    
+    def test_warm_up(self):
+        """Tester le préchauffage du service et la requête minimale au LLM"""
+        db = self.service.db_manager
+        model = FakeGenerativeModel()
+        processor = GeminiNLQProcessor(model=model, prompt_builder=PromptBuilder(db))
+        service = AsyncNLQService(db_manager=db, nlq_processor=processor)
+        try:
+            timings = asyncio.run(service.warm_up_async(llm=True))
+        finally:
+            service.close()
+        for step in ("db_pool", "schema", "stats", "llm"):
+            self.assertIn(step, timings)
+        self.assertEqual(model.calls, 1)
+        self.assertEqual(processor.prompt_builder.refreshes, 1)
+        self.assertEqual(service.database_stats.refreshes, 1)
+        
+        # Processeur sans préchauffage: seules les étapes locales sont exécutées
+        timings = asyncio.run(self.service.warm_up_async(llm=True))
+        self.assertNotIn("schema", timings)
+        self.assertNotIn("llm", timings)
+    
+    def test_unknown_summary_mode(self):
+        """Tester le refus d'un mode de résumé inconnu"""
+        result = asyncio.run(self.service.process_query_async("Toutes les catégories", "poeme"))
+        self.assertFalse(result['success'])
+    
+    def test_concurrent_queries_do_not_block(self):
+        """Tester que les requêtes concurrentes s'exécutent en parallèle"""
+        async def run_many():
+            return await asyncio.gather(*[
+                self.service.process_query_async(f"Requête {i}") for i in range(5)
+            ])
+        
+        start = time.perf_counter()
+        results = asyncio.run(run_many())
+        elapsed = time.perf_counter() - start
+        
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertLess(elapsed, 1.0)
+
+class TestRuleBasedQueryParser(unittest.TestCase):
+    """Tests pour le chemin rapide de traduction par règles"""
+    
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.db = DatabaseManager(":memory:")
+        self.db.execute_update("INSERT INTO categories (id, name) VALUES (1, 'T-shirts')")
+        self.db.execute_update("INSERT INTO categories (id, name, parent_id) VALUES (2, 'T-shirts Femme', 1)")
+        self.db.execute_update("INSERT INTO brands (id, name) VALUES (1, 'Nike')")
+        products = [
+            ("T-shirt coton", 15.0, 20.0, 2, 1, "coton", "femme", 10),
+            ("T-shirt sport", 30.0, 30.0, 1, 1, "polyester", "homme", 0),
+            ("T-shirt basique", 12.0, None, 1, None, "coton", "unisexe", 5),
+        ]
+        for name, price, original_price, category_id, brand_id, material, gender, stock in products:
+            self.db.execute_update(
+                """INSERT INTO products (name, price, original_price, category_id, brand_id,
+                   material, gender, stock_quantity) VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (name, price, original_price, category_id, brand_id, material, gender, stock)
+            )
+        self.parser = RuleBasedQueryParser(self.db)
+    
+    def run_query(self, user_query):
+        result = self.parser.parse(user_query)
+        self.assertIsNotNone(result)
+        rows = self.db.execute_query(result['sql_query'], tuple(result['sql_params']))
+        return sorted(row['name'] for row in rows)
+    
+    def test_key_terms(self):
+        """Tester les termes clés: identiques pour une reformulation, différents pour un autre genre"""
+        terms = self.parser.key_terms("t-shirts homme coton")
+        self.assertEqual(self.parser.key_terms("Montre-moi vos tee-shirts en coton, pour hommes svp"), terms)
+        self.assertNotEqual(self.parser.key_terms("t-shirts femme coton"), terms)
+        self.assertNotEqual(self.parser.key_terms("t-shirts homme sans coton"), terms)
+    
+    def test_vocabulary_reloaded_after_write(self):
+        """Tester la reconnaissance d'une marque ajoutée après le premier appel"""
+        self.parser.refresh_interval = 0
+        self.assertIsNone(self.parser.parse("t-shirts adidas"))
+
+        # Une écriture sans effet sur le vocabulaire (commande) ne provoque pas de rechargement
+        with mock.patch.object(self.parser, "refresh_vocabulary") as refresh:
+            self.db.execute_update("INSERT INTO orders (customer_email, total_amount) VALUES ('a@b.c', 10)")
+            self.db.execute_update("UPDATE products SET stock_quantity = 3 WHERE name = 'T-shirt sport'")
+            self.assertIsNone(self.parser.parse("t-shirts adidas"))
+        refresh.assert_not_called()
+        self.assertIsNone(self.parser._reloader)
+
+        self.db.execute_update("INSERT INTO brands (id, name) VALUES (2, 'Adidas')")
+        self.db.execute_update("UPDATE products SET brand_id = 2 WHERE name = 'T-shirt basique'")
+        # Rechargement lancé en arrière-plan par l'appel suivant
+        self.parser.parse("t-shirts adidas")
+        self.assertIsNotNone(self.parser._reloader)
+        self.parser._reloader.join()
+        self.assertEqual(self.run_query("t-shirts adidas"), ["T-shirt basique"])
+    
+    def test_category_gender_material(self):
+        """Tester la combinaison catégorie (avec sous-catégories), genre et matière"""
+        self.assertEqual(
+            self.run_query("Montre-moi tous les t-shirts pour femme en coton"),
+            ["T-shirt basique", "T-shirt coton"]
+        )
+    
+    def test_price_and_promotion(self):
+        """Tester les seuils de prix et les promotions"""
+        self.assertEqual(self.run_query("Produits de moins de 20 euros"), ["T-shirt basique", "T-shirt coton"])
+        self.assertEqual(self.run_query("Quels sont les produits en promotion?"), ["T-shirt coton"])
+    
+    def test_brand_and_stock(self):
+        """Tester les marques et la disponibilité"""
+        self.assertEqual(self.run_query("Affiche les produits Nike disponibles"), ["T-shirt coton"])
+    
+    def test_fallback_on_unknown_words(self):
+        """Tester le repli vers Gemini pour les requêtes non reconnues"""
+        self.assertIsNone(self.parser.parse("Quelles sont les meilleures ventes?"))
+        self.assertIsNone(self.parser.parse("Bonjour"))
+    
+    def test_fallback_on_conflicting_values(self):
+        """Tester le repli lorsque deux valeurs d'un même attribut sont demandées"""
+        self.assertIsNone(self.parser.parse("t-shirts homme femme"))
+    
+    def test_lenient_parse(self):
+        """Tester la traduction approximative (mots inconnus ignorés, négations refusées)"""
+        self.assertIsNone(self.parser.parse("t-shirts en coton bio équitable"))
+        result = self.parser.parse("t-shirts en coton bio équitable", lenient=True)
+        rows = self.db.execute_query(result['sql_query'], tuple(result['sql_params']))
+        self.assertEqual(sorted(row['name'] for row in rows), ["T-shirt basique", "T-shirt coton"])
+        self.assertIsNone(self.parser.parse("t-shirts pas en coton bio", lenient=True))
+        self.assertIsNone(self.parser.parse("Bonjour", lenient=True))
+    
+    def test_fallback_when_llm_unavailable(self):
+        """Tester la traduction de repli quand le quota du LLM est épuisé"""
+        processor = GeminiNLQProcessor(
+            model=QuotaExceededModel(), scheduler=LLMScheduler(max_retries=1, backoff_base_ms=1)
+        )
+        service = NLQService(db_manager=self.db, nlq_processor=processor)
+        result = service.process_query("t-shirts en coton bio équitable", "template")
+        self.assertTrue(result['success'])
+        self.assertEqual(result['count'], 2)
+        self.assertIn("approximative", result['explanation'])
+        
+        result = service.process_query("meilleures ventes du mois", "template")
+        self.assertFalse(result['success'])
+        self.assertIn("saturé", result['natural_response'])
+
+class TestSQLValidator(unittest.TestCase):
+    """Tests pour la validation des requêtes SQL générées"""
+    
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.validator = SQLValidator.from_database(DatabaseManager(":memory:"))
+    
+    def assertRejected(self, sql_query, reason):
+        with self.assertRaises(SQLValidationError) as context:
+            self.validator.validate(sql_query)
+        self.assertIn(reason, str(context.exception))
+    
+    def test_accepts_keywords_inside_names_and_strings(self):
+        """Tester qu'un mot-clé dans une colonne ou une chaîne n'est pas refusé"""
+        self.validator.validate("SELECT p.name, p.created_at FROM products p WHERE p.name = 'Update Tee';")
+        self.validator.validate(
+            "SELECT b.name, SUM(oi.quantity) total_sold FROM order_items oi "
+            "JOIN products p ON p.id = oi.product_id LEFT JOIN brands b ON b.id = p.brand_id "
+            "GROUP BY b.id ORDER BY total_sold DESC"
+        )
+    
+    def test_rejects_unsafe_statements(self):
+        """Tester le refus des instructions multiples, commentaires et écritures"""
+        self.assertRejected("SELECT * FROM products; DROP TABLE products", "Une seule instruction")
+        self.assertRejected("SELECT * FROM products -- commentaire", "commentaires")
+        self.assertRejected("DELETE FROM products", "SELECT")
+        self.assertRejected("SELECT * FROM sqlite_master", "Table système")
+    
+    def test_schema_whitelist(self):
+        """Tester le refus des tables et colonnes inconnues"""
+        self.assertRejected("SELECT * FROM users", "Table inconnue")
+        self.assertRejected("SELECT p.password FROM products p", "Colonne inconnue")
+        self.assertRejected("SELECT name FROM products WHERE foo = 1", "Colonne inconnue")
+    
+    def test_rejects_cartesian_joins(self):
+        """Tester le refus des jointures sans condition"""
+        self.assertRejected("SELECT * FROM products, brands", "Produit cartésien")
+        self.assertRejected("SELECT * FROM products CROSS JOIN brands", "Produit cartésien")
+        self.assertRejected("SELECT * FROM products JOIN brands", "Produit cartésien")
+        self.validator.validate("SELECT p.name FROM products p, brands b WHERE b.id = p.brand_id")
+    
+    def test_apply_limit(self):
+        """Tester l'ajout et le plafonnement de la clause LIMIT"""
+        self.assertEqual(self.validator.apply_limit("SELECT name FROM products;", 20),
+                         "SELECT name FROM products LIMIT 20")
+        self.assertEqual(self.validator.apply_limit("SELECT name FROM products LIMIT 500 OFFSET 10", 20),
+                         "SELECT name FROM products LIMIT 20 OFFSET 10")
+        self.assertEqual(self.validator.apply_limit("SELECT name FROM products LIMIT 5", 20),
+                         "SELECT name FROM products LIMIT 5")
+        self.assertTrue(self.validator.apply_limit("SELECT name FROM products", 10000).endswith(
+            f"LIMIT {Config.MAX_RESULT_LIMIT}"))
+    
+    def test_pagination_helpers(self):
+        """Tester le retrait du plafond générique, l'analyse de ORDER BY et l'ajout de colonnes"""
+        self.assertEqual(self.validator.remove_limit("SELECT name FROM products LIMIT 50;", 50),
+                         "SELECT name FROM products")
+        self.assertEqual(self.validator.remove_limit("SELECT name FROM products LIMIT 5", 50),
+                         "SELECT name FROM products LIMIT 5")
+        self.assertEqual(self.validator.limit_count("SELECT name FROM products LIMIT 5"), 5)
+        self.assertIsNone(self.validator.limit_count("SELECT name FROM products LIMIT 5 OFFSET 5"))
+        self.assertEqual(self.validator.order_by_terms("SELECT p.name FROM products p ORDER BY p.price DESC, id"),
+                         [("p", "price", True), (None, "id", False)])
+        self.assertIsNone(self.validator.order_by_terms("SELECT name FROM products ORDER BY price * 2"))
+        self.assertIsNone(self.validator.order_by_terms("SELECT name FROM products"))
+        self.assertEqual(
+            self.validator.append_select_columns("SELECT p.name FROM products p ORDER BY p.id", ["p.id AS k"]),
+            "SELECT p.name, p.id AS k FROM products p ORDER BY p.id"
+        )
+        with self.assertRaises(SQLValidationError):
+            self.validator.append_select_columns("SELECT DISTINCT color FROM products", ["id"])
+
+class TestResultSummarizer(unittest.TestCase):
+    """Tests pour le résumé local des résultats"""
+    
+    def test_summary_content(self):
+        """Tester le nombre, la fourchette de prix et les marques"""
+        data = [
+            {"name": "Baskets", "price": 89.99, "brand": "Nike"},
+            {"name": "T-shirt", "price": 15.5, "brand": "Nike"},
+            {"name": "Jean", "price": 49.0, "brand": "Levi's"},
+        ]
+        summary = summarize_results(data)
+        self.assertIn("3 résultat(s)", summary)
+        self.assertIn("15.50 € à 89.99 €", summary)
+        self.assertIn("Nike (2)", summary)
+    
+    def test_empty_results(self):
+        """Tester le résumé d'un résultat vide"""
+        self.assertEqual(summarize_results([]), "Aucun résultat trouvé pour votre recherche.")
+
+class TestTranslationCache(unittest.TestCase):
+    """Tests pour le cache des traductions NL -> SQL"""
+    
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = TranslationCache(os.path.join(self.tmp_dir.name, "cache.db"), max_entries=2, ttl=3600)
+        self.result = {
+            "sql_query": "SELECT * FROM products LIMIT 50",
+            "explanation": "Tous les produits",
+            "filters_applied": [],
+            "confidence": 0.9
+        }
+    
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+    
+    def test_normalize_query(self):
+        """Tester la normalisation des clés"""
+        self.assertEqual(normalize_query("  Robes d'ÉTÉ ? "), "robes d ete")
+        self.assertEqual(normalize_query("T-shirts  homme"), normalize_query("t shirts homme!"))
+    
+    def test_hit_and_miss(self):
+        """Tester les compteurs de succès et d'échecs"""
+        self.assertIsNone(self.cache.get("Tous les produits"))
+        self.cache.set("Tous les produits", self.result)
+        self.assertEqual(self.cache.get("tous les PRODUITS ?"), self.result)
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+    
+    def test_hit_without_write(self):
+        """Tester qu'une lecture ne modifie pas la base (dates d'accès reportées par lot)"""
+        self.cache.set("requete a", self.result)
+        conn = self.cache.get_connection()
+        changes = conn.total_changes
+        for _ in range(3):
+            self.assertIsNotNone(self.cache.get("requete a"))
+        self.assertEqual(conn.total_changes, changes)
+        
+        self.cache.ACCESS_FLUSH_INTERVAL = 0
+        self.cache.get("requete a")
+        self.assertEqual(conn.total_changes, changes + 1)
+    
+    def test_lru_eviction(self):
+        """Tester l'éviction de l'entrée la moins récemment utilisée"""
+        self.cache.set("requete a", self.result)
+        self.cache.set("requete b", self.result)
+        self.cache.get("requete a")
+        self.cache.set("requete c", self.result)
+        self.assertIsNotNone(self.cache.get("requete a"))
+        self.assertIsNone(self.cache.get("requete b"))
+        self.assertEqual(self.cache.stats()["entries"], 2)
+    
+    def test_ttl_expiration(self):
+        """Tester l'expiration des entrées"""
+        cache = TranslationCache(self.cache.db_path, ttl=-1)
+        cache.set("requete", self.result)
+        self.assertIsNone(cache.get("requete"))
+
+class TestFakeGenerativeModel(unittest.TestCase):
+    """Tests pour le LLM simulé utilisé par les benchmarks"""
+    
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.response = {
+            "sql_query": "SELECT p.name FROM products p WHERE p.stock_quantity = 0 LIMIT 50",
+            "explanation": "Produits en rupture",
+            "filters_applied": ["stock = 0"],
+            "confidence": 0.9
+        }
+        self.model = FakeGenerativeModel([{"query": "rupture de stock", "response": self.response}])
+        self.processor = GeminiNLQProcessor(model=self.model)
+    
+    def test_recorded_response(self):
+        """Tester le rejeu d'une réponse enregistrée"""
+        result = self.processor.process_natural_query("Produits en Rupture de stock ?")
+        self.assertNotIn("error", result)
+        self.assertEqual(result["sql_query"], self.response["sql_query"])
+        self.assertEqual(self.model.calls, 1)
+    
+    def test_default_response(self):
+        """Tester la réponse générique et le résumé simulé"""
+        result = asyncio.run(self.processor.process_natural_query_async("requête inconnue"))
+        self.assertNotIn("error", result)
+        self.assertEqual(result["sql_query"], FakeGenerativeModel.DEFAULT_TRANSLATION["sql_query"])
+        summary = self.processor.generate_natural_response({"data": [{"name": "x"}], "count": 1}, "x")
+        self.assertEqual(summary, FakeGenerativeModel.DEFAULT_SUMMARY)
+    
+    def test_latency(self):
+        """Tester la latence simulée"""
+        model = FakeGenerativeModel(latency_ms=50)
+        start = time.perf_counter()
+        model.generate_content('"sql_query"')
+        self.assertGreaterEqual(time.perf_counter() - start, 0.045)
+
+class TestSemanticQueryIndex(unittest.TestCase):
+    """Tests pour la réutilisation des traductions de questions proches"""
+    
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.paths = {"db_path": os.path.join(self.tmp_dir.name, "cache.db"),
+                      "vectors_path": os.path.join(self.tmp_dir.name, "index.f32")}
+        self.index = SemanticQueryIndex(capacity=3, threshold=0.85, **self.paths)
+        self.result = {"sql_query": "SELECT p.name FROM products p", "explanation": "T-shirts",
+                       "filters_applied": [], "confidence": 0.9}
+    
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+    
+    def test_paraphrase_hit(self):
+        """Tester la réutilisation pour une reformulation, y compris après rechargement"""
+        self.index.add("t-shirts homme coton", self.result)
+        hit = self.index.lookup("Montre-moi des tee-shirts en coton pour hommes")
+        self.assertEqual(hit["sql_query"], self.result["sql_query"])
+        self.assertEqual(hit["similar_query"], "t-shirts homme coton")
+        self.assertIsNone(self.index.lookup("pantalons en lin"))
+        
+        reloaded = SemanticQueryIndex(capacity=3, threshold=0.85, **self.paths)
+        self.assertIsNotNone(reloaded.lookup("tee-shirts coton hommes"))
+        self.assertEqual(self.index.stats()["hits"], 1)
+    
+    def test_questions_reloaded_only_after_change(self):
+        """Tester que la liste des questions n'est relue qu'après une modification (autre worker compris)"""
+        self.index.add("robes rouges", self.result)
+        self.assertIsNotNone(self.index.lookup("les robes rouges"))
+        entries = self.index._entries
+        self.assertIsNotNone(self.index.lookup("les robes rouges"))
+        self.assertIs(self.index._entries, entries)
+        
+        other_worker = SemanticQueryIndex(capacity=3, threshold=0.85, **self.paths)
+        other_worker.add("pulls en laine", self.result)
+        self.assertIsNotNone(self.index.lookup("des pulls en laine"))
+        self.assertIsNot(self.index._entries, entries)
+    
+    def test_key_terms_must_match(self):
+        """Tester le refus d'une question proche dont les nombres ou négations diffèrent"""
+        self.index.add("robes à moins de 50 euros", self.result)
+        self.assertIsNotNone(self.index.lookup("robes moins de 50 euros"))
+        self.assertIsNone(self.index.lookup("robes à moins de 30 euros"))
+        self.assertIsNone(self.index.lookup("robes pas à moins de 50 euros"))
+    
+    def test_capacity(self):
+        """Tester le remplacement de la question la plus ancienne"""
+        for question in ("robes rouges", "pulls en laine", "jeans slim", "vestes en cuir"):
+            self.index.add(question, self.result)
+        self.assertEqual(self.index.stats()["entries"], 3)
+        self.assertIsNone(self.index.lookup("robe rouge"))
+        self.assertIsNotNone(self.index.lookup("veste cuir"))
+    
+    def test_processor_skips_llm(self):
+        """Tester qu'une reformulation ne déclenche pas de nouvel appel au LLM"""
+        model = FakeGenerativeModel()
+        processor = GeminiNLQProcessor(model=model, semantic_index=self.index)
+        processor.process_natural_query("pulls en laine pour l'hiver")
+        result = processor.process_natural_query("pull laine hiver")
+        self.assertNotIn("error", result)
+        self.assertEqual(model.calls, 1)
+
+class TestDatabaseStats(unittest.TestCase):
+    """Tests pour les statistiques mises en cache par version des données"""
+    
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp_dir.name, "test.db"))
+        self.db.execute_update("INSERT INTO categories (id, name) VALUES (1, 'Robes')")
+        self.db.execute_update("INSERT INTO brands (id, name) VALUES (1, 'Zara')")
+        self.db.execute_update(
+            """INSERT INTO products (name, price, category_id, brand_id, stock_quantity, is_active)
+               VALUES ('Robe', 40, 1, 1, 3, 1), ('Robe épuisée', 60, 1, 1, 0, 1), ('Ancienne', 10, 1, 1, 5, 0)"""
+        )
+        self.stats = DatabaseStats(self.db, refresh_interval=0)
+    
+    def tearDown(self):
+        self.db.close()
+        self.tmp_dir.cleanup()
+    
+    def test_summary_tables_follow_writes(self):
+        """Tester que les tables de synthèse suivent insertions, mises à jour et suppressions"""
+        self.db.execute_update("INSERT INTO brands (id, name) VALUES (2, 'Gap')")
+        self.db.execute_update(
+            "INSERT INTO products (name, price, category_id, stock_quantity) VALUES ('Sans marque', 5, 1, 2)"
+        )
+        self.db.execute_update("UPDATE products SET brand_id = 2, stock_quantity = 0 WHERE name = 'Robe'")
+        self.db.execute_update("DELETE FROM products WHERE name = 'Ancienne'")
+        self.db.execute_update(
+            "INSERT INTO orders (customer_email, total_amount, status) VALUES ('a@b.c', 10, 'livré')"
+        )
+        self.db.execute_update("UPDATE orders SET status = 'annulé'")
+
+        stats = self.stats.get()
+        self.assertEqual(stats['products'], 3)
+        self.assertEqual(stats['stock'], {"units": 2, "out_of_stock": 2, "value": 10.0})
+        self.assertEqual({entry['name']: entry['products'] for entry in stats['by_brand']},
+                         {"Zara": 1, "Gap": 1, None: 1})
+        self.assertEqual(stats['orders_by_status'], {"annulé": 1})
+        self.assertEqual(stats['orders'], 1)
+
+    def test_stale_snapshot_during_refresh(self):
+        """Tester que les statistiques précédentes sont servies pendant un recalcul"""
+        previous = self.stats.get()
+        self.db.execute_update("UPDATE products SET is_active = 1")
+        with self.stats._lock:
+            # Un autre thread détient le verrou de recalcul
+            self.assertIs(self.stats.get(), previous)
+        self.assertEqual(self.stats.get()['active_products'], 3)
+    
+    def test_aggregates(self):
+        """Tester les compteurs, le stock et la répartition par catégorie"""
+        stats = self.stats.get()
+        self.assertEqual(stats['active_products'], 2)
+        self.assertEqual(stats['stock'], {"units": 3, "out_of_stock": 1, "value": 120.0})
+        self.assertEqual(stats['by_category'][0]['name'], "Robes")
+        self.assertEqual(stats['by_brand'][0]['products'], 3)
+    
+    def test_cached_until_write(self):
+        """Tester que les agrégats ne sont recalculés qu'après une écriture"""
+        self.stats.get()
+        self.stats.get()
+        self.assertEqual(self.stats.refreshes, 1)
+        
+        self.db.execute_update("UPDATE products SET is_active = 1")
+        self.assertEqual(self.stats.get()['active_products'], 3)
+        self.assertEqual(self.stats.refreshes, 2)
+    
+    def test_external_write_invalidates(self):
+        """Tester la détection des écritures faites par une autre connexion"""
+        self.stats.get()
+        conn = sqlite3.connect(self.db.db_path)
+        with conn:
+            conn.execute("INSERT INTO brands (name) VALUES ('Gap')")
+        conn.close()
+        self.assertEqual(self.stats.get()['brands'], 2)
+
+class TestPromptBuilder(unittest.TestCase):
+    """Tests pour le contexte de schéma et les lignes envoyés à Gemini"""
+    
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp_dir.name, "test.db"))
+        self.db.execute_update("INSERT INTO categories (id, name) VALUES (1, 'Robes de soirée')")
+        self.db.execute_update("INSERT INTO brands (id, name) VALUES (1, 'Zara')")
+        self.builder = PromptBuilder(self.db)
+    
+    def tearDown(self):
+        self.db.close()
+        self.tmp_dir.cleanup()
+    
+    def test_relevant_tables(self):
+        """Tester la sélection des tables par mot-clé et par nom de catégorie ou de marque"""
+        self.assertEqual(self.builder.relevant_tables("pulls en laine"), ["products"])
+        self.assertEqual(self.builder.relevant_tables("robe zara"), ["categories", "brands", "products"])
+        self.assertIn("order_items", self.builder.relevant_tables("les articles les plus vendus"))
+        prompt = self.builder.query_prompt("robe zara")
+        self.assertIn("brand_id->brands.id", prompt)
+        self.assertIn("gender: homme|femme|enfant|unisexe", prompt)
+        self.assertNotIn("orders(", prompt)
+    
+    def test_schema_refresh(self):
+        """Tester que le contexte n'est recalculé qu'après un changement de schéma"""
+        self.builder.query_prompt("robes")
+        self.builder.query_prompt("robes")
+        self.assertEqual(self.builder.refreshes, 1)
+        self.db.execute_update("ALTER TABLE products ADD COLUMN pattern TEXT")
+        self.assertIn("pattern", self.builder.query_prompt("robes"))
+        self.assertEqual(self.builder.refreshes, 2)
+    
+    def test_compact_rows(self):
+        """Tester la projection des lignes envoyées pour le résumé"""
+        rows = [{"id": i, "brand_id": 1, "name": "Robe", "description": "x" * 200, "price": 40} for i in range(8)]
+        columns, values = PromptBuilder.compact_rows(rows)
+        self.assertEqual(columns, ["name", "price", "description"])
+        self.assertEqual(len(values), PromptBuilder.SUMMARY_ROWS)
+        self.assertEqual(len(values[0][2]), PromptBuilder.SUMMARY_MAX_CHARS)
+
+class TestQueryCostGuard(unittest.TestCase):
+    """Tests pour le budget d'exécution des requêtes"""
+    
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp_dir.name, "test.db"))
+        with self.db.write_connection() as conn:
+            conn.execute("INSERT INTO categories (id, name) VALUES (1, 'Robes')")
+            conn.execute("INSERT INTO brands (id, name) VALUES (1, 'Zara')")
+            conn.executemany(
+                "INSERT INTO products (name, price, category_id, brand_id, stock_quantity) VALUES (?, ?, 1, 1, ?)",
+                [(f"Produit {i}", i, i % 7) for i in range(1, 51)]
+            )
+        self.guard = QueryCostGuard(self.db, SQLValidator.from_database(self.db), large_table_rows=20)
+    
+    def tearDown(self):
+        self.db.close()
+        self.tmp_dir.cleanup()
+    
+    def test_timeout_interrupts_query(self):
+        """Tester l'interruption d'une requête qui dépasse son budget"""
+        start = time.perf_counter()
+        with self.assertRaises(QueryTooExpensiveError):
+            self.db.execute_query(
+                "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM c",
+                timeout_ms=20
+            )
+        self.assertLess(time.perf_counter() - start, 2)
+        # La connexion rendue au pool reste utilisable, sans délai
+        self.assertEqual(len(self.db.execute_query("SELECT id FROM products")), 50)
+    
+    def test_plan_check(self):
+        """Tester le refus des parcours complets répétés d'une grande table"""
+        self.guard.check("SELECT p.name FROM products p WHERE p.id = 3")
+        self.guard.check("SELECT p.name FROM products p ORDER BY p.price DESC LIMIT 10")
+        with self.assertRaises(QueryTooExpensiveError):
+            self.guard.check(
+                "SELECT p.name, (SELECT COUNT(*) FROM products o WHERE o.price > p.price) AS rang "
+                "FROM products p LIMIT 10"
+            )
+        self.assertEqual(self.guard.rejections, 1)
+    
+    def test_plan_checked_only_on_cache_miss(self):
+        """Tester qu'un résultat servi par le cache ne relance pas la vérification du plan"""
+        service = NLQService(db_manager=self.db, nlq_processor=SlowAsyncProcessor(0))
+        nlq_result = {"sql_query": "SELECT p.name FROM products p WHERE p.price > 45"}
+        with mock.patch.object(service.cost_guard, "check", wraps=service.cost_guard.check) as check:
+            first = service._execute_sql(nlq_result)
+            self.assertEqual(service._execute_sql(nlq_result), first)
+        self.assertEqual(check.call_count, 1)
+
+class TestResultCache(unittest.TestCase):
+    """Tests pour le cache des résultats SQL"""
+    
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp_dir.name, "test.db"))
+        self.db.execute_update("INSERT INTO brands (name) VALUES ('Zara')")
+    
+    def tearDown(self):
+        self.db.close()
+        self.tmp_dir.cleanup()
+    
+    def test_hit_until_write(self):
+        """Tester le succès du cache jusqu'à la prochaine écriture"""
+        cache = self.db.result_cache
+        self.assertEqual(self.db.execute_query("SELECT name FROM brands"), [{"name": "Zara"}])
+        rows = self.db.execute_query("SELECT  name\n FROM brands")
+        self.assertEqual(rows, [{"name": "Zara"}])
+        self.assertEqual(cache.hits, 1)
+        rows[0]["name"] = "modifié"
+        self.assertEqual(self.db.execute_query("SELECT name FROM brands"), [{"name": "Zara"}])
+        
+        self.db.execute_update("INSERT INTO brands (name) VALUES ('Gap')")
+        self.assertEqual(len(self.db.execute_query("SELECT name FROM brands")), 2)
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(cache.invalidations, 1)
+    
+    def test_external_write(self):
+        """Tester l'invalidation par une écriture d'une autre connexion"""
+        self.db.execute_query("SELECT name FROM brands")
+        conn = sqlite3.connect(self.db.db_path)
+        with conn:
+            conn.execute("INSERT INTO brands (name) VALUES ('Gap')")
+        conn.close()
+        self.assertEqual(len(self.db.execute_query("SELECT name FROM brands")), 2)
+    
+    def test_memory_bound(self):
+        """Tester l'éviction LRU au-delà de la taille maximale"""
+        cache = ResultCache(max_bytes=4000, max_entry_bytes=4000)
+        for i in range(20):
+            cache.set(ResultCache.key(f"SELECT {i}"), 1, ("value",), [("x" * 100,)])
+        self.assertLessEqual(cache.bytes, 4000)
+        self.assertGreater(cache.evictions, 0)
+        self.assertIsNotNone(cache.get(ResultCache.key("SELECT 19"), 1))
+        self.assertIsNone(cache.get(ResultCache.key("SELECT 0"), 1))
+        self.assertEqual(normalize_sql("SELECT  'a  b'\n FROM t;"), "SELECT 'a  b' FROM t")
+        self.assertFalse(ResultCache.cacheable("SELECT name FROM products ORDER BY RANDOM()"))
+    
+    def test_shared_between_workers(self):
+        """Tester le partage des résultats entre deux gestionnaires (workers) et leur invalidation"""
+        cache_path = os.path.join(self.tmp_dir.name, "cache.db")
+        other = DatabaseManager(self.db.db_path)
+        try:
+            for db in (self.db, other):
+                db.shared_result_cache = SharedResultCache(db.db_path, db_path=cache_path)
+            query = "SELECT name FROM brands ORDER BY name"
+            self.assertEqual(self.db.execute_query(query), [{"name": "Zara"}])
+            self.assertEqual(other.execute_query(query), [{"name": "Zara"}])
+            self.assertEqual(other.shared_result_cache.hits, 1)
+            
+            # Écriture d'un worker: la requête n'est réexécutée qu'une fois pour tous les workers
+            generation = self.db.generation("writes")
+            self.db.execute_update("INSERT INTO brands (name) VALUES ('Gap')")
+            self.assertEqual(self.db.generation("writes"), generation + 1)
+            self.assertEqual(len(other.execute_query(query)), 2)
+            self.assertEqual(other.shared_result_cache.hits, 1)
+            self.assertEqual(len(self.db.execute_query(query)), 2)
+            self.assertEqual(self.db.shared_result_cache.hits, 1)
+            
+            # Démarrage d'un worker: les résultats partagés restent valides
+            restarted = DatabaseManager(self.db.db_path)
+            try:
+                restarted.shared_result_cache = SharedResultCache(restarted.db_path, db_path=cache_path)
+                self.assertEqual(len(restarted.execute_query(query)), 2)
+                self.assertEqual(restarted.shared_result_cache.hits, 1)
+                self.assertEqual(self.db.generation("writes"), generation + 1)
+            finally:
+                restarted.close()
+        finally:
+            other.close()
+
+class TestColumnarResult(unittest.TestCase):
+    """Tests pour les résultats au format colonnes"""
+    
+    def test_numeric_columns(self):
+        """Tester les tableaux NumPy des colonnes numériques et la conversion en JSON"""
+        result = ColumnarResult.from_rows(
+            ("name", "price", "stock_quantity", "color"),
+            [("Robe", 40.0, 3, "rouge"), ("Jean", 59, 0, None)]
+        )
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result.data["price"].dtype.kind, "f")
+        self.assertEqual(result.data["stock_quantity"].dtype.kind, "i")
+        self.assertIsInstance(result.data["color"], list)
+        self.assertEqual(result.to_json()["stock_quantity"], [3, 0])
+        self.assertEqual(result.rows(1), [{"name": "Robe", "price": 40.0, "stock_quantity": 3, "color": "rouge"}])
+        self.assertIs(type(result.rows()[1]["stock_quantity"]), int)
+    
+    def test_from_database(self):
+        """Tester l'exécution d'une requête au format colonnes"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = DatabaseManager(os.path.join(tmp_dir, "test.db"))
+            db.execute_update("INSERT INTO brands (name, country) VALUES ('Zara', 'Espagne'), ('Gap', NULL)")
+            result = db.execute_query_columnar("SELECT id, name, country FROM brands ORDER BY id")
+            self.assertEqual(result.columns, ["id", "name", "country"])
+            self.assertEqual(result.to_json(), {"id": [1, 2], "name": ["Zara", "Gap"], "country": ["Espagne", None]})
+            empty = db.execute_query_columnar("SELECT id FROM brands WHERE id < 0")
+            self.assertEqual((len(empty), empty.to_json()), (0, {"id": []}))
+            db.close()
+
+class TestSerialization(unittest.TestCase):
+    """Tests pour la sérialisation rapide et la compression des réponses"""
+    
+    def test_dumps_special_types(self):
+        """Tester les décimaux, dates et tableaux NumPy"""
+        result = ColumnarResult.from_rows(("price",), [(19.5,), (7,)])
+        body = dumps({
+            "price": decimal.Decimal("12.50"),
+            "date": datetime.date(2024, 5, 1),
+            "data": result.data,
+            "name": "été"
+        })
+        self.assertEqual(json.loads(body), {
+            "price": 12.5, "date": "2024-05-01", "data": {"price": [19.5, 7.0]}, "name": "été"
+        })
+    
+    def test_compression_negotiation(self):
+        """Tester la compression au-delà du seuil selon Accept-Encoding"""
+        self.assertEqual(accepted_encodings("gzip;q=0, deflate, BR;q=0.5"), {"deflate", "br"})
+        small = dumps({"data": []})
+        self.assertEqual(compress(small, "gzip"), (small, None))
+        
+        large = dumps({"data": [{"name": f"Produit {i}", "price": i} for i in range(500)]})
+        self.assertEqual(compress(large, "identity"), (large, None))
+        response = json_response(json.loads(large), "gzip")
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.body), large)
+
+class TestSingleFlight(unittest.TestCase):
+    """Tests pour la déduplication des traitements concurrents"""
+    
+    def test_concurrent_calls_share_result(self):
+        """Tester qu'un seul thread exécute le traitement, les autres l'attendent"""
+        flight, calls = SingleFlight(), []
+        
+        def work():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"value": 42}
+        
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda _: flight.do("clé", work), range(4)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"value": 42}] * 4)
+        self.assertEqual(flight.shared, 3)
+    
+    def test_error_is_shared(self):
+        """Tester la propagation de l'exception et la libération de la clé"""
+        flight = SingleFlight()
+        with self.assertRaises(ValueError):
+            flight.do("clé", lambda: int("x"))
+        self.assertEqual(flight.do("clé", lambda: 1), 1)
+
+class TestLLMScheduler(unittest.TestCase):
+    """Tests pour l'ordonnancement des appels au LLM"""
+    
+    def test_retry_transient_errors(self):
+        """Tester la reprise des erreurs 429 et la propagation des autres erreurs"""
+        scheduler = LLMScheduler(max_retries=3, backoff_base_ms=1, seed=0)
+        attempts = []
+        
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise QuotaError("Quota exceeded")
+            return "ok"
+        
+        self.assertEqual(scheduler.call(flaky), "ok")
+        self.assertEqual(len(attempts), 3)
+        with self.assertRaises(ValueError):
+            scheduler.call(lambda: (_ for _ in ()).throw(ValueError("requête invalide")))
+        self.assertEqual(scheduler.breaker.state, "closed")
+    
+    def test_adaptive_rate(self):
+        """Tester la réduction du débit après un 429 (Retry-After respecté) puis sa remontée"""
+        scheduler = LLMScheduler(requests_per_minute=600, max_retries=2, backoff_base_ms=1, seed=0)
+        attempts = []
+        
+        def throttled():
+            attempts.append(1)
+            if len(attempts) == 1:
+                error = QuotaError("Quota exceeded")
+                error.retry_after = 0.1
+                raise error
+            return "ok"
+        
+        start = time.perf_counter()
+        self.assertEqual(scheduler.call(throttled), "ok")
+        self.assertGreaterEqual(time.perf_counter() - start, 0.09)
+        self.assertAlmostEqual(scheduler.stats()["rate_per_minute"], 330)
+        for _ in range(20):
+            scheduler.call(lambda: "ok")
+        self.assertEqual(scheduler.stats()["rate_per_minute"], 600)
+        
+        # Erreur serveur (503): reprise sans réduction du débit
+        def unavailable_once():
+            attempts.append(1)
+            if len(attempts) == 1:
+                error = QuotaError("Service unavailable")
+                error.code = 503
+                raise error
+            return "ok"
+        
+        attempts.clear()
+        self.assertEqual(scheduler.call(unavailable_once), "ok")
+        self.assertEqual(scheduler.stats()["rate_per_minute"], 600)
+    
+    def test_circuit_breaker(self):
+        """Tester l'ouverture du disjoncteur puis le refus immédiat des appels"""
+        scheduler = LLMScheduler(max_retries=0, failure_threshold=2, reset_timeout=60)
+        model = QuotaExceededModel()
+        for _ in range(2):
+            with self.assertRaises(LLMUnavailableError):
+                scheduler.call(lambda: model.generate_content("prompt"))
+        self.assertEqual(scheduler.breaker.state, "open")
+        with self.assertRaises(LLMUnavailableError):
+            scheduler.call(lambda: model.generate_content("prompt"))
+        self.assertEqual(model.calls, 2)
+        
+        scheduler.breaker.reset_timeout = 0
+        self.assertEqual(scheduler.call(lambda: "ok"), "ok")
+        self.assertEqual(scheduler.breaker.state, "closed")
+    
+    def test_priority_and_concurrency(self):
+        """Tester le passage des requêtes interactives avant les lots quand la concurrence est bornée"""
+        scheduler = LLMScheduler(max_concurrency=1, queue_timeout=5)
+        
+        async def scenario():
+            order = []
+            release = asyncio.Event()
+            
+            async def record(name):
+                order.append(name)
+            
+            holder = asyncio.create_task(scheduler.call_async(release.wait))
+            await asyncio.sleep(0.01)
+            batch = asyncio.create_task(scheduler.call_async(lambda: record("batch"), BATCH))
+            await asyncio.sleep(0.01)
+            interactive = asyncio.create_task(scheduler.call_async(lambda: record("interactive"), INTERACTIVE))
+            await asyncio.sleep(0.01)
+            self.assertEqual(scheduler.stats()["waiting"], 2)
+            self.assertFalse(scheduler.has_capacity())
+            release.set()
+            await asyncio.gather(holder, batch, interactive)
+            return order
+        
+        self.assertEqual(asyncio.run(scenario()), ["interactive", "batch"])
+        self.assertEqual(scheduler.stats()["in_flight"], 0)
+        self.assertTrue(scheduler.has_capacity())
+        
+        # Place occupée au-delà du délai d'attente: appel refusé
+        scheduler.queue_timeout = 0.05
+        self.assertTrue(scheduler.slots.acquire(INTERACTIVE, None))
+        with self.assertRaises(LLMUnavailableError):
+            scheduler.call(lambda: "ok")
+        scheduler.slots.release()
+
+    def test_deadlines(self):
+        """Tester l'abandon d'une traduction ou d'un résumé trop lent"""
+        scheduler = LLMScheduler(max_concurrency=1)
+        processor = GeminiNLQProcessor(model=FakeGenerativeModel(latency_ms=300), scheduler=scheduler)
+        with mock.patch.object(Config, "LLM_TRANSLATION_TIMEOUT_MS", 50), \
+                mock.patch.object(Config, "LLM_SUMMARY_TIMEOUT_MS", 50):
+            start = time.perf_counter()
+            self.assertTrue(processor.process_natural_query("robes rouges")["llm_unavailable"])
+            self.assertTrue(asyncio.run(processor.process_natural_query_async("robes rouges"))["llm_unavailable"])
+            query_result = {"data": [{"name": "Robe"}], "count": 1}
+            self.assertEqual(processor.generate_natural_response(query_result, "robes"),
+                             processor._fallback_response(1))
+            self.assertEqual(asyncio.run(processor.generate_natural_response_async(query_result, "robes")),
+                             processor._fallback_response(1))
+            self.assertLess(time.perf_counter() - start, 1.0)
+        # Appels interrompus par le client: aucune place de l'ordonnanceur n'est retenue
+        self.assertEqual(scheduler.stats()["in_flight"], 0)
+        self.assertEqual(scheduler.breaker.state, "closed")
+        self.assertNotIn("error", processor.process_natural_query("robes rouges"))
+    
+    def test_hedged_translation(self):
+        """Tester le doublement d'une traduction plus lente que le p95 observé"""
+        window = LatencyWindow(size=10)
+        self.assertIsNone(window.percentile(95, min_samples=5))
+        for seconds in range(1, 21):
+            window.add(seconds / 100)
+        self.assertAlmostEqual(window.percentile(50), 0.16)
+        
+        model = SlowFirstCallModel(first_latency=2.0)
+        processor = GeminiNLQProcessor(model=model)
+        for _ in range(20):
+            processor.translation_latency.add(0.01)
+        won = LLM_HEDGES._values.get(("won",), 0)
+        with mock.patch.object(Config, "LLM_HEDGING_ENABLED", True), \
+                mock.patch.object(Config, "LLM_HEDGE_MIN_DELAY_MS", 20):
+            start = time.perf_counter()
+            result = asyncio.run(processor.process_natural_query_async("requête inconnue"))
+            elapsed = time.perf_counter() - start
+        self.assertNotIn("error", result)
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(model.async_calls, 2)
+        self.assertEqual(LLM_HEDGES._values.get(("won",), 0), won + 1)
+        # Seule la durée de l'appel abouti est enregistrée (pas celle de l'appel annulé)
+        self.assertEqual(len(processor.translation_latency._durations), 21)
+        
+        # Ordonnanceur sans capacité disponible: pas de doublon
+        model = SlowFirstCallModel(first_latency=0.2)
+        processor = GeminiNLQProcessor(model=model, scheduler=LLMScheduler())
+        for _ in range(20):
+            processor.translation_latency.add(0.01)
+        with mock.patch.object(Config, "LLM_HEDGING_ENABLED", True), \
+                mock.patch.object(Config, "LLM_HEDGE_MIN_DELAY_MS", 20), \
+                mock.patch.object(processor.scheduler, "has_capacity", return_value=False):
+            result = asyncio.run(processor.process_natural_query_async("requête inconnue"))
+        self.assertNotIn("error", result)
+        self.assertEqual(model.async_calls, 1)
+
+class TestResultPager(unittest.TestCase):
+    """Tests pour la pagination des résultats conservés"""
+    
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp_dir.name, "test.db"))
+        with self.db.write_connection() as conn:
+            conn.execute("INSERT INTO categories (id, name) VALUES (1, 'Robes')")
+            conn.execute("INSERT INTO brands (id, name) VALUES (1, 'Zara')")
+            conn.executemany(
+                "INSERT INTO products (name, price, original_price, category_id, brand_id) VALUES (?, ?, ?, 1, 1)",
+                [(f"Produit {i}", i % 5, i % 4 if i % 9 else None) for i in range(1, 31)]
+            )
+        self.pager = ResultPager(self.db, SQLValidator.from_database(self.db))
+    
+    def tearDown(self):
+        self.db.close()
+        self.tmp_dir.cleanup()
+    
+    def read_all(self, sql_query, size):
+        """Lire toutes les pages d'une requête à partir du début"""
+        state = self.pager.plan(sql_query)
+        position, pages = {"o": 0}, []
+        while True:
+            page_sql, params = self.pager.page_query(state, position, size)
+            rows, cursor = self.pager.finish_page(state, position, self.db.execute_query(page_sql, params), size)
+            pages.append(rows)
+            if cursor is None:
+                return state, pages
+            position = decode_cursor(cursor)
+    
+    def test_keyset_pages(self):
+        """Tester la lecture par clé: mêmes lignes, même ordre que la requête complète (valeurs NULL comprises)"""
+        sql_query = ("SELECT p.id, p.name, p.original_price, b.name AS brand FROM products p "
+                     "LEFT JOIN brands b ON b.id = p.brand_id ORDER BY p.original_price DESC, p.price, p.id LIMIT 50")
+        state, pages = self.read_all(sql_query, 7)
+        self.assertIsNotNone(state['keyed_sql'])
+        self.assertEqual([len(page) for page in pages], [7, 7, 7, 7, 2])
+        self.assertEqual([row for page in pages for row in page],
+                         self.db.execute_query(self.pager.sql_validator.remove_limit(sql_query, 50)))
+        self.assertNotIn("_page_key_0", pages[0][0])
+    
+    def test_offset_fallback(self):
+        """Tester la lecture par décalage sans clé de tri unique, et la limite explicite conservée"""
+        state, pages = self.read_all("SELECT p.name, p.price FROM products p ORDER BY p.price", 8)
+        self.assertIsNone(state['keyed_sql'])
+        self.assertEqual(sum(len(page) for page in pages), 30)
+        
+        state, pages = self.read_all("SELECT p.id FROM products p ORDER BY p.id LIMIT 12", 5)
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        
+        with self.assertRaises(InvalidCursorError):
+            decode_cursor("pas un curseur")
+    
+    def test_service_pages(self):
+        """Tester les pages suivantes servies sans nouvelle traduction"""
+        processor = SlowAsyncProcessor(0, "SELECT p.id, p.name FROM products p ORDER BY p.id LIMIT 50")
+        service = AsyncNLQService(db_manager=self.db, nlq_processor=processor)
+        service.rule_parser = None
+        try:
+            # Sans pagination demandée: rien n'est conservé
+            result = asyncio.run(service.process_query_async("Tous les produits", "template", limit=10))
+            self.assertIsNone(result['result_id'])
+            self.assertIsNone(result['next_cursor'])
+            
+            result = asyncio.run(service.process_query_async("Tous les produits", "template", limit=10,
+                                                             paginate=True))
+            self.assertNotIn("keyed_sql", service.result_store.get(result['result_id'])['pagination'])
+            ids = [row['id'] for row in result['data']]
+            calls = processor.calls
+            cursor = result['next_cursor']
+            while cursor is not None:
+                page = asyncio.run(service.get_page_async(result['result_id'], cursor, limit=10))
+                self.assertTrue(page["success"])
+                ids += [row['id'] for row in page['data']]
+                cursor = page['next_cursor']
+            self.assertEqual(ids, list(range(1, 31)))
+            self.assertEqual(processor.calls, calls)
+            self.assertIsNotNone(service.result_store.get(result['result_id'])['pagination']['keyed_sql'])
+            
+            self.assertIsNone(asyncio.run(service.get_page_async("inconnu")))
+            with self.assertRaises(InvalidCursorError):
+                asyncio.run(service.get_page_async(result['result_id'], "!!"))
+        finally:
+            service.close()
+    
+    def test_service_pages_past_llm_limit(self):
+        """Tester qu'une limite ajoutée par le LLM ne borne pas les pages, contrairement à une limite demandée"""
+        def page_ids(user_query):
+            processor = SlowAsyncProcessor(0, "SELECT p.id FROM products p ORDER BY p.id LIMIT 20")
+            service = AsyncNLQService(db_manager=self.db, nlq_processor=processor)
+            service.rule_parser = None
+            try:
+                result = asyncio.run(service.process_query_async(user_query, "template", limit=10, paginate=True))
+                ids = [row['id'] for row in result['data']]
+                cursor = result['next_cursor']
+                while cursor is not None:
+                    page = asyncio.run(service.get_page_async(result['result_id'], cursor, limit=10))
+                    ids += [row['id'] for row in page['data']]
+                    cursor = page['next_cursor']
+                return ids
+            finally:
+                service.close()
+        
+        self.assertEqual(page_ids("Tous les produits"), list(range(1, 31)))
+        self.assertEqual(page_ids("Les 20 premiers produits"), list(range(1, 21)))
+
+class TestAPIEndpoints(unittest.TestCase):
+    """Tests des endpoints appelés directement (enveloppes de réponse validées par les modèles)"""
+    
+    def setUp(self):
+        """Configuration avant chaque test"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp_dir.name, "test.db"))
+        self.db.execute_update("INSERT INTO categories (name) VALUES (?)", ("Robes",))
+        self.service = AsyncNLQService(db_manager=self.db, nlq_processor=SlowAsyncProcessor(0))
+        patch = mock.patch.object(main, "nlq_service", self.service)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.request = Request({"type": "http", "headers": []})
+    
+    def tearDown(self):
+        self.service.close()
+        self.db.close()
+        self.tmp_dir.cleanup()
+    
+    def call(self, endpoint, body):
+        response = asyncio.run(endpoint(body, self.request))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.body)
+    
+    def test_batch_with_failing_item(self):
+        """Tester un lot dont un élément échoue: réponse 200, erreur portée par l'élément"""
+        content = self.call(main.process_batch, main.BatchQueryRequest(
+            queries=["", "toutes les catégories"], summary_mode="template"
+        ))
+        self.assertEqual(content["failed"], 1)
+        failed, succeeded = content["results"]
+        self.assertFalse(failed["success"])
+        self.assertEqual(failed["count"], 0)
+        self.assertTrue(succeeded["success"])
+        self.assertEqual(succeeded["data"], [{"name": "Robes"}])
+    
+    def test_query_errors(self):
+        """Tester /query avec une requête vide ou une traduction refusée: réponse d'échec, pas d'erreur 500"""
+        content = self.call(main.process_query, main.QueryRequest(query=""))
+        self.assertFalse(content["success"])
+        self.assertEqual(content["count"], 0)
+        
+        processor = GeminiNLQProcessor(model=FakeGenerativeModel([{
+            "query": "supprime les robes",
+            "response": {"sql_query": "DELETE FROM categories", "explanation": "", "confidence": 0.9}
+        }]))
+        with mock.patch.object(self.service, "nlq_processor", processor):
+            content = self.call(main.process_query, main.QueryRequest(query="supprime les robes"))
+        self.assertFalse(content["success"])
+        self.assertEqual(content["data"], [])
+        self.assertIn("reformuler", content["natural_response"])
+
+class TestMetrics(unittest.TestCase):
+    """Tests pour les histogrammes et l'export Prometheus"""
+    
+    def test_histogram_render(self):
+        """Tester les bornes cumulées, la somme et le nombre d'observations"""
+        registry = MetricsRegistry()
+        histogram = registry.histogram("test_duration_seconds", "Durée", buckets=(0.1, 1.0), labels=("stage",))
+        for value in (0.05, 0.5, 2.0):
+            histogram.observe(value, stage="sql")
+        
+        lines = registry.render().splitlines()
+        self.assertIn('test_duration_seconds_bucket{stage="sql",le="0.1"} 1', lines)
+        self.assertIn('test_duration_seconds_bucket{stage="sql",le="1"} 2', lines)
+        self.assertIn('test_duration_seconds_bucket{stage="sql",le="+Inf"} 3', lines)
+        self.assertIn('test_duration_seconds_sum{stage="sql"} 2.55', lines)
+        self.assertIn('test_duration_seconds_count{stage="sql"} 3', lines)
+    
+    def test_request_timings(self):
+        """Tester que les étapes ne sont collectées que pendant une requête suivie"""
+        with stage("hors_requete"):
+            pass
+        with track_request() as timings:
+            with stage("etape"):
+                pass
+            with stage("etape"):
+                pass
+        self.assertEqual(list(timings), ["etape"])
+
 if __name__ == "__main__":
     unittest.main()